@@ -1,3 +1,109 @@
 from django.test import TestCase
 
 # Create your tests here.
+import json
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from userdetails.models import User, UserProfile
+from dashboard.models import Booking, CallRequest
+
+
+class BookingPaymentDetailsAPIViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(phone_number='+919000000001', password='password123')
+        self.user = User.objects.create_user(phone_number='+919000000002', password='password123')
+        counsellor_user = User.objects.create_user(phone_number='+919000000003', password='password123')
+        self.counsellor = UserProfile.objects.create(user=counsellor_user, user_role='counsellor', name='Asha')
+        self.bookings = [
+            Booking.objects.create(
+                user=self.user, counsellor=self.counsellor, order_id=f'order_{i}',
+                amount=100, status='completed' if i % 2 else 'pending'
+            )
+            for i in range(5)
+        ]
+        CallRequest.objects.create(booking=self.bookings[0], user=self.user, counsellor=self.counsellor)
+        self.url = reverse('booking-payment-details')
+        self.client.force_authenticate(self.admin)
+
+    def test_pages_follow_cursor_without_overlap(self):
+        response = self.client.get(self.url, {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        seen = [row['booking_id'] for row in response.data['data']]
+        while response.data['next_cursor']:
+            response = self.client.get(self.url, {'page_size': 2, 'cursor': response.data['next_cursor']})
+            seen.extend(row['booking_id'] for row in response.data['data'])
+
+        self.assertEqual(seen, [b.id for b in reversed(self.bookings)])
+
+    def test_filters_by_status(self):
+        response = self.client.get(self.url, {'status': 'completed'})
+        self.assertEqual({row['status'] for row in response.data['data']}, {'completed'})
+        self.assertEqual(len(response.data['data']), 2)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_ndjson_export_streams_every_row(self):
+        response = self.client.get(self.url, {'export': 'ndjson'})
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(len(rows[-1]['call_requests']), 1)
+        self.assertEqual(rows[0]['user'], {'id': self.user.id, 'phone_number': '+919000000002', 'email': None})
+
+    def test_non_integer_counsellor_is_rejected(self):
+        for params in ({'counsellor': 'abc'}, {'counsellor': 'abc', 'export': 'csv'}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {'counsellor': self.counsellor.id})
+        self.assertEqual(len(response.data['data']), 5)
+
+
+class CallRequestDetailsAPIViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(phone_number='+919000000001', password='password123')
+        self.user = User.objects.create_user(phone_number='+919000000002', password='password123')
+        counsellor_user = User.objects.create_user(phone_number='+919000000003', password='password123')
+        self.counsellor = UserProfile.objects.create(user=counsellor_user, user_role='counsellor', name='Asha')
+        for i in range(3):
+            booking = Booking.objects.create(
+                user=self.user, counsellor=self.counsellor, order_id=f'order_{i}',
+                amount=100, status='completed' if i else 'wallet_credited'
+            )
+            CallRequest.objects.create(booking=booking, user=self.user, counsellor=self.counsellor)
+        self.url = reverse('call-request-details')
+        self.client.force_authenticate(self.admin)
+
+    def test_fields_projection(self):
+        response = self.client.get(self.url, {'fields': 'id,booking'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        row = response.data['data'][0]
+        self.assertEqual(set(row), {'id', 'booking'})
+        self.assertEqual(row['booking']['amount'], 100.0)
+
+        row = self.client.get(self.url, {'fields': 'id,user'}).data['data'][0]
+        self.assertEqual(row['user'], {'id': self.user.id, 'phone_number': '+919000000002', 'email': None})
+
+    def test_non_integer_ids_are_rejected(self):
+        for params in ({'counsellor': 'abc'}, {'user': '1.5'}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {'user': self.user.id})
+        self.assertEqual(len(response.data['data']), 3)
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get(self.url, {'fields': 'id,password'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filter_by_booking_status_and_paginate(self):
+        response = self.client.get(self.url, {'booking_status': 'completed', 'page_size': 1})
+        self.assertEqual(len(response.data['data']), 1)
+        response = self.client.get(self.url, {
+            'booking_status': 'completed', 'page_size': 1, 'cursor': response.data['next_cursor']
+        })
+        self.assertEqual(len(response.data['data']), 1)
+        self.assertIsNone(response.data['next_cursor'])
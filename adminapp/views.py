@@ -5,27 +5,29 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
-from rest_framework_simplejwt.tokens import RefreshToken
 from userdetails.models import User, UserProfile
 from userdetails.serializers import UserSerializer, UserProfileSerializer
+from userdetails.tokens import tokens_for_user
+from utils.throttling import LoginIPThrottle, LoginPhoneThrottle
 import logging
 logger = logging.getLogger(__name__)
 from dashboard.models import Booking, CallRequest
 from django.db.models import Prefetch
 from .models import Payout
-import razorpay
-from django.db import transaction
-from django.conf import settings
-import razorpay
 from django.db import transaction
 from django.conf import settings
 from counsellorapp.models import CounsellorPayment
 from counsellorapp.serializers import CounsellorPaymentSerializer
 from .serializers import ProblemSerializer
 from .models import Problem
-razorpay_client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
+from datetime import datetime
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from utils.pagination import CursorError, keyset_page, parse_page_size
+from utils.streaming import csv_response, ndjson_response
 class AdminLoginView(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [LoginPhoneThrottle, LoginIPThrottle]
 
     def post(self, request):
         phone_number = request.data.get('phone_number', '').strip()
@@ -68,7 +70,7 @@ class AdminLoginView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        refresh = RefreshToken.for_user(user)
+        refresh = tokens_for_user(user, profile)
         logger.info(f"Admin login successful for {phone_number}")
         return Response({
             'refresh': str(refresh),
@@ -81,7 +83,7 @@ class AdminCreateView(APIView):
     permission_classes = [AllowAny]
 
     def post(self, request):
-        logger.debug(f"Admin creation request data: {request.data}")
+        logger.debug("Admin creation request with fields %s", sorted(request.data))
         required_fields = ['phone_number', 'password', 'name']
         missing_fields = [field for field in required_fields if not request.data.get(field)]
         if missing_fields:
@@ -309,7 +311,7 @@ class CounsellorUserListView(APIView):
         Update a counsellor user's profile information
         """
         try:
-            logger.debug(f"Attempting to update counsellor with user_id={user_id}, data={request.data}")
+            logger.debug("Attempting to update counsellor with user_id=%s, fields=%s", user_id, sorted(request.data))
             profile = UserProfile.objects.get(
                 id=user_id,
                 user_role='counsellor',
@@ -374,110 +376,280 @@ class CounsellorUserListView(APIView):
             )          
             
 class BookingPaymentDetailsAPIView(APIView):
+    """
+    Admin listing of bookings with their payment and call details.
+
+    Query params:
+        cursor: next_cursor from the previous page
+        page_size: rows per page (default 50, max 200)
+        status: booking status
+        counsellor: counsellor profile id
+        created_after / created_before: ISO date or datetime bounds on created_at
+        export: 'ndjson' or 'csv' to stream every matching row instead of a page
+    """
     permission_classes = [IsAdminUser]
+    export_chunk_size = 500
+    csv_fields = [
+        'booking_id', 'order_id', 'user_id', 'counsellor_id', 'counsellor_name', 'amount',
+        'status', 'razorpay_payment_id', 'created_at', 'scheduled_at',
+        'call_request_ids', 'call_request_statuses',
+    ]
 
     def get(self, request):
         try:
-            # Prefetch related CallRequest objects to optimize query
-            bookings = Booking.objects.select_related('user', 'counsellor').prefetch_related(
-                Prefetch('callrequest_set', queryset=CallRequest.objects.select_related('user', 'counsellor'))
-            ).order_by('-created_at')
-
-            # Serialize booking and payment details
-            booking_data = []
-            for booking in bookings:
-                call_requests = booking.callrequest_set.all()
-                booking_data.append({
-                    'booking_id': booking.id,
-                    'order_id': booking.order_id,
-                    'user': {
-                        'id': booking.user.id,
-                        'username': booking.user.username,
-                        'email': booking.user.email
-                    },
-                    'counsellor': {
-                        'id': booking.counsellor.id,
-                        'name': booking.counsellor.name
-                    },
-                    'amount': float(booking.amount),  # Convert Decimal to float for JSON
-                    'status': booking.status,
-                    'razorpay_payment_id': booking.razorpay_payment_id,
-                    'created_at': booking.created_at,
-                    'scheduled_at': booking.scheduled_at,
-                    'call_requests': [
-                        {
-                            'id': cr.id,
-                            'status': cr.status,
-                            'requested_at': cr.requested_at,
-                            'updated_at': cr.updated_at,
-                            'accepted_at': cr.accepted_at,
-                            'ended_at': cr.ended_at,
-                            'scheduled_at': cr.scheduled_at
-                        } for cr in call_requests
-                    ]
-                })
+            bookings = self.filter_queryset(request)
+            export = request.query_params.get('export')
+            if export:
+                return self.export(bookings, export)
+
+            page_size = parse_page_size(request.query_params.get('page_size'))
+            bookings, next_cursor = keyset_page(
+                bookings.prefetch_related(self.call_request_prefetch()),
+                'created_at',
+                cursor=request.query_params.get('cursor'),
+                page_size=page_size,
+            )
 
             return Response({
                 'status': 'success',
-                'data': booking_data
+                'data': [self.serialize_booking(booking) for booking in bookings],
+                'next_cursor': next_cursor
             }, status=status.HTTP_200_OK)
 
+        except (CursorError, ValidationError) as e:
+            return Response({
+                'status': 'error',
+                'message': e.messages[0] if isinstance(e, ValidationError) else str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({
                 'status': 'error',
                 'message': str(e)
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)            
-            
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def filter_queryset(self, request):
+        params = request.query_params
+        bookings = Booking.objects.select_related('user', 'counsellor')
+        if params.get('status'):
+            bookings = bookings.filter(status=params['status'])
+        counsellor_id = parse_id_param(params.get('counsellor'), 'counsellor')
+        if counsellor_id:
+            bookings = bookings.filter(counsellor_id=counsellor_id)
+        created_after = parse_datetime_param(params.get('created_after'), 'created_after')
+        if created_after:
+            bookings = bookings.filter(created_at__gte=created_after)
+        created_before = parse_datetime_param(params.get('created_before'), 'created_before')
+        if created_before:
+            bookings = bookings.filter(created_at__lt=created_before)
+        return bookings
+
+    def call_request_prefetch(self):
+        return Prefetch(
+            'callrequest_set',
+            queryset=CallRequest.objects.only(
+                'id', 'booking_id', 'status', 'requested_at', 'updated_at',
+                'accepted_at', 'ended_at', 'scheduled_at'
+            )
+        )
+
+    def export(self, bookings, export_format):
+        if export_format not in ('ndjson', 'csv'):
+            raise ValidationError("export must be 'ndjson' or 'csv'")
+
+        # iterator() with a chunk_size keeps only one chunk of bookings (and the
+        # call requests prefetched for that chunk) in memory at a time.
+        rows = (
+            self.serialize_booking(booking)
+            for booking in bookings.prefetch_related(self.call_request_prefetch())
+            .order_by('-created_at', '-id')
+            .iterator(chunk_size=self.export_chunk_size)
+        )
+        if export_format == 'ndjson':
+            return ndjson_response(rows, 'bookings')
+        return csv_response((self.flatten_booking(row) for row in rows), self.csv_fields, 'bookings')
+
+    def serialize_booking(self, booking):
+        return {
+            'booking_id': booking.id,
+            'order_id': booking.order_id,
+            'user': {
+                'id': booking.user.id,
+                'phone_number': booking.user.phone_number,
+                'email': booking.user.email
+            },
+            'counsellor': {
+                'id': booking.counsellor.id,
+                'name': booking.counsellor.name
+            },
+            'amount': float(booking.amount),  # Convert Decimal to float for JSON
+            'status': booking.status,
+            'razorpay_payment_id': booking.razorpay_payment_id,
+            'created_at': booking.created_at,
+            'scheduled_at': booking.scheduled_at,
+            'call_requests': [
+                {
+                    'id': cr.id,
+                    'status': cr.status,
+                    'requested_at': cr.requested_at,
+                    'updated_at': cr.updated_at,
+                    'accepted_at': cr.accepted_at,
+                    'ended_at': cr.ended_at,
+                    'scheduled_at': cr.scheduled_at
+                } for cr in booking.callrequest_set.all()
+            ]
+        }
+
+    def flatten_booking(self, row):
+        return {
+            'booking_id': row['booking_id'],
+            'order_id': row['order_id'],
+            'user_id': row['user']['id'],
+            'counsellor_id': row['counsellor']['id'],
+            'counsellor_name': row['counsellor']['name'],
+            'amount': row['amount'],
+            'status': row['status'],
+            'razorpay_payment_id': row['razorpay_payment_id'],
+            'created_at': row['created_at'].isoformat(),
+            'scheduled_at': row['scheduled_at'].isoformat() if row['scheduled_at'] else '',
+            'call_request_ids': ';'.join(str(cr['id']) for cr in row['call_requests']),
+            'call_request_statuses': ';'.join(cr['status'] for cr in row['call_requests']),
+        }
+
+
+def parse_id_param(value, name):
+    """Parse an id query parameter, so a malformed one is a 400 rather than a query error."""
+    if not value:
+        return None
+    try:
+        parsed = int(value)
+    except ValueError:
+        parsed = None
+    if parsed is None or parsed <= 0:
+        raise ValidationError(f'{name} must be a positive integer')
+    return parsed
+
+
+def parse_datetime_param(value, name):
+    """Parse an ISO date or datetime query parameter into an aware datetime."""
+    if not value:
+        return None
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            parsed_date = parse_date(value)
+            if parsed_date is not None:
+                parsed = datetime.combine(parsed_date, datetime.min.time())
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValidationError(f'{name} must be an ISO date or datetime')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
 class CallRequestDetailsAPIView(APIView):
+    """
+    Admin listing of call requests.
+
+    Query params:
+        cursor: next_cursor from the previous page
+        page_size: rows per page (default 50, max 200)
+        status: call request status
+        counsellor: counsellor profile id
+        user: user id
+        booking_status: status of the related booking
+        fields: comma separated subset of the response fields (see FIELDS);
+            only the columns backing those fields are selected and joined
+    """
     permission_classes = [IsAdminUser]
 
+    # Response field -> column, or nested key -> column for related objects
+    FIELDS = {
+        'id': 'id',
+        'status': 'status',
+        'requested_at': 'requested_at',
+        'updated_at': 'updated_at',
+        'accepted_at': 'accepted_at',
+        'ended_at': 'ended_at',
+        'scheduled_at': 'scheduled_at',
+        'user': {'id': 'user_id', 'phone_number': 'user__phone_number', 'email': 'user__email'},
+        'counsellor': {'id': 'counsellor_id', 'name': 'counsellor__name'},
+        'booking': {
+            'id': 'booking_id',
+            'order_id': 'booking__order_id',
+            'amount': 'booking__amount',
+            'status': 'booking__status',
+        },
+    }
+
     def get(self, request):
         try:
-            # Prefetch related Booking, User, and UserProfile to optimize query
-            call_requests = CallRequest.objects.select_related(
-                'user', 'counsellor', 'booking__user', 'booking__counsellor'
-            ).order_by('-requested_at')
-
-            # Serialize call request details
-            call_data = [
-                {
-                    'id': call_request.id,
-                    'user': {
-                        'id': call_request.user.id,
-                        'username': call_request.user.username,
-                        'email': call_request.user.email
-                    },
-                    'counsellor': {
-                        'id': call_request.counsellor.id,
-                        'name': call_request.counsellor.name
-                    },
-                    'booking': {
-                        'id': call_request.booking.id,
-                        'order_id': call_request.booking.order_id,
-                        'amount': float(call_request.booking.amount),  # Convert Decimal to float for JSON
-                        'status': call_request.booking.status
-                    },
-                    'status': call_request.status,
-                    'requested_at': call_request.requested_at,
-                    'updated_at': call_request.updated_at,
-                    'accepted_at': call_request.accepted_at,
-                    'ended_at': call_request.ended_at,
-                    'scheduled_at': call_request.scheduled_at
-                }
-                for call_request in call_requests
-            ]
+            params = request.query_params
+            fields = self.parse_fields(params.get('fields'))
+
+            call_requests = CallRequest.objects.all()
+            if params.get('status'):
+                call_requests = call_requests.filter(status=params['status'])
+            counsellor_id = parse_id_param(params.get('counsellor'), 'counsellor')
+            if counsellor_id:
+                call_requests = call_requests.filter(counsellor_id=counsellor_id)
+            user_id = parse_id_param(params.get('user'), 'user')
+            if user_id:
+                call_requests = call_requests.filter(user_id=user_id)
+            if params.get('booking_status'):
+                call_requests = call_requests.filter(booking__status=params['booking_status'])
+
+            # values() skips model instantiation and, together with the
+            # projection, keeps joins limited to the relations actually asked for.
+            columns = {'id', 'requested_at'}
+            for field in fields:
+                column = self.FIELDS[field]
+                columns.update(column.values() if isinstance(column, dict) else [column])
+
+            rows, next_cursor = keyset_page(
+                call_requests.values(*columns),
+                'requested_at',
+                cursor=params.get('cursor'),
+                page_size=parse_page_size(params.get('page_size')),
+            )
 
             return Response({
                 'status': 'success',
-                'data': call_data
+                'data': [self.build_row(row, fields) for row in rows],
+                'next_cursor': next_cursor
             }, status=status.HTTP_200_OK)
 
+        except (CursorError, ValidationError) as e:
+            return Response({
+                'status': 'error',
+                'message': e.messages[0] if isinstance(e, ValidationError) else str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({
                 'status': 'error',
                 'message': str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-                        
+
+    def parse_fields(self, value):
+        if not value:
+            return list(self.FIELDS)
+        fields = [field.strip() for field in value.split(',') if field.strip()]
+        unknown = [field for field in fields if field not in self.FIELDS]
+        if unknown:
+            raise ValidationError(f'Unknown fields: {", ".join(unknown)}')
+        return fields
+
+    def build_row(self, values, fields):
+        row = {}
+        for field in fields:
+            column = self.FIELDS[field]
+            if isinstance(column, dict):
+                row[field] = {key: values[path] for key, path in column.items()}
+            else:
+                row[field] = values[column]
+        if 'booking' in row:
+            row['booking']['amount'] = float(row['booking']['amount'])  # Convert Decimal to float for JSON
+        return row
 
 
 class PayoutAPIView(APIView):
@@ -485,7 +657,7 @@ class PayoutAPIView(APIView):
 
     def post(self, request):
         try:
-            logger.debug(f"Payout request data: {request.data}")
+            logger.debug("Payout request with fields %s", sorted(request.data))
             
             # Validate required fields
             required_fields = ['counsellor_id', 'amount', 'notes']
@@ -611,7 +783,7 @@ class CounsellorPaymentSettingsAPIView(APIView):
     def post(self, request):
         try:
             
-            logger.debug(f"Creating payment settings with data: {request.data}")
+            logger.debug("Creating payment settings with fields %s", sorted(request.data))
             required_fields = ['user_id', 'session_fee', 'session_duration']
             missing_fields = [field for field in required_fields if field not in request.data]
             if missing_fields:
@@ -667,7 +839,7 @@ class CounsellorPaymentSettingsAPIView(APIView):
 
     def patch(self, request, user_id):
         try:
-            logger.debug(f"Updating payment settings for user_id={user_id}, data={request.data}")
+            logger.debug("Updating payment settings for user_id=%s, fields=%s", user_id, sorted(request.data))
             try:
                 payment_settings = CounsellorPayment.objects.get(
                     counsellor__user__id=user_id,
@@ -718,8 +890,7 @@ class ProblemAPIView(APIView):
         """Retrieve all problems or user's selected problems."""
         if request.query_params.get('selected'):
             # Get problems selected by the authenticated user
-            user_profile = UserProfile.objects.get(user=request.user)
-            user_problems = UserProblem.objects.filter(user_profile=user_profile)
+            user_problems = UserProblem.objects.filter(user_profile_id=request.user.profile_id)
             serializer = UserProblemSerializer(user_problems, many=True)
             return Response(serializer.data)
         else:
@@ -732,9 +903,8 @@ class ProblemAPIView(APIView):
         """Create a new problem."""
         serializer = ProblemSerializer(data=request.data)
         if serializer.is_valid():
-            user_profile = UserProfile.objects.get(user=request.user)
-            if user_profile.user_role in ['admin', 'counsellor']:  # Restrict to admin/counsellor
-                serializer.save(created_by=user_profile)
+            if request.user.user_role in ['admin', 'counsellor']:  # Restrict to admin/counsellor
+                serializer.save(created_by_id=request.user.profile_id)
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
             return Response({"error": "Only admins or counsellors can create problems"}, status=status.HTTP_403_FORBIDDEN)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -746,8 +916,7 @@ class ProblemAPIView(APIView):
         except Problem.DoesNotExist:
             return Response({"error": "Problem not found"}, status=status.HTTP_404_NOT_FOUND)
         
-        user_profile = UserProfile.objects.get(user=request.user)
-        if user_profile.user_role not in ['admin', 'counsellor']:
+        if request.user.user_role not in ['admin', 'counsellor']:
             return Response({"error": "Only admins or counsellors can update problems"}, status=status.HTTP_403_FORBIDDEN)
         
         serializer = ProblemSerializer(problem, data=request.data, partial=True)
@@ -765,8 +934,7 @@ class ProblemAPIView(APIView):
         except Problem.DoesNotExist:
             return Response({"error": "Problem not found"}, status=status.HTTP_404_NOT_FOUND)
         
-        user_profile = UserProfile.objects.get(user=request.user)
-        if user_profile.user_role not in ['admin', 'counsellor']:
+        if request.user.user_role not in ['admin', 'counsellor']:
             return Response({"error": "Only admins or counsellors can delete problems"}, status=status.HTTP_403_FORBIDDEN)
         
         problem.delete()
@@ -785,14 +953,16 @@ class UserProblemAPIView(APIView):
 
         try:
             problem = Problem.objects.get(pk=problem_id)
-            user_profile = UserProfile.objects.get(user=request.user)
+            profile_id = request.user.profile_id
+            if profile_id is None:
+                return Response({"error": "User profile not found"}, status=status.HTTP_404_NOT_FOUND)
 
-            if UserProblem.objects.filter(user_profile=user_profile, problem=problem).exists():
+            if UserProblem.objects.filter(user_profile_id=profile_id, problem=problem).exists():
                 return Response({"error": "Problem already selected"}, status=status.HTTP_400_BAD_REQUEST)
 
             data = {
                 'problem_id': problem.id,
-                'user_profile': user_profile.id
+                'user_profile': profile_id
             }
 
             serializer = UserProblemSerializer(data=data)
@@ -808,8 +978,7 @@ class UserProblemAPIView(APIView):
 
     def get(self, request):
         """Retrieve all problems selected by the authenticated user."""
-        user_profile = UserProfile.objects.get(user=request.user)
-        user_problems = UserProblem.objects.filter(user_profile=user_profile)
+        user_problems = UserProblem.objects.filter(user_profile_id=request.user.profile_id)
         serializer = UserProblemSerializer(user_problems, many=True)
         return Response(serializer.data)            
                      
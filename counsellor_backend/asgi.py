@@ -8,9 +8,9 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
 import os
+import threading
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
 from channels.security.websocket import AllowedHostsOriginValidator
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'counsellor_backend.settings')
@@ -19,12 +19,17 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'counsellor_backend.settings')
 django_asgi_app = get_asgi_application()
 
 # Import websocket_urlpatterns after Django is set up
+from dashboard.middleware import TokenAuthMiddleware
+from userdetails.firebase_tokens import prewarm_signing_keys
 from dashboard.routing import websocket_urlpatterns
 
+# Load Firebase signing keys before the first login needs them
+threading.Thread(target=prewarm_signing_keys, name='firebase-key-prewarm', daemon=True).start()
+
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
     "websocket": AllowedHostsOriginValidator(
-        AuthMiddlewareStack(
+        TokenAuthMiddleware(
             URLRouter(
                 websocket_urlpatterns  # Use the imported websocket_urlpatterns directly
             )
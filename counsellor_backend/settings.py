@@ -18,8 +18,6 @@ import os
 from pathlib import Path
 
 
-import firebase_admin
-from firebase_admin import credentials
 import json
 
 # Build paths
@@ -59,6 +57,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'utils.metrics.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -104,26 +103,35 @@ DATABASES = {
     }
 }
 
-# Firebase initialization
+# Firebase; the firebase_admin app is initialised on first use (utils.services)
 FIREBASE_SERVICE_ACCOUNT_KEY = os.path.join(BASE_DIR, '..', 'firebase-adminsdk.json')
-if not firebase_admin._apps:
-    try:
-        cred = credentials.Certificate(FIREBASE_SERVICE_ACCOUNT_KEY)
-        firebase_admin.initialize_app(cred)
-    except FileNotFoundError:
-        print(f"Firebase credentials file not found at {FIREBASE_SERVICE_ACCOUNT_KEY}")
-        # Handle the error appropriately, maybe exit or use a dummy client
-        pass
+# ID tokens are verified locally (userdetails.firebase_tokens); the project id
+# defaults to the one in the service account credentials. Set it in production:
+# workers only prewarm the signing keys at boot when it is set, since reading it
+# from the credentials would initialise firebase_admin during start-up.
+FIREBASE_PROJECT_ID = config('FIREBASE_PROJECT_ID', default='')
+FIREBASE_KEY_SOURCE = 'userdetails.firebase_tokens.GoogleKeySource'
     
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'userdetails.auth_backends.ClaimsJWTAuthentication',  # user id, role and profile id from the token
         'rest_framework.authentication.TokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',  # Change to AllowAny for testing
     ],
+    # Scopes used by utils.throttling; counted in the default cache
+    'DEFAULT_THROTTLE_RATES': {
+        'login': '5/min',  # per phone number
+        'login_ip': '30/min',
+        'orders': '10/min',  # per user
+        'call_tokens': '30/min',  # per user
+    },
+    # Proxies in front of the app (Render's load balancer). Throttles key on the
+    # address this many hops from the end of X-Forwarded-For, which the client
+    # cannot forge, rather than on the whole header.
+    'NUM_PROXIES': config('NUM_PROXIES', default=1, cast=int),
 }
 AUTHENTICATION_BACKENDS = [
     'userdetails.auth_backends.PhoneNumberBackend',
@@ -191,6 +199,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 RAZORPAY_KEY_ID = config('RAZORPAY_KEY_ID')
 RAZORPAY_KEY_SECRET = config('RAZORPAY_KEY_SECRET')
 RAZORPAY_ACCOUNT_NUMBER = config('RAZORPAY_ACCOUNT_NUMBER')
+RAZORPAY_WEBHOOK_SECRET = config('RAZORPAY_WEBHOOK_SECRET', default='')
 
 # settings.py
 CSRF_COOKIE_SECURE = False  # Use True in production with HTTPS
@@ -207,6 +216,8 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': False,
     'BLACKLIST_AFTER_ROTATION': False,
     'SIGNING_KEY': SECRET_KEY,  # Use Django's SECRET_KEY for consistency
+    # Re-reads role, profile id and admin flag into refreshed access tokens
+    'TOKEN_REFRESH_SERIALIZER': 'userdetails.tokens.IdentityTokenRefreshSerializer',
 }
 ASGI_APPLICATION = 'counsellor_backend.asgi.application'
 
@@ -218,26 +229,71 @@ CHANNEL_LAYERS = {
         },
     },
 }
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": config('REDIS_CACHE_URL', default='redis://127.0.0.1:6379/1'),
+    },
+}
+WALLET_CACHE_TIMEOUT = 60  # seconds; wallet payloads are also dropped on every ledger write
+PRESENCE_TTL = 60  # seconds a counsellor stays online without a heartbeat
+PRESENCE_HEARTBEAT = 20  # seconds between CounsellorConsumer heartbeats
+COUNSELLOR_DIRECTORY_TIMEOUT = 600  # seconds; the directory is also rebuilt on every counsellor change
+PUSH_TRANSPORT = config('PUSH_TRANSPORT', default='dashboard.notifications.FirebaseTransport')
+SLOW_REQUEST_MS = config('SLOW_REQUEST_MS', default=0, cast=int)  # 0 turns the slow-request SQL log off
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', default='127.0.0.1,::1', cast=lambda v: [ip.strip() for ip in v.split(',')])
+WS_IDENTITY_CACHE_TIMEOUT = 60  # seconds a verified WebSocket token is reused without a DB lookup
+FIREBASE_IDENTITY_CACHE_TIMEOUT = 300  # seconds; also dropped when the user's uid, active flag or role changes
+# Sub-WARNING records kept per logger prefix; everything else is logged in full
+LOG_SAMPLE_RATES = {
+    'dashboard.consumers': config('LOG_SAMPLE_CONSUMERS', default=0.1, cast=float),
+}
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'utils.log.JsonFormatter',
+        },
+    },
+    'filters': {
+        'sampling': {
+            '()': 'utils.log.SamplingFilter',
+            'rates': LOG_SAMPLE_RATES,
+        },
+    },
     'handlers': {
+        # Writes from a background thread; see utils.log
         'console': {
-            'class': 'logging.StreamHandler',
+            'class': 'utils.log.QueueLogHandler',
+            'formatter': 'json',
+            'filters': ['sampling'],
         },
     },
     'loggers': {
-        'dashboard.consumers': {
+        'dashboard': {
             'handlers': ['console'],
-            'level': 'INFO',
+            'level': config('LOG_LEVEL', default='INFO'),
+            'propagate': False,
         },
-        'dashboard.views': {
+        'userdetails': {
             'handlers': ['console'],
-            'level': 'INFO',
+            'level': config('LOG_LEVEL', default='INFO'),
+            'propagate': False,
         },
-        'userdetails': {
+        'adminapp': {
+            'handlers': ['console'],
+            'level': config('LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
+        'counsellorapp': {
+            'handlers': ['console'],
+            'level': config('LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
+        'utils': {
             'handlers': ['console'],
-            'level': 'DEBUG',
+            'level': config('LOG_LEVEL', default='INFO'),
             'propagate': False,
         },
     },
@@ -8,9 +8,15 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 """
 
 import os
+import threading
 
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'counsellor_backend.settings')
 
 application = get_wsgi_application()
+
+from userdetails.firebase_tokens import prewarm_signing_keys
+
+# Load Firebase signing keys before the first login needs them
+threading.Thread(target=prewarm_signing_keys, name='firebase-key-prewarm', daemon=True).start()
@@ -20,15 +20,12 @@ from itertools import chain
 from .models import CounsellorPayment
 from django.utils import timezone
 from django.conf import settings
-import firebase_admin
-from firebase_admin import credentials, auth
 import logging
 from django.views.decorators.csrf import csrf_exempt
-import razorpay
 import hmac
 import hashlib
 from dashboard.models import Booking, CallRequest
-from userdetails.models import User, UserProfile, OTPAttempt
+from userdetails.models import User, UserProfile
 from .serializers import CounsellorPaymentSerializer
 from .models import CounsellorPayment
 from userdetails.models import UserProfile
@@ -69,6 +66,13 @@ class RecentActivityView(APIView):
     
     permission_classes = [IsAuthenticated]
  
+    @staticmethod
+    def activity_querysets(counsellor):
+        '''(completed calls, new bookings) shown as recent activity; also planned by explain_hot_queries.'''
+        # Booking has no updated_at, so completed calls are ordered by when they were booked too
+        completed_calls = Booking.objects.filter(counsellor=counsellor, status='completed').order_by('-created_at')[:10]
+        new_bookings = Booking.objects.filter(counsellor=counsellor, status='scheduled').order_by('-created_at')[:10]
+        return completed_calls, new_bookings
 
     def get(self, request):
         try:
@@ -76,8 +80,7 @@ class RecentActivityView(APIView):
         except AttributeError:
             return Response({"detail": "Counsellor profile not found for the current user."}, status=404)
 
-        completed_calls = Booking.objects.filter(counsellor=counsellor, status='completed').order_by('-updated_at')[:10]
-        new_bookings = Booking.objects.filter(counsellor=counsellor, status='scheduled').order_by('-created_at')[:10]
+        completed_calls, new_bookings = self.activity_querysets(counsellor)
 
         activities = []
         for call in completed_calls:
@@ -85,7 +88,7 @@ class RecentActivityView(APIView):
                 'activity_id': call.id,
                 'type': 'Completed Call',
                 'description': f"Completed a {call.session_duration}-minute call with {call.user.user.get_full_name() or call.user.user.username}.",
-                'timestamp': call.updated_at
+                'timestamp': call.created_at
             })
 
         for booking in new_bookings:
@@ -199,8 +202,7 @@ class ActiveBookingView(APIView):
     def get(self, request):
         try:
             # Get counsellor profile
-            user_profile = getattr(request.user, 'profile', None)
-            if not user_profile or user_profile.user_role != 'counsellor':
+            if request.user.user_role != 'counsellor':
                 return Response(
                     {'error': 'User is not a counsellor'},
                     status=status.HTTP_403_FORBIDDEN
@@ -208,7 +210,7 @@ class ActiveBookingView(APIView):
 
             # Get active call request
             active_call = CallRequest.objects.filter(
-                counsellor=user_profile,
+                counsellor_id=request.user.profile_id,
                 status__in=['PENDING', 'ACCEPTED']
             ).select_related('booking', 'user').first()
 
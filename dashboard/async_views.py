@@ -0,0 +1,323 @@
+'''
+Async versions of the call signalling endpoints.
+
+DRF's APIView is sync-only, so under ASGI every request to it runs in a
+worker thread. These views run on the event loop instead: the ORM is used
+through its async API and channel-layer sends are awaited directly rather than
+handed off with async_to_sync. AsyncAPIView covers the parts of APIView the
+call endpoints rely on: JWT or session authentication, JSON bodies and JSON
+responses.
+'''
+import json
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.http import JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.utils import timezone
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from userdetails.auth_backends import ClaimsJWTAuthentication
+from userdetails.identity import record_claims
+from userdetails.tokens import USER_ROLE_CLAIM
+
+from utils.zego_service import ZegoTokenError, get_token_service
+from . import events, presence
+from .models import Booking, CallRequest
+from .notifications import aenqueue_push
+from .views import CALL_NOTIFICATION_TTL
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+_jwt = ClaimsJWTAuthentication()
+
+
+def _csrf_failure(request):
+    check = CsrfViewMiddleware(lambda request: None)
+    check.process_request(request)
+    return check.process_view(request, None, (), {})
+
+
+class AsyncAPIView(View):
+    """Base for async JSON endpoints that require an authenticated user."""
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # CSRF is only enforced for session-authenticated requests, as in DRF
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def authenticate(self, request):
+        '''
+        Returns:
+            tuple: (user or None, error response or None)
+        '''
+        header = _jwt.get_header(request)
+        if header is not None:
+            raw_token = _jwt.get_raw_token(header)
+            if raw_token is None:
+                return None, None
+            try:
+                validated_token = _jwt.get_validated_token(raw_token)
+            except (InvalidToken, TokenError):
+                return None, None
+            try:
+                user = _jwt.user_from_claims(validated_token)
+            except AuthenticationFailed:
+                return None, None
+            if user is not None:
+                return user, None
+            user = await User.objects.filter(
+                **{api_settings.USER_ID_FIELD: validated_token[api_settings.USER_ID_CLAIM]}, is_active=True
+            ).afirst()
+            if user is not None and USER_ROLE_CLAIM in validated_token:
+                await sync_to_async(record_claims)([user.id])
+            return user, None
+
+        user = await request.auser()
+        if not user.is_authenticated:
+            return None, None
+        return user, _csrf_failure(request)
+
+    async def dispatch(self, request, *args, **kwargs):
+        user, error = await self.authenticate(request)
+        if error is not None:
+            return error
+        if user is None:
+            return JsonResponse(
+                {'detail': 'Authentication credentials were not provided or are invalid.'},
+                status=status.HTTP_401_UNAUTHORIZED
+            )
+        request.user = user
+
+        if request.content_type == 'application/json':
+            try:
+                request.data = json.loads(request.body or b'{}')
+            except ValueError:
+                return JsonResponse({'detail': 'JSON parse error'}, status=status.HTTP_400_BAD_REQUEST)
+            if not isinstance(request.data, dict):
+                return JsonResponse({'detail': 'Expected a JSON object'}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            request.data = request.POST
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncInitiateCallView(AsyncAPIView):
+    async def post(self, request):
+        booking_id = request.data.get('booking_id')
+        if not booking_id:
+            return JsonResponse({'error': 'booking_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            booking = await Booking.objects.select_related('counsellor').aget(id=booking_id)
+        except Booking.DoesNotExist:
+            return JsonResponse({'error': 'Booking not found'}, status=status.HTTP_404_NOT_FOUND)
+        counsellor = booking.counsellor
+        if counsellor is None:
+            return JsonResponse({'error': 'Booking has no counsellor'}, status=status.HTTP_400_BAD_REQUEST)
+        counsellor_user_id = str(counsellor.user_id)
+
+        room_id = f"booking_{booking_id}"
+        user_id = str(request.user.id)
+        token_service = get_token_service()
+        if token_service is None:
+            return JsonResponse(
+                {'error': 'Video call service not configured'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        try:
+            user_token_info, counsellor_token_info = token_service.get_tokens([
+                (user_id, room_id), (counsellor_user_id, room_id)
+            ])
+        except ZegoTokenError as e:
+            return JsonResponse({'error': f"Token generation failed: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        await aenqueue_push(counsellor, {
+            'type': 'call_notification',
+            'room_id': room_id,
+            'kitToken': counsellor_token_info.token,
+            'user_id': counsellor_user_id,
+            'streamId': f"stream_{counsellor_user_id}_{int(time.time())}",
+            'booking_id': str(booking_id),
+            'counsellor_id': str(counsellor.id),
+            'clientUserId': user_id,
+        }, ttl=CALL_NOTIFICATION_TTL)
+
+        return JsonResponse({
+            'room_id': room_id,
+            'kitToken': user_token_info.token,
+            'app_id': token_service.app_id,
+            'user_id': user_id,
+            'streamId': f"stream_{user_id}_{int(time.time())}",
+            'expires_in': token_service.expires_in(user_token_info),
+            'counsellor_id': counsellor.id
+        }, status=status.HTTP_200_OK)
+
+
+class AsyncCallStatusView(AsyncAPIView):
+    """Handle call status updates and notify relevant parties"""
+
+    async def post(self, request):
+        try:
+            booking_id = request.data.get('booking_id')
+            user_role = request.data.get('user_role')
+            action = request.data.get('action')
+            timestamp = request.data.get('timestamp')
+
+            if not all([booking_id, user_role, action]):
+                return JsonResponse({'error': 'Missing required fields'}, status=status.HTTP_400_BAD_REQUEST)
+
+            try:
+                booking = await Booking.objects.aget(id=booking_id)
+            except Booking.DoesNotExist:
+                return JsonResponse({'error': 'Booking not found'}, status=status.HTTP_404_NOT_FOUND)
+
+            call_request, created = await CallRequest.objects.aget_or_create(
+                booking=booking,
+                defaults={
+                    'counsellor_id': booking.counsellor_id,
+                    'user_id': booking.user_id,
+                    'status': 'PENDING'
+                }
+            )
+
+            if action == 'joined':
+                if user_role == 'counsellor':
+                    call_request.status = 'ACCEPTED'
+                    call_request.accepted_at = timezone.now()
+                    await call_request.asave()
+                    await presence.amark_busy(booking.counsellor_id)
+                if booking.status == 'wallet_credited':
+                    booking.status = 'completed'
+                    await booking.asave()
+            elif action == 'left':
+                call_request.status = 'ENDED'
+                call_request.ended_at = timezone.now()
+                await call_request.asave()
+                await presence.amark_available(booking.counsellor_id)
+
+            # Sent once the state above is saved, so listeners that re-read it see the change
+            await events.apublish_booking_event(booking, 'call_status', {
+                'type': 'call_status',
+                'booking_id': booking_id,
+                'user_role': user_role,
+                'action': action,
+                'timestamp': timestamp,
+                'room_id': str(booking_id)
+            })
+
+            return JsonResponse({
+                'status': 'success',
+                'message': 'Call status updated successfully',
+                'booking_status': booking.status,
+                'call_status': call_request.status
+            })
+
+        except Exception as e:
+            logger.error(f"Error updating call status: {str(e)}")
+            return JsonResponse(
+                {'error': 'Failed to update call status'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class AsyncInitiateCallNotificationView(AsyncAPIView):
+    """Send notification to counsellor when user initiates a call"""
+
+    async def post(self, request):
+        try:
+            booking_id = request.data.get('booking_id')
+            if not booking_id:
+                return JsonResponse({'error': 'booking_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+            try:
+                booking = await Booking.objects.aget(id=booking_id)
+            except Booking.DoesNotExist:
+                return JsonResponse({'error': 'Booking not found'}, status=status.HTTP_404_NOT_FOUND)
+
+            if booking.user_id != request.user.id:
+                return JsonResponse({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+
+            call_request, created = await CallRequest.objects.aget_or_create(
+                booking=booking,
+                defaults={
+                    'counsellor_id': booking.counsellor_id,
+                    'user_id': booking.user_id,
+                    'status': 'PENDING'
+                }
+            )
+
+            # Users authenticated from token claims have only their id loaded
+            if request.user.get_deferred_fields():
+                await request.user.arefresh_from_db()
+
+            # Replayed to the counsellor on reconnect until acknowledged
+            await events.apublish_booking_event(booking, 'incoming_call', {
+                'type': 'incoming_call',
+                'booking_id': booking_id,
+                'call_request_id': call_request.id,
+                'user_name': request.user.get_full_name() or request.user.username,
+                'user_phone': getattr(request.user, 'phone_number', ''),
+                'room_id': str(booking_id),
+                'timestamp': timezone.now().isoformat()
+            })
+
+            return JsonResponse({
+                'status': 'success',
+                'message': 'Call notification sent to counsellor',
+                'call_request_id': call_request.id
+            })
+
+        except Exception as e:
+            logger.error(f"Error sending call notification: {str(e)}")
+            return JsonResponse(
+                {'error': 'Failed to send notification'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class AsyncEndCallSessionView(AsyncAPIView):
+    """Handle call termination and cleanup"""
+
+    async def post(self, request):
+        try:
+            booking_id = request.data.get('booking_id')
+            ended_by = request.data.get('ended_by', 'user')  # 'user' or 'counsellor'
+            if not booking_id:
+                return JsonResponse({'error': 'booking_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+            try:
+                booking = await Booking.objects.aget(id=booking_id)
+            except Booking.DoesNotExist:
+                return JsonResponse({'error': 'Booking not found'}, status=status.HTTP_404_NOT_FOUND)
+
+            call_request = await CallRequest.objects.filter(booking=booking).afirst()
+            if not call_request:
+                return JsonResponse({'error': 'Call request not found'}, status=status.HTTP_404_NOT_FOUND)
+
+            call_request.status = 'ENDED'
+            call_request.ended_at = timezone.now()
+            await call_request.asave()
+            await presence.amark_available(booking.counsellor_id)
+
+            await events.apublish_booking_event(booking, 'call_ended', {
+                'type': 'call_ended',
+                'booking_id': booking_id,
+                'call_request_id': call_request.id,
+                'ended_by': ended_by,
+                'timestamp': timezone.now().isoformat()
+            })
+
+            return JsonResponse({
+                'status': 'success',
+                'message': 'Call ended successfully',
+                'call_request_id': call_request.id
+            })
+
+        except Exception as e:
+            logger.error(f"Error ending call: {str(e)}")
+            return JsonResponse({'error': 'Failed to end call'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
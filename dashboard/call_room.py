@@ -0,0 +1,65 @@
+'''
+Shared state for CallRoomConsumer: who is connected to a booking's call room
+and the snapshot a participant receives when joining, which is what clients
+used to poll CallStatusCheckView for.
+'''
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Booking, CallRequest
+
+ROLES = ('user', 'counsellor')
+DEFAULT_RING_TIMEOUT = 60  # seconds the user waits alone before the room reports a timeout
+PARTICIPANT_TTL = 90  # seconds; refreshed by client pings, covers workers dying mid-call
+
+
+def ring_timeout():
+    return getattr(settings, 'CALL_RING_TIMEOUT', DEFAULT_RING_TIMEOUT)
+
+
+def participant_key(booking_id, role):
+    return f"callroom:{booking_id}:{role}"
+
+
+async def ajoin(booking_id, role):
+    await cache.aset(participant_key(booking_id, role), 1, timeout=PARTICIPANT_TTL)
+
+
+async def aleave(booking_id, role):
+    await cache.adelete(participant_key(booking_id, role))
+
+
+async def apresent(booking_id):
+    '''Return the roles currently connected to the room.'''
+    found = await cache.aget_many([participant_key(booking_id, role) for role in ROLES])
+    return [role for role in ROLES if participant_key(booking_id, role) in found]
+
+
+def load_booking(booking_id, user_id):
+    '''
+    Return (booking, role) for a user allowed into the call room, or
+    (None, None) if the booking does not exist or is not theirs.
+    '''
+    booking = Booking.objects.select_related('counsellor').filter(id=booking_id).first()
+    if booking is None:
+        return None, None
+    # Token claims may carry the id as a string
+    if str(booking.user_id) == str(user_id):
+        return booking, 'user'
+    if str(booking.counsellor.user_id) == str(user_id):
+        return booking, 'counsellor'
+    return None, None
+
+
+def snapshot(booking):
+    booking.refresh_from_db(fields=['status'])
+    call_request = CallRequest.objects.filter(booking=booking).order_by('-requested_at').first()
+    return {
+        'booking_id': booking.id,
+        'booking_status': booking.status,
+        'call_status': call_request.status if call_request else 'NOT_CREATED',
+        'call_request_id': call_request.id if call_request else None,
+        'accepted_at': call_request.accepted_at.isoformat() if call_request and call_request.accepted_at else None,
+        'ended_at': call_request.ended_at.isoformat() if call_request and call_request.ended_at else None,
+        'session_duration': booking.session_duration,
+    }
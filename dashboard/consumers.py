@@ -1,42 +1,50 @@
+import asyncio
 import json
+import logging
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from rest_framework_simplejwt.tokens import AccessToken
-from userdetails.models import User
+from . import call_room, events, presence
+
+logger = logging.getLogger(__name__)
 
 class CounsellorConsumer(AsyncWebsocketConsumer):
+    """
+    A counsellor's socket at ws/counsellor/<profile id>/?token=<JWT>.
+
+    Call events (incoming_call, call_status, call_ended) arrive with their
+    fields at the top level plus an event_id. The client acknowledges them
+    with {"type": "ack", "event_id": <id>} or {"type": "ack", "event_ids":
+    [...]}. Unacknowledged events from the last ten minutes are sent again
+    on every reconnect, so clients should de-duplicate on event_id. A
+    {"type": "ping"} is answered with {"type": "pong"} and keeps the
+    counsellor's presence alive.
+    """
+    heartbeat_task = None
+
     async def connect(self):
         self.counsellor_id = self.scope['url_route']['kwargs']['counsellor_id']
         self.group_name = f"counsellor_{self.counsellor_id}"
+        self.tracks_presence = False
 
-        # Extract token from query parameters
-        query_string = self.scope.get('query_string', b'').decode()
-        token = None
-        
-        if 'token=' in query_string:
-            token = query_string.split('token=')[1].split('&')[0]
-        
-        if not token:
-            print(f"[WebSocket] Connection rejected: No token provided for counsellor_{self.counsellor_id}")
-            await self.close(code=4001)
+        # Token checked and identity loaded by TokenAuthMiddleware
+        identity = self.scope.get('identity')
+        if identity is None:
+            if self.scope.get('auth_error') == 'missing':
+                logger.info("Connection rejected: no token for counsellor_%s", self.counsellor_id)
+                await self.close(code=4001)
+            else:
+                logger.info("Connection rejected: invalid token for counsellor_%s", self.counsellor_id)
+                await self.close(code=4002)
             return
-
-        try:
-            # Verify JWT token
-            access_token = AccessToken(token)
-            user_profile = await database_sync_to_async(UserProfile.objects.get)(user_id=access_token['user_id'])
-            if str(user_profile.id) != str(self.counsellor_id):
-                print(f"[WebSocket] Connection rejected: Profile ID {user_profile.id} does not match counsellor_id {self.counsellor_id}")
-                await self.close(code=4003)
-                return
-                
-            print(f"[WebSocket] Connection accepted for counsellor_{self.counsellor_id}")
-            
-        except Exception as e:
-            print(f"[WebSocket] Connection rejected: Invalid token for counsellor_{self.counsellor_id} - {str(e)}")
-            await self.close(code=4002)
+        if str(identity.profile_id) != str(self.counsellor_id):
+            logger.warning(
+                "Connection rejected: profile %s does not match counsellor_%s", identity.profile_id, self.counsellor_id
+            )
+            await self.close(code=4003)
             return
 
+        logger.info("Connection accepted for counsellor_%s", self.counsellor_id)
+
         try:
             # Add to group and accept connection
             await self.channel_layer.group_add(self.group_name, self.channel_name)
@@ -47,19 +55,67 @@ class CounsellorConsumer(AsyncWebsocketConsumer):
                 'type': 'connection_established',
                 'message': 'WebSocket connected successfully'
             }))
+
+            # Replay events this counsellor has not acknowledged yet, e.g. an
+            # incoming call sent while the socket was reconnecting
+            for event in await database_sync_to_async(events.unacked_events)(self.group_name):
+                await self.call_event(events.channel_message(event))
         except Exception as e:
-            print(f"[WebSocket] Error during connection setup for counsellor_{self.counsellor_id}: {str(e)}")
+            logger.error("Error during connection setup for counsellor_%s: %s", self.counsellor_id, e)
             await self.close(code=4004)
+            return
+
+        # Only active counsellors are offered to users as available
+        if identity.role == 'counsellor' and identity.is_active:
+            self.tracks_presence = True
+            try:
+                await presence.amark_online(self.counsellor_id)
+            except Exception as e:
+                logger.warning("Could not record presence for counsellor_%s: %s", self.counsellor_id, e)
+            self.heartbeat_task = asyncio.ensure_future(self.heartbeat())
+
+    async def heartbeat(self):
+        while True:
+            await asyncio.sleep(presence.heartbeat_interval())
+            try:
+                await presence.aheartbeat(self.counsellor_id)
+            except Exception as e:
+                logger.warning("Presence heartbeat failed for counsellor_%s: %s", self.counsellor_id, e)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            message = json.loads(text_data or '{}')
+        except ValueError:
+            return
+        if message.get('type') == 'ping':
+            if self.tracks_presence:
+                try:
+                    await presence.aheartbeat(self.counsellor_id)
+                except Exception as e:
+                    logger.warning("Presence heartbeat failed for counsellor_%s: %s", self.counsellor_id, e)
+            await self.send(text_data=json.dumps({'type': 'pong'}))
+        elif message.get('type') == 'ack':
+            event_ids = message.get('event_ids') or [message.get('event_id')]
+            event_ids = [event_id for event_id in event_ids if isinstance(event_id, int)]
+            if event_ids:
+                await database_sync_to_async(events.ack_events)(self.group_name, event_ids)
 
     async def disconnect(self, close_code):
-        print(f"[WebSocket] Disconnected for counsellor_{self.counsellor_id} with code: {close_code}")
+        logger.info("Disconnected counsellor_%s with code %s", self.counsellor_id, close_code)
+        if self.heartbeat_task:
+            self.heartbeat_task.cancel()
+        if getattr(self, 'tracks_presence', False):
+            try:
+                await presence.amark_offline(self.counsellor_id)
+            except Exception as e:
+                logger.warning("Could not clear presence for counsellor_%s: %s", self.counsellor_id, e)
         # Remove from group
         await self.channel_layer.group_discard(self.group_name, self.channel_name)
 
     # Receive message from room group
     async def call_notification(self, event):
         try:
-            print(f"[WebSocket] Sending call_notification to counsellor_{self.counsellor_id}: {event}")
+            logger.debug("Sending call_notification for booking %s to counsellor_%s", event.get('booking_id'), self.counsellor_id)
             
             # Send message to WebSocket
             await self.send(text_data=json.dumps({
@@ -72,7 +128,16 @@ class CounsellorConsumer(AsyncWebsocketConsumer):
                 'message': f"Incoming call from user {event['user_id']}"
             }))
         except Exception as e:
-            print(f"[WebSocket] Error in call_notification for counsellor_{self.counsellor_id}: {str(e)}")
+            logger.error("Error in call_notification for counsellor_%s: %s", self.counsellor_id, e)
+
+    # Events from dashboard.events: the payload fields at the top level, as
+    # call_notification sends them, with the event type and event_id beside them
+    async def call_event(self, event):
+        await self.send(text_data=json.dumps({
+            **event['data'],
+            'type': event['event'],
+            'event_id': event['event_id'],
+        }))
 
     # Handle other message types
     async def notification_message(self, event):
@@ -80,4 +145,89 @@ class CounsellorConsumer(AsyncWebsocketConsumer):
             'type': 'notification',
             'message': event['message'],
             'title': event.get('title', 'Notification')
-        }))
\ No newline at end of file
+        }))
+
+
+class CallRoomConsumer(AsyncWebsocketConsumer):
+    """
+    Per-booking call room that the user and the counsellor both join at
+    ws/call/<booking_id>/?token=<JWT> (checked by TokenAuthMiddleware).
+    Sends a 'state' snapshot on connect, then pushes joined / left / ended /
+    timeout transitions as they happen, so clients no longer poll the call
+    status endpoints.
+    """
+    role = None
+    ring_task = None
+
+    async def connect(self):
+        self.booking_id = int(self.scope['url_route']['kwargs']['booking_id'])
+        self.group_name = events.call_group(self.booking_id)
+
+        identity = self.scope.get('identity')
+        if identity is None:
+            await self.close(code=4001 if self.scope.get('auth_error') == 'missing' else 4002)
+            return
+
+        booking, role = await database_sync_to_async(call_room.load_booking)(self.booking_id, identity.user_id)
+        if booking is None:
+            await self.close(code=4003)
+            return
+        self.booking, self.role = booking, role
+
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        await call_room.ajoin(self.booking_id, self.role)
+
+        participants = await call_room.apresent(self.booking_id)
+        state = await database_sync_to_async(call_room.snapshot)(self.booking)
+        state['participants'] = participants
+        await self.send(text_data=json.dumps({'type': 'state', 'data': state}))
+        await self.notify_room('joined')
+
+        if self.role == 'user' and 'counsellor' not in participants:
+            self.ring_task = asyncio.ensure_future(self.ring())
+
+    async def ring(self):
+        await asyncio.sleep(call_room.ring_timeout())
+        if 'counsellor' not in await call_room.apresent(self.booking_id):
+            await self.channel_layer.group_send(self.group_name, {
+                'type': 'room.participant', 'event': 'timeout', 'role': 'counsellor', 'sender': None,
+            })
+
+    async def notify_room(self, transition):
+        await self.channel_layer.group_send(self.group_name, {
+            'type': 'room.participant', 'event': transition, 'role': self.role, 'sender': self.channel_name,
+        })
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            message = json.loads(text_data or '{}')
+        except ValueError:
+            return
+        if message.get('type') == 'ping':
+            await call_room.ajoin(self.booking_id, self.role)
+            await self.send(text_data=json.dumps({'type': 'pong'}))
+
+    async def disconnect(self, close_code):
+        if self.ring_task:
+            self.ring_task.cancel()
+        if self.role:
+            await call_room.aleave(self.booking_id, self.role)
+            await self.notify_room('left')
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def room_participant(self, event):
+        if event['sender'] == self.channel_name:
+            return
+        if event['event'] == 'joined' and event['role'] == 'counsellor' and self.ring_task:
+            self.ring_task.cancel()
+        await self.send(text_data=json.dumps({'type': event['event'], 'role': event['role']}))
+
+    # Booking events published through dashboard.events
+    async def call_event(self, event):
+        if event['event'] == 'call_ended':
+            if self.ring_task:
+                self.ring_task.cancel()
+            await self.send(text_data=json.dumps({'type': 'ended', 'data': event['data']}))
+        else:
+            await self.send(text_data=json.dumps({'type': event['event'], 'data': event['data']}))
@@ -0,0 +1,199 @@
+'''
+Precomputed counsellor directory: one "card" per active counsellor with the
+fields the listing screens show, built with a single query (payment settings
+joined in) and kept in the default cache under a version number.
+
+Saving a counsellor profile or payment settings bumps the version (see
+dashboard.signals), which makes every process rebuild the cards on its next
+request. Each process also keeps the cards of the current version in memory,
+so a listing request costs one cache GET of the version number; filtering and
+paging run over the in-memory list.
+'''
+import hashlib
+import logging
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from userdetails.models import UserProfile
+
+from . import presence
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'counsellor-directory:version'
+DEFAULT_DIRECTORY_TIMEOUT = 600  # seconds; also bounds staleness if an invalidation is missed
+
+# UserProfile fields that appear on a card; saves touching only other fields
+# (e.g. fcm_token) leave the directory alone.
+CARD_FIELDS = frozenset([
+    'user_role', 'is_active', 'name', 'gender', 'experience', 'qualification', 'profile_photo',
+])
+
+# (version, cards) last loaded by this process
+_memo = (None, None)
+
+
+def cards_key(version):
+    return f"counsellor-directory:cards:{version}"
+
+
+def directory_timeout():
+    return getattr(settings, 'COUNSELLOR_DIRECTORY_TIMEOUT', DEFAULT_DIRECTORY_TIMEOUT)
+
+
+def build_cards():
+    rows = (
+        UserProfile.objects.filter(user_role='counsellor', is_active=True)
+        .order_by('id')
+        .values(
+            'id', 'user_id', 'name', 'gender', 'experience', 'qualification', 'profile_photo',
+            'payment_settings__session_fee', 'payment_settings__session_duration',
+        )
+    )
+    return [
+        {
+            'id': row['id'],
+            'user_id': row['user_id'],
+            'name': row['name'],
+            'gender': row['gender'],
+            'experience': row['experience'],
+            'qualification': row['qualification'],
+            'profile_photo': default_storage.url(row['profile_photo']) if row['profile_photo'] else None,
+            'session_fee': row['payment_settings__session_fee'],
+            'session_duration': row['payment_settings__session_duration'],
+        }
+        for row in rows
+    ]
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # A time-based start keeps a flushed cache from reusing an old version
+        # number that another process still holds cards for in memory.
+        cache.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def get_directory():
+    '''
+    Returns:
+        tuple: (version, list of card dicts ordered by profile id)
+    '''
+    global _memo
+    try:
+        version = get_version()
+    except Exception as e:
+        logger.warning(f"Counsellor directory cache unavailable, building cards directly: {str(e)}")
+        return None, build_cards()
+    if _memo[0] == version:
+        return _memo
+
+    try:
+        cards = cache.get(cards_key(version))
+    except Exception as e:
+        logger.warning(f"Counsellor directory cache read failed: {str(e)}")
+        cards = None
+    if cards is None:
+        cards = build_cards()
+        try:
+            cache.set(cards_key(version), cards, timeout=directory_timeout())
+        except Exception as e:
+            logger.warning(f"Counsellor directory cache write failed: {str(e)}")
+    _memo = (version, cards)
+    return _memo
+
+
+def invalidate_directory():
+    '''Bump the directory version once the current transaction commits.'''
+    def bump():
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            get_version()
+        except Exception as e:
+            logger.warning(f"Counsellor directory invalidation failed: {str(e)}")
+
+    transaction.on_commit(bump)
+
+
+def _decimal_param(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f"{name} must be a number")
+
+
+def _int_param(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+
+
+def filter_cards(cards, params, statuses=None):
+    '''
+    Filter cards by the query params fee_min, fee_max, gender,
+    experience_min and online. ``statuses`` is the presence map, required for
+    the online filter.
+
+    Raises:
+        ValueError: on a malformed parameter
+    '''
+    fee_min = _decimal_param(params, 'fee_min')
+    fee_max = _decimal_param(params, 'fee_max')
+    experience_min = _int_param(params, 'experience_min')
+    gender = params.get('gender')
+
+    result = []
+    for card in cards:
+        fee = card['session_fee']
+        if fee_min is not None and (fee is None or fee < fee_min):
+            continue
+        if fee_max is not None and (fee is None or fee > fee_max):
+            continue
+        if gender and card['gender'] != gender:
+            continue
+        if experience_min is not None and (card['experience'] or 0) < experience_min:
+            continue
+        if statuses is not None and statuses.get(card['id'], presence.OFFLINE) == presence.OFFLINE:
+            continue
+        result.append(card)
+    return result
+
+
+def render_page(cards, statuses):
+    '''Copy cards for output, adding live presence and a JSON-friendly fee.'''
+    return [
+        dict(
+            card,
+            session_fee=str(card['session_fee']) if card['session_fee'] is not None else None,
+            presence=statuses.get(card['id']) if statuses is not None else None,
+        )
+        for card in cards
+    ]
+
+
+def page_etag(version, query, page):
+    '''
+    Weak ETag for one rendered page: the directory version and query pin the
+    cards, and the page's presence values are hashed in because they change
+    independently of the version.
+    '''
+    digest = hashlib.md5(usedforsecurity=False)
+    digest.update(f"{version}|{query}|".encode('utf-8'))
+    for card in page:
+        digest.update(f"{card['id']}:{card['presence']};".encode('utf-8'))
+    return f'W/"{digest.hexdigest()}"'
@@ -0,0 +1,170 @@
+'''
+Call event bus: the one place views publish real-time call events from.
+
+publish() stores one CallEvent row per recipient group inside the caller's
+transaction and hands the channel-layer sends to a background event loop once
+that transaction commits. The request thread never waits on Redis, and an
+event for a rolled-back state change is never sent.
+
+Sockets acknowledge events by id; whatever is still unacknowledged when a
+socket (re)connects is replayed to it, so clients must de-duplicate on
+event_id.
+'''
+import asyncio
+import logging
+import threading
+from datetime import timedelta
+
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.utils import timezone
+
+from .models import CallEvent
+
+logger = logging.getLogger(__name__)
+
+REPLAY_WINDOW = timedelta(minutes=10)  # older unacked events are stale, e.g. long-gone incoming calls
+MESSAGE_TYPE = 'call.event'  # handled by the consumers' call_event method
+
+_loop = None
+_loop_lock = threading.Lock()
+_pending = set()
+
+
+def counsellor_group(counsellor_id):
+    return f"counsellor_{counsellor_id}"
+
+
+def call_group(booking_id):
+    return f"call_{booking_id}"
+
+
+def booking_groups(booking):
+    '''
+    Groups with a stake in a booking's call, as (durable, transient). The
+    counsellor's socket gets replayable events; the call room sends every
+    participant a fresh state snapshot on connect instead.
+    '''
+    return [counsellor_group(booking.counsellor_id)], [call_group(booking.id)]
+
+
+def channel_message(event):
+    return {
+        'type': MESSAGE_TYPE,
+        'event_id': event.id,
+        'event': event.event_type,
+        'data': event.payload,
+    }
+
+
+def transient_message(event_type, payload):
+    return {
+        'type': MESSAGE_TYPE,
+        'event_id': None,
+        'event': event_type,
+        'data': payload,
+    }
+
+
+def _get_loop():
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='call-event-bus', daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+async def _send(messages):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    for group, message in messages:
+        try:
+            await channel_layer.group_send(group, message)
+        except Exception as e:
+            # Durable events stay unacked and are replayed when the socket reconnects
+            logger.error(f"Failed to send {message['event']} event {message['event_id']} to {group}: {str(e)}")
+
+
+def _dispatch(messages):
+    future = asyncio.run_coroutine_threadsafe(_send(messages), _get_loop())
+    _pending.add(future)
+    future.add_done_callback(_pending.discard)
+
+
+def publish(event_type, payload, groups, booking=None, transient_groups=()):
+    '''
+    Record ``event_type`` for each group and send it after commit.
+
+    Args:
+        event_type: e.g. 'incoming_call', 'call_status', 'call_ended'
+        payload: JSON-serialisable event data
+        groups: Channel-layer groups to deliver to with ack and replay
+        booking: Booking the event belongs to, if any
+        transient_groups: Groups that only get a live send, with no stored row
+
+    Returns:
+        list: The CallEvent rows created
+    '''
+    events = CallEvent.objects.bulk_create([
+        CallEvent(group=group, booking=booking, event_type=event_type, payload=payload)
+        for group in groups
+    ])
+    messages = [(event.group, channel_message(event)) for event in events]
+    messages += [(group, transient_message(event_type, payload)) for group in transient_groups]
+    transaction.on_commit(lambda: _dispatch(messages))
+    return events
+
+
+def publish_booking_event(booking, event_type, payload):
+    durable, transient = booking_groups(booking)
+    return publish(event_type, payload, durable, booking=booking, transient_groups=transient)
+
+
+async def apublish(event_type, payload, groups, booking=None, transient_groups=()):
+    '''
+    publish() for async views. These run in autocommit, so the rows are
+    already committed when the insert returns and the sends are awaited
+    directly instead of being handed to the background loop.
+    '''
+    events = await CallEvent.objects.abulk_create([
+        CallEvent(group=group, booking=booking, event_type=event_type, payload=payload)
+        for group in groups
+    ])
+    messages = [(event.group, channel_message(event)) for event in events]
+    messages += [(group, transient_message(event_type, payload)) for group in transient_groups]
+    await _send(messages)
+    return events
+
+
+async def apublish_booking_event(booking, event_type, payload):
+    durable, transient = booking_groups(booking)
+    return await apublish(event_type, payload, durable, booking=booking, transient_groups=transient)
+
+
+def wait_for_pending(timeout=5):
+    '''Block until every send scheduled so far has finished (for tests and benchmarks).'''
+    for future in list(_pending):
+        future.result(timeout=timeout)
+
+
+def unacked_events(group, since=None):
+    since = since or timezone.now() - REPLAY_WINDOW
+    return list(
+        CallEvent.objects.filter(group=group, acked_at__isnull=True, created_at__gte=since).order_by('id')
+    )
+
+
+def ack_events(group, event_ids):
+    '''Mark events delivered. Only events addressed to ``group`` can be acked from it.'''
+    return CallEvent.objects.filter(
+        id__in=event_ids, group=group, acked_at__isnull=True
+    ).update(acked_at=timezone.now())
+
+
+def purge_events(older_than):
+    '''Delete events created before ``older_than``, acked or not.'''
+    return CallEvent.objects.filter(created_at__lt=older_than).delete()[0]
@@ -0,0 +1,100 @@
+import asyncio
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from dashboard.models import Booking
+from userdetails.models import User, UserProfile
+
+# (label, sync route, async route, who calls it, request body)
+PHASES = [
+    ('initiate-call-notification', 'initiate-call-notification', 'initiate-call-notification-async', 'user',
+     lambda booking_id: {'booking_id': booking_id}),
+    ('call-status joined', 'call-status', 'call-status-async', 'counsellor',
+     lambda booking_id: {'booking_id': booking_id, 'user_role': 'counsellor', 'action': 'joined'}),
+    ('end-call-session', 'end-call-session', 'end-call-session-async', 'user',
+     lambda booking_id: {'booking_id': booking_id, 'ended_by': 'user'}),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync call signalling views with their async versions under concurrent "
+        "load, in process through Django's ASGI handler: latency percentiles, failures and the "
+        "peak number of live threads while each phase runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Bookings driven through each phase')
+        parser.add_argument('--concurrency', type=int, default=50)
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        user = User.objects.create_user(phone_number='+917200000001')
+        counsellor = UserProfile.objects.create(
+            user=User.objects.create_user(phone_number='+917200000002'),
+            phone_number='+917200000002', user_role='counsellor', name='Bench'
+        )
+        bookings = Booking.objects.bulk_create([
+            Booking(user=user, counsellor=counsellor, order_id=f"bench_call_{i}", amount=100, status='wallet_credited')
+            for i in range(count * 2)
+        ])
+        headers = {
+            'user': {'Authorization': f'Bearer {AccessToken.for_user(user)}'},
+            'counsellor': {'Authorization': f'Bearer {AccessToken.for_user(counsellor.user)}'},
+        }
+        booking_ids = {'sync': [b.id for b in bookings[:count]], 'async': [b.id for b in bookings[count:]]}
+
+        try:
+            for label, sync_route, async_route, caller, body in PHASES:
+                for mode, route in (('sync', sync_route), ('async', async_route)):
+                    result = asyncio.run(self.phase(
+                        reverse(route), headers[caller], [body(i) for i in booking_ids[mode]], options['concurrency']
+                    ))
+                    self.report(f"{label} ({mode})", result)
+        finally:
+            User.objects.filter(id__in=[user.id, counsellor.user_id]).delete()
+
+    async def phase(self, url, headers, bodies, concurrency):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+        failures = 0
+        peak_threads = threading.active_count()
+        running = True
+
+        async def sample_threads():
+            nonlocal peak_threads
+            while running:
+                peak_threads = max(peak_threads, threading.active_count())
+                await asyncio.sleep(0.002)
+
+        async def call(body):
+            nonlocal failures
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(url, body, content_type='application/json', headers=headers)
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    failures += 1
+
+        sampler = asyncio.ensure_future(sample_threads())
+        start = time.perf_counter()
+        await asyncio.gather(*[call(body) for body in bodies])
+        elapsed = time.perf_counter() - start
+        running = False
+        await sampler
+        return elapsed, sorted(latencies), failures, peak_threads
+
+    def report(self, label, result):
+        elapsed, latencies, failures, peak_threads = result
+        self.stdout.write(
+            f"{label}: {len(latencies) / elapsed:,.0f} req/s, p50 {statistics.median(latencies) * 1000:.1f}ms, "
+            f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}ms, "
+            f"{failures} failed, peak {peak_threads} threads"
+        )
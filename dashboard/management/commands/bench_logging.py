@@ -0,0 +1,91 @@
+import logging
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from utils.log import JsonFormatter, QueueLogHandler, SamplingFilter
+
+
+class SlowSink:
+    """A stream that discards output after ``latency`` seconds per write, like a slow disk or pipe."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def flush(self):
+        pass
+
+
+def simulated_request(logger, i):
+    # The log calls of one call-path request: a couple of INFO lines and DEBUG detail
+    logger.info("Token request from user %s for userID=%s, roomID=%s", i, i, f"booking_{i}")
+    logger.debug("Booking found: %s, status: %s", i, 'wallet_credited')
+    logger.info("Zego token generated for user %s in room %s", i, f"booking_{i}")
+    logger.debug("Returning %d of %d counsellors", 20, 500)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure per-request logging overhead on the caller's thread: logging off, a "
+        "synchronous JSON StreamHandler, and QueueLogHandler, all writing to a sink with "
+        "--sink-latency per write."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20000)
+        parser.add_argument('--sink-latency', type=float, default=0.0002, help='Seconds per write to the sink')
+        parser.add_argument('--level', default='INFO')
+        parser.add_argument('--sample', type=float, default=1.0, help='Sampling rate for sub-WARNING records')
+
+    def handle(self, *args, **options):
+        logger = logging.getLogger('bench.logging')
+        logger.propagate = False
+        level = getattr(logging, options['level'].upper())
+
+        def run(handler):
+            logger.handlers = [handler] if handler else []
+            logger.setLevel(level if handler else logging.WARNING)
+            latencies = []
+            start = time.perf_counter()
+            for i in range(options['requests']):
+                t = time.perf_counter()
+                simulated_request(logger, i)
+                latencies.append(time.perf_counter() - t)
+            return time.perf_counter() - start, sorted(latencies)
+
+        def report(label, result, extra=''):
+            elapsed, latencies = result
+            self.stdout.write(
+                f"{label}: {elapsed:.2f}s, {elapsed / len(latencies) * 1e6:.1f}us/request, "
+                f"p50 {statistics.median(latencies) * 1e6:.1f}us, "
+                f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1e6:.1f}us{extra}"
+            )
+
+        sampling = SamplingFilter({'bench': options['sample']})
+        report('logging off', run(None))
+
+        sink = SlowSink(options['sink_latency'])
+        handler = logging.StreamHandler(sink)
+        handler.setFormatter(JsonFormatter())
+        handler.addFilter(sampling)
+        report('synchronous StreamHandler', run(handler), f", {sink.writes} writes")
+
+        sink = SlowSink(options['sink_latency'])
+        handler = QueueLogHandler(stream=sink)
+        handler.setFormatter(JsonFormatter())
+        handler.addFilter(sampling)
+        result = run(handler)
+        queued_at = time.perf_counter()
+        handler.close()
+        report(
+            'QueueLogHandler', result,
+            f", {sink.writes} writes ({handler.dropped} dropped on a full queue), "
+            f"listener drained the rest in {time.perf_counter() - queued_at:.2f}s"
+        )
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from dashboard.models import PushNotification
+from dashboard.notifications import FakeTransport, process_pending_pushes
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure push queue throughput offline: enqueue notifications, drain them through "
+        "FakeTransport and delete them again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=5000)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--latency', type=float, default=0.15, help='Simulated FCM round trip per batch, seconds')
+
+    def handle(self, *args, **options):
+        count = options['count']
+        start = time.perf_counter()
+        rows = PushNotification.objects.bulk_create([
+            PushNotification(token=f"bench-token-{i}", data={'type': 'bench', 'n': i}) for i in range(count)
+        ], batch_size=1000)
+        ids = [row.id for row in rows]
+        self.stdout.write(f"Enqueued {count} in {time.perf_counter() - start:.2f}s")
+
+        transport = FakeTransport(latency=options['latency'])
+        start = time.perf_counter()
+        try:
+            while process_pending_pushes(batch_size=options['batch_size'], transport=transport):
+                pass
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"Sent {len(transport.sent)} in {elapsed:.2f}s ({len(transport.sent) / elapsed:,.0f} pushes/s); "
+                f"one send per message at the same latency would take {count * options['latency']:.0f}s"
+            )
+        finally:
+            PushNotification.objects.filter(id__in=ids).delete()
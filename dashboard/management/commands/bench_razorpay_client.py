@@ -0,0 +1,50 @@
+import statistics
+import time
+
+import razorpay
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from utils.fake_razorpay import FakeRazorpayServer
+from utils.razorpay_client import build_razorpay_client
+
+
+class Command(BaseCommand):
+    help = "Compare a fresh Razorpay client per request against the shared keep-alive client, offline."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Order create calls per mode')
+        parser.add_argument('--base-url', help='Gateway to call instead of the bundled local fake server')
+
+    def create_orders(self, make_client, count):
+        timings = []
+        for i in range(count):
+            start = time.perf_counter()
+            make_client().order.create(data={'amount': 5000, 'currency': 'INR', 'receipt': f'bench_{i}'})
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def report(self, label, timings):
+        timings = sorted(timings)
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        self.stdout.write(
+            f"{label:<22} mean={statistics.mean(timings):.3f}ms "
+            f"p50={statistics.median(timings):.3f}ms p99={p99:.3f}ms "
+            f"throughput={1000 * len(timings) / sum(timings):.0f} req/s"
+        )
+
+    def run(self, base_url, count):
+        auth = (settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET)
+        shared = build_razorpay_client(base_url=base_url)
+        self.report('client per request', self.create_orders(
+            lambda: razorpay.Client(auth=auth, base_url=base_url), count
+        ))
+        self.report('shared pooled client', self.create_orders(lambda: shared, count))
+
+    def handle(self, *args, **options):
+        if options['base_url']:
+            self.run(options['base_url'], options['requests'])
+            return
+        with FakeRazorpayServer() as server:
+            self.stdout.write(f"Fake gateway listening on {server.base_url}")
+            self.run(server.base_url, options['requests'])
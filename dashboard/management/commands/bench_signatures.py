@@ -0,0 +1,58 @@
+import hashlib
+import hmac
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from utils.signatures import SignatureVerifier
+
+
+class Command(BaseCommand):
+    help = "Measure Razorpay signature verifications per second on a single core."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200000)
+        parser.add_argument('--batch-size', type=int, default=500, help='Webhook payloads per batch call')
+
+    def rate(self, label, count, func):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"{label:<34} {count / elapsed:>12,.0f} verifications/s")
+
+    def handle(self, *args, **options):
+        secret = 'bench_secret_0123456789abcdef'
+        iterations = options['iterations']
+        verifier = SignatureVerifier(secret)
+        order_id, payment_id = 'order_Q1w2e3r4t5y6u7', 'pay_A1s2d3f4g5h6j7'
+        signature = verifier.sign(f"{order_id}|{payment_id}")
+
+        def legacy():
+            # What VerifyPaymentView used to do inline
+            for _ in range(iterations):
+                generated = hmac.new(
+                    key=secret.encode('utf-8'),
+                    msg=f"{order_id}|{payment_id}".encode('utf-8'),
+                    digestmod=hashlib.sha256
+                ).hexdigest()
+                generated == signature
+
+        def payment():
+            for _ in range(iterations):
+                verifier.verify_payment(order_id, payment_id, signature)
+
+        body = json.dumps({
+            'event': 'payment.captured',
+            'payload': {'payment': {'entity': {'id': payment_id, 'order_id': order_id, 'amount': 25000}}},
+        }).encode('utf-8')
+        batch = [(body, verifier.sign(body))] * options['batch_size']
+        batches = max(1, iterations // options['batch_size'])
+
+        def webhooks():
+            for _ in range(batches):
+                verifier.verify_webhook_batch(batch)
+
+        self.rate('hmac.new per call (previous code)', iterations, legacy)
+        self.rate('SignatureVerifier.verify_payment', iterations, payment)
+        self.rate('SignatureVerifier webhook batch', batches * len(batch), webhooks)
@@ -0,0 +1,68 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Runs in a fresh interpreter so imports and SDK set-up are not already cached
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+setup = time.perf_counter() - start
+
+eager = {eager}
+start = time.perf_counter()
+if eager:
+    from utils.services import services
+    for name in services.names():
+        services.get(name)
+init = time.perf_counter() - start
+
+from django.test import Client
+start = time.perf_counter()
+response = Client().get({path!r})
+first_request = time.perf_counter() - start
+print(json.dumps({{
+    'setup': setup, 'init': init, 'first_request': first_request, 'status': response.status_code,
+    'loaded': [name for name in ('firebase_admin', 'firebase_admin.messaging', 'razorpay') if name in sys.modules],
+}}))
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure process start-up: django.setup() and the first request through the test client, "
+        "each in a fresh interpreter. 'eager' builds every utils.services SDK client right after "
+        "setup, as settings and the view modules used to at import; 'lazy' leaves them to first use."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Fresh processes per mode')
+        parser.add_argument('--path', default='/metrics/', help='Path of the first request')
+
+    def handle(self, *args, **options):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', settings.SETTINGS_MODULE)}
+        for mode in ('eager', 'lazy'):
+            probe = PROBE.format(eager=mode == 'eager', path=options['path'])
+            runs = []
+            for _ in range(options['runs']):
+                result = subprocess.run(
+                    [sys.executable, '-c', probe], env=env, cwd=settings.BASE_DIR,
+                    capture_output=True, text=True, check=True
+                )
+                runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+            def median_ms(key):
+                return statistics.median(run[key] for run in runs) * 1000
+
+            self.stdout.write(
+                f"{mode}: django.setup() {median_ms('setup'):.0f}ms, SDK init {median_ms('init'):.0f}ms, "
+                f"first request {median_ms('first_request'):.0f}ms (HTTP {runs[-1]['status']}), "
+                f"startup to first response {median_ms('setup') + median_ms('init') + median_ms('first_request'):.0f}ms; "
+                f"loaded after first request: {', '.join(runs[-1]['loaded']) or 'none'}"
+            )
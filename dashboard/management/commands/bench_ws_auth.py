@@ -0,0 +1,80 @@
+import asyncio
+import statistics
+import time
+
+from channels.db import database_sync_to_async
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.tokens import AccessToken
+
+from dashboard.middleware import TokenAuthMiddleware, clear_identities
+from userdetails.models import User, UserProfile
+
+
+async def legacy_handshake(scope, receive, send):
+    # What CounsellorConsumer.connect did per connection before TokenAuthMiddleware
+    token = scope['query_string'].decode().split('token=')[1]
+    access_token = AccessToken(token)
+    await database_sync_to_async(UserProfile.objects.get)(user_id=access_token['user_id'])
+
+
+async def accept(scope, receive, send):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate a reconnect storm against the WebSocket handshake: --connections handshakes "
+        "spread over --users counsellors, --concurrency at a time, comparing per-connection "
+        "token decoding and profile lookups with TokenAuthMiddleware (cold and warm)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=10000)
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=200)
+
+    def handle(self, *args, **options):
+        users = User.objects.bulk_create([
+            User(phone_number=f"+9170{i:08d}") for i in range(options['users'])
+        ], batch_size=1000)
+        users = list(User.objects.filter(phone_number__in=[user.phone_number for user in users]))
+        UserProfile.objects.bulk_create([
+            UserProfile(user=user, phone_number=user.phone_number, user_role='counsellor') for user in users
+        ], batch_size=1000)
+        tokens = [str(AccessToken.for_user(user)) for user in users]
+        scopes = [
+            {'type': 'websocket', 'query_string': f"token={tokens[i % len(tokens)]}".encode()}
+            for i in range(options['connections'])
+        ]
+
+        try:
+            clear_identities()
+            self.report('per-connection lookup', asyncio.run(self.storm(legacy_handshake, scopes, options)))
+            self.report('middleware, cold cache', asyncio.run(self.storm(TokenAuthMiddleware(accept), scopes, options)))
+            self.report('middleware, warm cache', asyncio.run(self.storm(TokenAuthMiddleware(accept), scopes, options)))
+        finally:
+            clear_identities()
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+
+    async def storm(self, app, scopes, options):
+        semaphore = asyncio.Semaphore(options['concurrency'])
+        latencies = []
+
+        async def handshake(scope):
+            async with semaphore:
+                start = time.perf_counter()
+                await app(dict(scope), None, None)
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[handshake(scope) for scope in scopes])
+        return time.perf_counter() - start, latencies
+
+    def report(self, label, result):
+        elapsed, latencies = result
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        self.stdout.write(
+            f"{label}: {len(latencies)} handshakes in {elapsed:.2f}s ({len(latencies) / elapsed:,.0f}/s), "
+            f"p50 {statistics.median(latencies) * 1000:.2f}ms, p99 {p99 * 1000:.2f}ms"
+        )
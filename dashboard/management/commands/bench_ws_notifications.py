@@ -0,0 +1,161 @@
+import asyncio
+import json
+import logging
+import random
+import statistics
+import time
+import tracemalloc
+
+from channels.layers import DEFAULT_CHANNEL_LAYER, InMemoryChannelLayer, channel_layers, get_channel_layer
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.tokens import AccessToken
+
+from asgiref.testing import ApplicationCommunicator
+from dashboard import events
+from dashboard.consumers import CounsellorConsumer
+from dashboard.middleware import TokenAuthMiddleware, clear_identities
+from userdetails.models import User, UserProfile
+
+BENCH_EVENT = 'bench_notification'
+
+
+def percentile(values, fraction):
+    return values[max(0, int(len(values) * fraction) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the counsellor notification socket: open --sockets CounsellorConsumer "
+        "connections through TokenAuthMiddleware, send --notifications call events to random "
+        "counsellor groups at --rate per second, and report connect latency, delivery latency "
+        "and memory per socket. Uses the configured channel layer, or --layer memory; the "
+        "in-memory layer scans every channel on each receive, so it understates a Redis-backed node."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sockets', type=int, default=2000)
+        parser.add_argument('--notifications', type=int, default=5000)
+        parser.add_argument('--rate', type=float, default=1000, help='Notifications per second')
+        parser.add_argument('--concurrency', type=int, default=100, help='Handshakes in flight at once')
+        parser.add_argument('--layer', choices=['configured', 'memory'], default='configured')
+        parser.add_argument('--skip-memory', action='store_true',
+                            help='Do not trace allocations while connecting (faster, no memory figure)')
+
+    def handle(self, *args, **options):
+        if options['layer'] == 'memory':
+            channel_layers.set(DEFAULT_CHANNEL_LAYER, InMemoryChannelLayer(capacity=1000))
+
+        users = User.objects.bulk_create([
+            User(phone_number=f"+9171{i:08d}") for i in range(options['sockets'])
+        ], batch_size=1000)
+        users = list(User.objects.filter(phone_number__in=[user.phone_number for user in users]))
+        profiles = UserProfile.objects.bulk_create([
+            UserProfile(user=user, phone_number=user.phone_number, user_role='counsellor') for user in users
+        ], batch_size=1000)
+        profiles = list(UserProfile.objects.filter(user__in=users).select_related('user'))
+        self.stdout.write(f"Created {len(profiles)} counsellors; layer {type(get_channel_layer()).__name__}")
+
+        # The consumer logs a line per connect and disconnect
+        logging.getLogger('dashboard.consumers').setLevel(logging.WARNING)
+        try:
+            asyncio.run(self.run(profiles, options))
+        finally:
+            clear_identities()
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+
+    async def run(self, profiles, options):
+        app = TokenAuthMiddleware(CounsellorConsumer.as_asgi())
+        semaphore = asyncio.Semaphore(options['concurrency'])
+        sockets = {}
+        connect_latencies = []
+        failed = 0
+
+        async def connect(profile):
+            nonlocal failed
+            communicator = ApplicationCommunicator(app, {
+                'type': 'websocket',
+                'path': f'/ws/counsellor/{profile.id}/',
+                'query_string': f'token={AccessToken.for_user(profile.user)}'.encode(),
+                'headers': [],
+                'subprotocols': [],
+                'url_route': {'kwargs': {'counsellor_id': str(profile.id)}},
+            })
+            async with semaphore:
+                start = time.perf_counter()
+                await communicator.send_input({'type': 'websocket.connect'})
+                accepted = await communicator.receive_output(30)
+                if accepted['type'] != 'websocket.accept':
+                    failed += 1
+                    return
+                await communicator.receive_output(30)  # connection_established
+                connect_latencies.append(time.perf_counter() - start)
+            sockets[profile.id] = communicator
+
+        if not options['skip_memory']:
+            tracemalloc.start()
+            baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        await asyncio.gather(*[connect(profile) for profile in profiles])
+        connect_elapsed = time.perf_counter() - start
+        if not options['skip_memory']:
+            per_socket = (tracemalloc.get_traced_memory()[0] - baseline) / max(1, len(sockets))
+            tracemalloc.stop()
+
+        connect_latencies.sort()
+        self.stdout.write(
+            f"Connected {len(sockets)} sockets ({failed} rejected) in {connect_elapsed:.2f}s; "
+            f"connect p50 {statistics.median(connect_latencies) * 1000:.1f}ms, "
+            f"p99 {percentile(connect_latencies, 0.99) * 1000:.1f}ms"
+        )
+        if not options['skip_memory']:
+            self.stdout.write(f"Python heap per socket: {per_socket / 1024:.1f} KiB (consumer, scope, queues, layer state)")
+
+        delivery_latencies = []
+        expected = options['notifications']
+        done = asyncio.Event()
+
+        async def listen(communicator):
+            while True:
+                message = await communicator.receive_output(timeout=3600)
+                if message['type'] != 'websocket.send':
+                    return
+                payload = json.loads(message['text'])
+                if payload.get('type') == BENCH_EVENT:
+                    delivery_latencies.append(time.perf_counter() - payload['data']['sent_at'])
+                    if len(delivery_latencies) >= expected:
+                        done.set()
+
+        listeners = [asyncio.ensure_future(listen(communicator)) for communicator in sockets.values()]
+        layer = get_channel_layer()
+        counsellor_ids = list(sockets)
+        interval = 1 / options['rate']
+        start = time.perf_counter()
+        for i in range(expected):
+            delay = start + i * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            message = events.transient_message(BENCH_EVENT, {'sent_at': time.perf_counter()})
+            await layer.group_send(events.counsellor_group(random.choice(counsellor_ids)), message)
+        send_elapsed = time.perf_counter() - start
+
+        try:
+            await asyncio.wait_for(done.wait(), timeout=30)
+        except asyncio.TimeoutError:
+            pass
+        delivery_latencies.sort()
+        if delivery_latencies:
+            self.stdout.write(
+                f"Delivered {len(delivery_latencies)}/{expected} notifications sent over {send_elapsed:.2f}s "
+                f"({expected / send_elapsed:,.0f}/s); delivery p50 "
+                f"{statistics.median(delivery_latencies) * 1000:.2f}ms, "
+                f"p99 {percentile(delivery_latencies, 0.99) * 1000:.2f}ms, "
+                f"max {delivery_latencies[-1] * 1000:.2f}ms"
+            )
+        else:
+            self.stdout.write(f"Delivered 0/{expected} notifications")
+
+        for listener in listeners:
+            listener.cancel()
+        for communicator in sockets.values():
+            await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await asyncio.gather(*[communicator.wait(30) for communicator in sockets.values()], return_exceptions=True)
@@ -0,0 +1,54 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from utils.zego_service import ZegoTokenService
+from utils.zego_token import generate_token04
+
+APP_ID = 123456789
+SECRET = 'bench_secret_0123456789abcdefghi'[:32]
+PAYLOAD = ZegoTokenService.payload('booking_1')
+
+
+def mint_many(count):
+    start = time.perf_counter()
+    for i in range(count):
+        generate_token04(APP_ID, str(i), SECRET, 3600, PAYLOAD)
+    return time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = "Measure Zego token minting throughput per core, with and without the token cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000)
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+
+        elapsed = mint_many(iterations)
+        self.stdout.write(f"{'generate_token04, 1 core':<34} {iterations / elapsed:>12,.0f} tokens/s")
+
+        service = ZegoTokenService(APP_ID, SECRET)
+        pairs = [(str(i), 'booking_1') for i in range(100)]
+        service.get_tokens(pairs)
+        start = time.perf_counter()
+        for _ in range(iterations // len(pairs)):
+            service.get_tokens(pairs)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"{'ZegoTokenService cache hits':<34} {iterations / elapsed:>12,.0f} tokens/s")
+
+        processes = options['processes']
+        per_process = iterations // processes
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            busy = list(pool.map(mint_many, [per_process] * processes))
+        wall = time.perf_counter() - start
+        total = per_process * processes
+        self.stdout.write(
+            f"{f'generate_token04, {processes} processes':<34} {total / wall:>12,.0f} tokens/s "
+            f"({per_process / max(busy):,.0f} tokens/s per core)"
+        )
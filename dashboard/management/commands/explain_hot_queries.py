@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from counsellorapp.views import RecentActivityView
+from dashboard.models import Booking, CallRequest
+
+# Plan fragments that mean the database answered the query from an index
+INDEX_MARKERS = {
+    'postgresql': ('Index Scan', 'Index Only Scan', 'Bitmap Index Scan'),
+    'sqlite': ('USING INDEX', 'USING COVERING INDEX', 'USING INTEGER PRIMARY KEY'),
+}
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN the booking/call hot-path queries and fail if any of them is not served by an index."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--counsellor', type=int, default=1, help='Counsellor profile id to plan the queries with')
+        parser.add_argument(
+            '--disable-seqscan', action='store_true',
+            help='PostgreSQL only: discourage sequential scans so small development tables '
+                 'still show whether an index is usable'
+        )
+        parser.add_argument('--verbose-plans', action='store_true', help='Print the full plan of every query')
+
+    def hot_queries(self, counsellor_id):
+        now = timezone.now()
+        return [
+            ('ActiveBookingView', CallRequest.objects.filter(
+                counsellor_id=counsellor_id, status__in=['PENDING', 'ACCEPTED']
+            ).order_by('-requested_at')[:1]),
+            ('UpcomingSessionsView', Booking.objects.filter(
+                counsellor_id=counsellor_id, scheduled_at__gte=now, status='scheduled'
+            ).order_by('scheduled_at')),
+            *zip(
+                ('RecentActivityView completed', 'RecentActivityView new'),
+                RecentActivityView.activity_querysets(counsellor_id)
+            ),
+            ('VerifyPaymentView', Booking.objects.filter(order_id='order_explain')),
+            ('BookingPaymentDetailsAPIView', Booking.objects.order_by('-created_at', '-id')[:51]),
+            ('CallRequestDetailsAPIView', CallRequest.objects.order_by('-requested_at', '-id')[:51]),
+        ]
+
+    def handle(self, *args, **options):
+        markers = INDEX_MARKERS.get(connection.vendor)
+        if markers is None:
+            raise CommandError(f"Unsupported database backend: {connection.vendor}")
+
+        failures = []
+        with transaction.atomic():
+            if options['disable_seqscan'] and connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+
+            for name, queryset in self.hot_queries(options['counsellor']):
+                plan = queryset.explain()
+                uses_index = any(marker in plan for marker in markers)
+                if uses_index:
+                    self.stdout.write(self.style.SUCCESS(f"[index] {name}"))
+                else:
+                    failures.append(name)
+                    self.stdout.write(self.style.ERROR(f"[no index] {name}"))
+                if options['verbose_plans'] or not uses_index:
+                    self.stdout.write(plan)
+
+        if failures:
+            raise CommandError(f"Queries not using an index: {', '.join(failures)}")
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from dashboard.payments import process_pending_webhook_events
+
+
+class Command(BaseCommand):
+    help = "Drain the Razorpay webhook inbox, crediting wallets for captured payments."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to sleep when the inbox is empty')
+        parser.add_argument('--once', action='store_true', help='Drain the inbox once and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_pending_webhook_events(batch_size=options['batch_size'])
+            if processed:
+                self.stdout.write(f"Processed {processed} webhook event(s)")
+                continue
+            if options['once']:
+                return
+            time.sleep(options['interval'])
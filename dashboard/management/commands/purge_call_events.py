@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from dashboard.events import purge_events
+
+
+class Command(BaseCommand):
+    help = "Delete call events older than the given age; they are past any replay window."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7)
+
+    def handle(self, *args, **options):
+        deleted = purge_events(timezone.now() - timedelta(days=options['days']))
+        self.stdout.write(f"Deleted {deleted} call event(s)")
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from dashboard.notifications import FCM_BATCH_LIMIT, get_transport, process_pending_pushes
+
+
+class Command(BaseCommand):
+    help = "Drain the outbound FCM notification queue in send_each batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=FCM_BATCH_LIMIT)
+        parser.add_argument('--interval', type=float, default=0.5, help='Seconds to sleep when nothing is due')
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit')
+
+    def handle(self, *args, **options):
+        transport = get_transport()
+        while True:
+            handled = process_pending_pushes(batch_size=options['batch_size'], transport=transport)
+            if handled:
+                self.stdout.write(f"Handled {handled} notification(s)")
+                continue
+            if options['once']:
+                return
+            time.sleep(options['interval'])
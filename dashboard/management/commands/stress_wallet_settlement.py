@@ -0,0 +1,107 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.db.models import Sum
+
+from dashboard.models import Booking
+from dashboard.payments import settle_booking
+from userdetails.models import User, UserProfile, Wallet, WalletTransaction
+
+
+class Command(BaseCommand):
+    help = (
+        "Settle thousands of bookings from parallel threads against the configured database and "
+        "check that no wallet update was lost. Creates throwaway users and deletes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bookings', type=int, default=2000)
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--users', type=int, default=10, help='Fewer users means more contention per wallet')
+        parser.add_argument('--counsellors', type=int, default=3)
+        parser.add_argument('--keep', action='store_true', help='Keep the generated rows for inspection')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            raise CommandError("SQLite has no row locks; run this against PostgreSQL.")
+
+        run = uuid.uuid4().hex[:6]
+        amount = Decimal('50.00')
+        users = [
+            User.objects.create_user(phone_number=f"+7{run_digits(run)}{i:04d}") for i in range(options['users'])
+        ]
+        counsellors = []
+        for i in range(options['counsellors']):
+            counsellor_user = User.objects.create_user(phone_number=f"+8{run_digits(run)}{i:04d}")
+            counsellors.append(UserProfile.objects.create(
+                user=counsellor_user, user_role='counsellor', name=f"Stress {run} {i}"
+            ))
+        Wallet.objects.bulk_create([Wallet(user=user, balance=amount * options['bookings']) for user in users])
+        bookings = Booking.objects.bulk_create([
+            Booking(
+                user=users[i % len(users)], counsellor=counsellors[i % len(counsellors)],
+                order_id=f"stress_{run}_{i}", amount=amount, status='wallet_credited', session_duration=20,
+            )
+            for i in range(options['bookings'])
+        ])
+        booking_ids = [booking.id for booking in bookings]
+
+        def settle(booking_id):
+            try:
+                settle_booking(booking_id, Decimal('12.5'))
+            finally:
+                close_old_connections()
+                connection.close()
+
+        self.stdout.write(f"Settling {len(booking_ids)} bookings on {options['threads']} threads...")
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            list(pool.map(settle, booking_ids))
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"Done in {elapsed:.2f}s ({len(booking_ids) / elapsed:.0f} settlements/s)")
+
+        try:
+            self.verify(users, counsellors, booking_ids, amount, options['bookings'])
+        finally:
+            if not options['keep']:
+                User.objects.filter(id__in=[u.id for u in users] + [c.user_id for c in counsellors]).delete()
+
+    def verify(self, users, counsellors, booking_ids, amount, total):
+        errors = []
+        if Booking.objects.filter(id__in=booking_ids).exclude(status='completed').exists():
+            errors.append("some bookings were not completed")
+
+        per_user = {user.id: 0 for user in users}
+        per_counsellor = {c.user_id: 0 for c in counsellors}
+        for user_id, counsellor_user_id in Booking.objects.filter(id__in=booking_ids).values_list(
+            'user_id', 'counsellor__user_id'
+        ):
+            per_user[user_id] += 1
+            per_counsellor[counsellor_user_id] += 1
+
+        wallets = {w.user_id: w for w in Wallet.objects.filter(user_id__in=list(per_user) + list(per_counsellor))}
+        for user_id, count in per_user.items():
+            expected = amount * total - amount * count
+            if wallets[user_id].balance != expected or wallets[user_id].extra_minutes != 7 * count:
+                errors.append(f"user {user_id}: balance {wallets[user_id].balance} != {expected}")
+        for user_id, count in per_counsellor.items():
+            if wallets[user_id].balance != amount * count:
+                errors.append(f"counsellor {user_id}: balance {wallets[user_id].balance} != {amount * count}")
+
+        ledger_total = WalletTransaction.objects.filter(
+            related_booking_id__in=booking_ids, transaction_type='DEPOSIT'
+        ).aggregate(total=Sum('amount'))['total']
+        if ledger_total != amount * total:
+            errors.append(f"ledger deposits {ledger_total} != {amount * total}")
+
+        if errors:
+            raise CommandError("Lost updates detected:\n" + "\n".join(errors))
+        self.stdout.write(self.style.SUCCESS("All wallet balances and ledger rows are consistent."))
+
+
+def run_digits(run):
+    return str(int(run, 16)).zfill(8)[:8]
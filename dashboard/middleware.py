@@ -1,34 +1,148 @@
+'''
+Token authentication for WebSocket handshakes.
+
+TokenAuthMiddleware reads ``?token=<JWT>`` once per connection and puts the
+caller's identity on the scope, so consumers no longer decode the token or
+look the user up themselves:
+
+    scope['identity']    Identity(user_id, profile_id, role, is_active), or None;
+                         the profile fields are None for users without a profile
+    scope['auth_error']  None, 'missing' or 'invalid'
+
+Verified identities are kept in process, keyed by the raw token, until the
+token expires or WS_IDENTITY_CACHE_TIMEOUT passes, whichever is first. A client
+reconnecting with the same token skips both the signature check and the
+database; a miss costs one query, and concurrent misses for the same token
+share it.
+'''
+import asyncio
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import parse_qs
+
 from channels.db import database_sync_to_async
+from django.conf import settings
 from rest_framework_simplejwt.tokens import AccessToken
-from urllib.parse import parse_qs
 
-@database_sync_to_async
-def get_user_from_token(token):
-    from django.contrib.auth.models import AnonymousUser
-    from django.contrib.auth import get_user_model
-    User = get_user_model()
+from userdetails.models import User
+
+DEFAULT_IDENTITY_CACHE_TIMEOUT = 60  # seconds; bounds how long a role or is_active change goes unseen
+DEFAULT_IDENTITY_CACHE_SIZE = 20000
+
+Identity = namedtuple('Identity', ['user_id', 'profile_id', 'role', 'is_active'])
+
+# token -> (identity, expires_at)
+_identities = {}
+_lock = threading.Lock()
+# token -> Future for lookups in flight on this event loop
+_inflight = {}
+
+
+def identity_cache_timeout():
+    return getattr(settings, 'WS_IDENTITY_CACHE_TIMEOUT', DEFAULT_IDENTITY_CACHE_TIMEOUT)
+
+
+def token_from_scope(scope):
+    query_params = parse_qs(scope.get('query_string', b'').decode())
+    return query_params.get('token', [None])[0]
+
+
+def load_identity(token):
+    '''
+    Verify ``token`` and fetch the identity it belongs to in one query.
+
+    Returns:
+        tuple: (Identity or None, expires_at as a unix timestamp)
+    '''
     try:
-        # Validate the JWT token
         access_token = AccessToken(token)
-        user = User.objects.get(id=access_token['user_id'])
-        return user
     except Exception:
-        return AnonymousUser()
+        return None, 0
+    # Left join: users without a profile still authenticate, with profile fields None
+    row = (
+        User.objects.filter(id=access_token['user_id'], is_active=True)
+        .values_list('id', 'profile__id', 'profile__user_role', 'profile__is_active')
+        .first()
+    )
+    if row is None:
+        return None, 0
+    return Identity(*row), min(access_token['exp'], time.time() + identity_cache_timeout())
 
-class QueryAuthTokenMiddleware:
+
+def cached_identity(token, now=None):
+    entry = _identities.get(token)
+    if entry is None:
+        return None
+    identity, expires_at = entry
+    if expires_at <= (now or time.time()):
+        with _lock:
+            _identities.pop(token, None)
+        return None
+    return identity
+
+
+def _store(token, identity, expires_at):
+    max_entries = getattr(settings, 'WS_IDENTITY_CACHE_SIZE', DEFAULT_IDENTITY_CACHE_SIZE)
+    with _lock:
+        if len(_identities) >= max_entries:
+            now = time.time()
+            for stale in [t for t, (_, expires) in _identities.items() if expires <= now]:
+                del _identities[stale]
+            while len(_identities) >= max_entries:
+                # dicts keep insertion order: drop the oldest entry
+                del _identities[next(iter(_identities))]
+        _identities[token] = (identity, expires_at)
+
+
+def forget_user(user_id):
+    '''Drop this process's cached identities for a user, e.g. after a role change.'''
+    with _lock:
+        for token in [t for t, (identity, _) in _identities.items() if identity.user_id == user_id]:
+            del _identities[token]
+
+
+def clear_identities():
+    with _lock:
+        _identities.clear()
+
+
+async def get_identity(token):
+    identity = cached_identity(token)
+    if identity is not None:
+        return identity
+
+    future = _inflight.get(token)
+    if future is not None:
+        return await asyncio.shield(future)
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[token] = future
+    try:
+        identity, expires_at = await database_sync_to_async(load_identity)(token)
+        if identity is not None:
+            _store(token, identity, expires_at)
+        future.set_result(identity)
+    except Exception as e:
+        future.set_exception(e)
+        # Waiters re-raise it; retrieve it here so a lone lookup does not log "never retrieved"
+        future.exception()
+        raise
+    finally:
+        _inflight.pop(token, None)
+    return identity
+
+
+class TokenAuthMiddleware:
     def __init__(self, inner):
         self.inner = inner
 
     async def __call__(self, scope, receive, send):
-        # Extract token from query string
-        query_string = scope.get('query_string', b'').decode()
-        query_params = parse_qs(query_string)
-        token = query_params.get('token', [None])[0]
-
-        if token:
-            # Authenticate user based on token
-            scope['user'] = await get_user_from_token(token)
+        scope = dict(scope)
+        token = token_from_scope(scope)
+        if not token:
+            scope['identity'], scope['auth_error'] = None, 'missing'
         else:
-            scope['user'] = AnonymousUser()
-
-        return await self.inner(scope, receive, send)
\ No newline at end of file
+            scope['identity'] = await get_identity(token)
+            scope['auth_error'] = None if scope['identity'] is not None else 'invalid'
+        return await self.inner(scope, receive, send)
@@ -0,0 +1,44 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0005_booking_session_duration'),
+        ('userdetails', '0023_userprofile_fcm_token'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['counsellor', 'status', 'created_at'], name='booking_cslr_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['counsellor', 'status', 'scheduled_at'], name='booking_cslr_status_sched'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['-created_at', '-id'], name='booking_created_id'),
+        ),
+        migrations.AddIndex(
+            model_name='callrequest',
+            index=models.Index(fields=['counsellor', 'status', 'requested_at'], name='callreq_cslr_status_req'),
+        ),
+        migrations.AddIndex(
+            model_name='callrequest',
+            index=models.Index(condition=models.Q(('status__in', ['PENDING', 'ACCEPTED'])), fields=['counsellor', '-requested_at'], name='callreq_cslr_active'),
+        ),
+        migrations.AddIndex(
+            model_name='callrequest',
+            index=models.Index(fields=['-requested_at', '-id'], name='callreq_requested_id'),
+        ),
+        migrations.AddConstraint(
+            model_name='booking',
+            constraint=models.UniqueConstraint(fields=('order_id',), name='booking_order_id_uniq'),
+        ),
+    ]
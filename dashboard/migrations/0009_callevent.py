@@ -0,0 +1,29 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0008_pushnotification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CallEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group', models.CharField(max_length=100)),
+                ('event_type', models.CharField(max_length=50)),
+                ('payload', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('acked_at', models.DateTimeField(blank=True, null=True)),
+                ('booking', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='call_events', to='dashboard.booking')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('acked_at__isnull', True)), fields=['group', 'id'], name='callevent_unacked')],
+            },
+        ),
+    ]
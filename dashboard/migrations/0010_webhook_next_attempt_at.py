@@ -0,0 +1,27 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:34
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0009_callevent'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='paymentwebhookevent',
+            name='webhook_pending',
+        ),
+        migrations.AddField(
+            model_name='paymentwebhookevent',
+            name='next_attempt_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='paymentwebhookevent',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['next_attempt_at'], name='webhook_pending'),
+        ),
+    ]
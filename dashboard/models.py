@@ -23,6 +23,19 @@ class Booking(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     scheduled_at = models.DateTimeField(null=True, blank=True) 
 
+    class Meta:
+        constraints = [
+            # VerifyPaymentView looks bookings up by Razorpay order id
+            models.UniqueConstraint(fields=['order_id'], name='booking_order_id_uniq'),
+        ]
+        indexes = [
+            # RecentActivityView / UpcomingSessionsView: counsellor + status, newest or soonest first
+            models.Index(fields=['counsellor', 'status', 'created_at'], name='booking_cslr_status_created'),
+            models.Index(fields=['counsellor', 'status', 'scheduled_at'], name='booking_cslr_status_sched'),
+            # Admin booking listing keyset pagination
+            models.Index(fields=['-created_at', '-id'], name='booking_created_id'),
+        ]
+
     def __str__(self):
         return f"Booking {self.order_id} for {self.counsellor.name}"
     
@@ -50,6 +63,18 @@ class CallRequest(models.Model):
     class Meta:
         ordering = ['-requested_at']
         db_table = 'dashboard_callrequest' 
+        indexes = [
+            models.Index(fields=['counsellor', 'status', 'requested_at'], name='callreq_cslr_status_req'),
+            # ActiveBookingView only ever looks for live calls, which are a tiny
+            # fraction of the table, so keep a small partial index just for them.
+            models.Index(
+                fields=['counsellor', '-requested_at'],
+                name='callreq_cslr_active',
+                condition=models.Q(status__in=['PENDING', 'ACCEPTED']),
+            ),
+            # Admin call request listing keyset pagination
+            models.Index(fields=['-requested_at', '-id'], name='callreq_requested_id'),
+        ]
         
     def __str__(self):
         return f"Call Request {self.id} - {self.booking.id} - {self.status}"      
@@ -59,3 +84,83 @@ class CallRequest(models.Model):
  
     
     
+
+
+class PaymentWebhookEvent(models.Model):
+    """Append-only inbox of Razorpay webhook deliveries, drained by process_payment_webhooks."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processed', 'Processed'),
+        ('failed', 'Failed'),
+    ]
+
+    # X-Razorpay-Event-Id; Razorpay redelivers with the same id, so duplicates are dropped on insert
+    event_id = models.CharField(max_length=100, unique=True, null=True, blank=True)
+    event = models.CharField(max_length=50)
+    body = models.TextField()  # Raw request body, exactly as signed
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_attempt_at'], name='webhook_pending', condition=models.Q(status='pending')),
+        ]
+
+    def __str__(self):
+        return f"Webhook {self.event} ({self.event_id}) - {self.status}"
+
+
+class PushNotification(models.Model):
+    """Outbound FCM data message, queued by request handlers and sent by send_push_notifications."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+        ('expired', 'Expired'),
+    ]
+
+    recipient = models.ForeignKey(
+        UserProfile, on_delete=models.SET_NULL, null=True, blank=True, related_name='push_notifications'
+    )
+    token = models.CharField(max_length=255)  # FCM registration token at enqueue time
+    data = models.JSONField()  # FCM data payload; values are sent as strings
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(null=True, blank=True)  # Not worth delivering after this, e.g. a missed call
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_attempt_at'], name='push_pending', condition=models.Q(status='pending')),
+        ]
+
+    def __str__(self):
+        return f"Push to {self.recipient_id} ({self.data.get('type')}) - {self.status}"
+
+
+class CallEvent(models.Model):
+    """
+    Call event addressed to one channel-layer group, kept until a socket in
+    that group acknowledges it so it can be replayed after a reconnect.
+    """
+    group = models.CharField(max_length=100)  # e.g. counsellor_<profile id> or call_<booking id>
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, null=True, blank=True, related_name='call_events')
+    event_type = models.CharField(max_length=50)
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    acked_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['group', 'id'], name='callevent_unacked', condition=models.Q(acked_at__isnull=True)),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} to {self.group} ({'acked' if self.acked_at else 'pending'})"
@@ -0,0 +1,200 @@
+import logging
+import random
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from userdetails.models import UserProfile
+from utils.metrics import external_call
+from utils.services import services
+from .models import PushNotification
+
+logger = logging.getLogger(__name__)
+
+MAX_PUSH_ATTEMPTS = 5
+FCM_BATCH_LIMIT = 500  # messages per send_each call allowed by FCM
+RETRY_BASE_DELAY = 2  # seconds, doubled on every attempt
+RETRY_MAX_DELAY = 300  # seconds
+CLAIM_TIMEOUT = 120  # seconds a claimed batch is kept from other workers while it is sent
+
+
+class SendResult:
+    """Outcome of one message: sent, failed with a retryable error, or failed because the token is dead."""
+
+    def __init__(self, success, error='', dead_token=False):
+        self.success = success
+        self.error = error
+        self.dead_token = dead_token
+
+
+class FirebaseTransport:
+    """Sends through firebase_admin.messaging.send_each, one HTTP batch per call."""
+
+    def send(self, notifications):
+        from firebase_admin import exceptions
+
+        messaging = services.get('firebase_messaging')
+        messages = [
+            messaging.Message(
+                data={key: str(value) for key, value in notification.data.items()},
+                token=notification.token,
+            )
+            for notification in notifications
+        ]
+        # InvalidArgumentError is also raised for bad payloads, so it does not mean the token is dead
+        dead_token_errors = (messaging.UnregisteredError, messaging.SenderIdMismatchError)
+        with external_call('fcm'):
+            batch = messaging.send_each(messages)
+        results = []
+        for response in batch.responses:
+            if response.success:
+                results.append(SendResult(True))
+            else:
+                error = response.exception
+                results.append(SendResult(
+                    False, f"{type(error).__name__}: {error}", dead_token=isinstance(error, dead_token_errors)
+                ))
+        return results
+
+
+class FakeTransport:
+    """
+    Offline stand-in for FCM, for tests and throughput benchmarks. Tokens
+    starting with 'dead' are reported as unregistered and tokens starting
+    with 'flaky' fail with a retryable error.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency  # seconds per batch, like one FCM round trip
+        self.sent = []
+
+    def send(self, notifications):
+        if self.latency:
+            time.sleep(self.latency)
+        results = []
+        for notification in notifications:
+            if notification.token.startswith('dead'):
+                results.append(SendResult(False, 'UnregisteredError: token is not registered', dead_token=True))
+            elif notification.token.startswith('flaky'):
+                results.append(SendResult(False, 'UnavailableError: try again later'))
+            else:
+                self.sent.append(notification)
+                results.append(SendResult(True))
+        return results
+
+
+def get_transport():
+    return import_string(getattr(settings, 'PUSH_TRANSPORT', 'dashboard.notifications.FirebaseTransport'))()
+
+
+def enqueue_push(recipient, data, ttl=None):
+    """
+    Queue an FCM data message for ``recipient`` (a UserProfile). Returns the
+    queued PushNotification, or None if the recipient has no FCM token.
+
+    Args:
+        ttl: Seconds after which the message is dropped instead of sent
+    """
+    if not recipient.fcm_token:
+        return None
+    return PushNotification.objects.create(
+        recipient=recipient,
+        token=recipient.fcm_token,
+        data=data,
+        expires_at=timezone.now() + timedelta(seconds=ttl) if ttl else None,
+    )
+
+
+async def aenqueue_push(recipient, data, ttl=None):
+    """enqueue_push() for async views."""
+    if not recipient.fcm_token:
+        return None
+    return await PushNotification.objects.acreate(
+        recipient=recipient,
+        token=recipient.fcm_token,
+        data=data,
+        expires_at=timezone.now() + timedelta(seconds=ttl) if ttl else None,
+    )
+
+
+def retry_delay(attempts):
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+def prune_dead_tokens(tokens):
+    """Clear dead registration tokens from profiles so they are not pushed to again."""
+    if tokens:
+        UserProfile.objects.filter(fcm_token__in=tokens).update(fcm_token=None)
+
+
+def process_pending_pushes(batch_size=FCM_BATCH_LIMIT, transport=None):
+    """
+    Claim and send up to ``batch_size`` due notifications.
+
+    Rows are claimed with SKIP LOCKED in a short transaction that moves their
+    next_attempt_at past CLAIM_TIMEOUT, so several workers can drain the queue
+    side by side and no row lock or transaction is held while FCM is called.
+    A worker that dies mid-send leaves its rows to be picked up again once the
+    claim runs out. Retryable failures are rescheduled with exponential
+    backoff and jitter; dead tokens are failed immediately and pruned.
+
+    Returns:
+        int: Number of notifications handled in this batch
+    """
+    transport = transport or get_transport()
+    now = timezone.now()
+    with transaction.atomic():
+        notifications = list(
+            PushNotification.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        if not notifications:
+            return 0
+
+        due = []
+        for notification in notifications:
+            if notification.expires_at and notification.expires_at <= now:
+                notification.status = 'expired'
+            else:
+                notification.next_attempt_at = now + timedelta(seconds=CLAIM_TIMEOUT)
+                due.append(notification)
+        PushNotification.objects.bulk_update(notifications, ['status', 'next_attempt_at'])
+
+    dead_tokens = set()
+    for start in range(0, len(due), FCM_BATCH_LIMIT):
+        chunk = due[start:start + FCM_BATCH_LIMIT]
+        try:
+            results = transport.send(chunk)
+        except Exception as e:
+            logger.error(f"Push batch of {len(chunk)} failed: {str(e)}")
+            results = [SendResult(False, f"{type(e).__name__}: {e}")] * len(chunk)
+
+        for notification, result in zip(chunk, results):
+            notification.attempts += 1
+            if result.success:
+                notification.status = 'sent'
+                notification.sent_at = timezone.now()
+                notification.error = ''
+                continue
+            notification.error = result.error
+            if result.dead_token:
+                notification.status = 'failed'
+                dead_tokens.add(notification.token)
+            elif notification.attempts >= MAX_PUSH_ATTEMPTS:
+                notification.status = 'failed'
+            else:
+                notification.next_attempt_at = timezone.now() + retry_delay(notification.attempts)
+
+    with transaction.atomic():
+        PushNotification.objects.bulk_update(due, ['status', 'attempts', 'error', 'next_attempt_at', 'sent_at'])
+        prune_dead_tokens(dead_tokens)
+
+    if dead_tokens:
+        logger.info(f"Pruned {len(dead_tokens)} dead FCM token(s)")
+    return len(notifications)
@@ -0,0 +1,197 @@
+import json
+import logging
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from userdetails.ledger import LedgerEntry, lock_wallets, post_entries
+from .models import Booking, CallRequest, PaymentWebhookEvent
+from .notifications import retry_delay
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_EVENTS = ('payment.captured', 'order.paid')
+MAX_WEBHOOK_ATTEMPTS = 5
+
+
+class PaymentAmountMismatch(Exception):
+    pass
+
+
+def credit_booking_payment(order_id, payment_id, amount_paise=None):
+    """
+    Mark the booking for ``order_id`` as paid and credit its amount to the
+    user's wallet.
+
+    Safe to call any number of times for the same payment, from both the
+    client's VerifyPaymentView call and the webhook worker: the booking row is
+    locked and the wallet is only credited while the booking is still pending.
+
+    Args:
+        amount_paise: Captured amount reported by Razorpay, checked against
+            the booking amount when given
+
+    Returns:
+        tuple: (booking, wallet, credited) where credited is False when the
+        payment had already been applied
+
+    Raises:
+        Booking.DoesNotExist: if no booking exists for the order
+        PaymentAmountMismatch: if amount_paise is not the booking amount
+    """
+    with transaction.atomic():
+        booking = Booking.objects.select_for_update().get(order_id=order_id)
+        wallet = lock_wallets([booking.user_id], create_for=[booking.user_id])[booking.user_id]
+
+        if booking.status != 'pending':
+            if booking.razorpay_payment_id != payment_id:
+                logger.warning(
+                    f"Booking {booking.id} already paid with {booking.razorpay_payment_id}, "
+                    f"ignoring payment {payment_id}"
+                )
+            return booking, wallet, False
+
+        if amount_paise is not None and Decimal(amount_paise) != booking.amount * 100:
+            raise PaymentAmountMismatch(
+                f"Payment {payment_id} captured {amount_paise} paise for booking {booking.id} "
+                f"of {booking.amount}"
+            )
+
+        booking.razorpay_payment_id = payment_id
+        booking.status = 'wallet_credited'
+        booking.save(update_fields=['razorpay_payment_id', 'status'])
+
+        post_entries([
+            LedgerEntry(
+                wallet, 'DEPOSIT', booking.amount, f"Payment for booking {booking.id}",
+                balance_delta=booking.amount, related_booking=booking
+            ),
+        ])
+
+    logger.info(f"Payment {payment_id} credited to wallet for booking {booking.id}, order_id: {order_id}")
+    return booking, wallet, True
+
+
+class InvalidBookingState(Exception):
+    pass
+
+
+def settle_booking(booking_id, actual_duration):
+    """
+    Settle a finished call: move the booking amount from the user's wallet to
+    the counsellor's and credit the unused minutes back to the user.
+
+    Runs in a fixed number of queries: the booking and both wallets are locked
+    (wallets in id order, so concurrent settlements cannot deadlock), each
+    wallet gets one F() UPDATE and all ledger rows go in one bulk_create.
+
+    Args:
+        booking_id: Booking to settle; it must be in the wallet_credited state
+        actual_duration: Minutes actually spent on the call, as a Decimal
+
+    Returns:
+        tuple: (booking, user_wallet, counsellor_wallet, extra_minutes_credited)
+
+    Raises:
+        Booking.DoesNotExist, Wallet.DoesNotExist, InvalidBookingState,
+        userdetails.ledger.InsufficientBalance
+    """
+    with transaction.atomic():
+        booking = Booking.objects.select_for_update(of=('self',)).select_related('counsellor').get(id=booking_id)
+        if booking.status != 'wallet_credited':
+            raise InvalidBookingState(f"Booking {booking_id} is not in wallet_credited state")
+
+        user_id = booking.user_id
+        counsellor_user_id = booking.counsellor.user_id
+        wallets = lock_wallets([user_id, counsellor_user_id], create_for=[counsellor_user_id])
+        user_wallet, counsellor_wallet = wallets[user_id], wallets[counsellor_user_id]
+
+        # Unused session time is credited back as whole extra minutes; the full
+        # booking amount always goes to the counsellor.
+        session_duration = Decimal(str(booking.session_duration or 0))
+        time_remaining = max(Decimal('0.00'), session_duration - actual_duration)
+        extra_minutes = int(time_remaining)
+        amount = booking.amount
+
+        entries = [
+            LedgerEntry(
+                user_wallet, 'TRANSFER', amount,
+                f"Transfer to counsellor for booking {booking.id} (full session cost)",
+                balance_delta=-amount, related_booking=booking
+            ),
+            LedgerEntry(
+                counsellor_wallet, 'DEPOSIT', amount,
+                f"Received from user for booking {booking.id} (full session cost)",
+                balance_delta=amount, related_booking=booking
+            ),
+        ]
+        if extra_minutes > 0:
+            entries.append(LedgerEntry(
+                user_wallet, 'EXTRA_MINUTES_CREDIT', Decimal(str(extra_minutes)),  # Store minutes as amount for transaction log
+                f"Credited {extra_minutes} extra minutes for unused session time for booking {booking.id}",
+                minutes_delta=extra_minutes, related_booking=booking
+            ))
+        post_entries(entries)
+
+        booking.status = 'completed'
+        booking.save(update_fields=['status'])
+        CallRequest.objects.filter(booking=booking).update(
+            status='COMPLETED', ended_at=timezone.now(), updated_at=timezone.now()
+        )
+
+    return booking, user_wallet, counsellor_wallet, extra_minutes
+
+
+def process_webhook_event(event):
+    """
+    Apply one stored webhook event. Must be called with the event row locked.
+    """
+    event.attempts += 1
+    try:
+        body = json.loads(event.body)
+        payment = body['payload']['payment']['entity']
+        credit_booking_payment(payment['order_id'], payment['id'], amount_paise=payment['amount'])
+    except (ValueError, KeyError, TypeError, ArithmeticError, Booking.DoesNotExist, PaymentAmountMismatch) as e:
+        # Malformed payloads, unknown orders and wrong amounts will not fix themselves
+        if isinstance(e, PaymentAmountMismatch):
+            logger.error(f"Webhook event {event.id} not credited: {str(e)}")
+        event.status = 'failed'
+        event.error = f"{type(e).__name__}: {e}"
+    except Exception as e:
+        logger.error(f"Error processing webhook event {event.id}: {str(e)}")
+        event.error = f"{type(e).__name__}: {e}"
+        if event.attempts >= MAX_WEBHOOK_ATTEMPTS:
+            event.status = 'failed'
+        else:
+            # Back off so a database or gateway blip does not use up every attempt at once
+            event.next_attempt_at = timezone.now() + retry_delay(event.attempts)
+    else:
+        event.status = 'processed'
+        event.error = ''
+    event.processed_at = timezone.now()
+    event.save(update_fields=['status', 'attempts', 'error', 'next_attempt_at', 'processed_at'])
+    return event
+
+
+def process_pending_webhook_events(batch_size=100):
+    """
+    Claim and process up to ``batch_size`` due webhook events.
+
+    Rows are claimed with SKIP LOCKED, so several workers can drain the inbox
+    concurrently without processing the same event twice. Events that failed
+    for a transient reason wait for their next_attempt_at.
+
+    Returns:
+        int: Number of events processed in this batch
+    """
+    with transaction.atomic():
+        events = list(
+            PaymentWebhookEvent.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=timezone.now())
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        for event in events:
+            with transaction.atomic():
+                process_webhook_event(event)
+    return len(events)
@@ -0,0 +1,179 @@
+'''
+Counsellor presence: which counsellors currently hold a live WebSocket and
+whether they are on a call.
+
+Presence lives on the default cache's Redis server (the channel layer host),
+one key per counsellor with a TTL, holding the state as a plain string. It
+has its own redis client, since marking a counsellor busy needs SET ... XX,
+which the Django cache API does not offer. CounsellorConsumer writes it on
+connect and refreshes it with a heartbeat; if a worker dies without running
+disconnect, the key simply expires. A missing key means offline. A counsellor with two
+sockets open who closes one shows offline until the other socket's next
+heartbeat.
+'''
+import logging
+import re
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+ONLINE = 'online'
+BUSY = 'busy'
+OFFLINE = 'offline'
+
+DEFAULT_PRESENCE_TTL = 60  # seconds
+DEFAULT_PRESENCE_HEARTBEAT = 20  # seconds; must stay well below the TTL
+
+REDIS_CACHE_BACKEND = 'django.core.cache.backends.redis.RedisCache'
+
+# redis.Redis on the default cache's server, False when that is not Redis
+_redis = None
+_redis_lock = threading.Lock()
+
+
+def presence_ttl():
+    return getattr(settings, 'PRESENCE_TTL', DEFAULT_PRESENCE_TTL)
+
+
+def heartbeat_interval():
+    return getattr(settings, 'PRESENCE_HEARTBEAT', DEFAULT_PRESENCE_HEARTBEAT)
+
+
+def presence_key(counsellor_id):
+    return f"presence:counsellor:{counsellor_id}"
+
+
+def redis_client():
+    '''
+    A redis.Redis for the server in CACHES['default'], or None if the default
+    cache is another backend (development, tests), where presence goes
+    through the Django cache and the conditional update is not atomic.
+    '''
+    global _redis
+    if _redis is None:
+        with _redis_lock:
+            if _redis is None:
+                config = settings.CACHES['default']
+                if config['BACKEND'] != REDIS_CACHE_BACKEND:
+                    _redis = False
+                else:
+                    import redis
+
+                    location = config['LOCATION']
+                    servers = location if isinstance(location, (list, tuple)) else re.split('[;,]', location)
+                    # Writes go to the first server, as in Django's backend
+                    _redis = redis.Redis.from_url(servers[0])
+    return _redis or None
+
+
+def _mark_online(counsellor_id):
+    client = redis_client()
+    if client is None:
+        cache.set(presence_key(counsellor_id), ONLINE, timeout=presence_ttl())
+    else:
+        client.set(presence_key(counsellor_id), ONLINE, ex=presence_ttl())
+
+
+def _heartbeat(counsellor_id):
+    client = redis_client()
+    if client is None:
+        extended = cache.touch(presence_key(counsellor_id), timeout=presence_ttl())
+    else:
+        extended = client.expire(presence_key(counsellor_id), presence_ttl())
+    if not extended:
+        _mark_online(counsellor_id)
+
+
+def _mark_offline(counsellor_id):
+    client = redis_client()
+    if client is None:
+        cache.delete(presence_key(counsellor_id))
+    else:
+        client.delete(presence_key(counsellor_id))
+
+
+def _set_if_present(counsellor_id, state):
+    key = presence_key(counsellor_id)
+    try:
+        client = redis_client()
+        if client is None:
+            if cache.get(key) is not None:
+                cache.set(key, state, timeout=presence_ttl())
+        else:
+            # SET ... XX in one command: a get then set would bring back a
+            # counsellor whose key was deleted or expired in between
+            client.set(key, state, ex=presence_ttl(), xx=True)
+    except Exception as e:
+        logger.warning(f"Presence update to {state} failed for counsellor {counsellor_id}: {str(e)}")
+
+
+async def amark_online(counsellor_id):
+    await sync_to_async(_mark_online, thread_sensitive=True)(counsellor_id)
+
+
+async def aheartbeat(counsellor_id):
+    '''
+    Extend the presence TTL without touching the state, so a heartbeat during
+    a call does not flip a busy counsellor back to online.
+    '''
+    await sync_to_async(_heartbeat, thread_sensitive=True)(counsellor_id)
+
+
+async def amark_offline(counsellor_id):
+    await sync_to_async(_mark_offline, thread_sensitive=True)(counsellor_id)
+
+
+async def _aset_if_present(counsellor_id, state):
+    await sync_to_async(_set_if_present, thread_sensitive=True)(counsellor_id, state)
+
+
+def mark_busy(counsellor_id):
+    '''Flag a connected counsellor as on a call. Offline counsellors stay offline.'''
+    _set_if_present(counsellor_id, BUSY)
+
+
+def mark_available(counsellor_id):
+    '''Flag a connected counsellor as free again after a call.'''
+    _set_if_present(counsellor_id, ONLINE)
+
+
+async def amark_busy(counsellor_id):
+    await _aset_if_present(counsellor_id, BUSY)
+
+
+async def amark_available(counsellor_id):
+    await _aset_if_present(counsellor_id, ONLINE)
+
+
+def get_statuses(counsellor_ids):
+    '''
+    Look up the presence of many counsellors in one round trip.
+
+    Returns:
+        dict: counsellor_id -> ONLINE, BUSY or OFFLINE, or None if the
+        presence store could not be reached
+    '''
+    keys = {presence_key(counsellor_id): counsellor_id for counsellor_id in counsellor_ids}
+    try:
+        client = redis_client()
+        if client is None:
+            found = cache.get_many(list(keys))
+        else:
+            # Stored as plain UTF-8 strings
+            found = {
+                key: value.decode() for key, value in zip(keys, client.mget(list(keys)) if keys else [])
+                if value is not None
+            }
+    except Exception as e:
+        logger.warning(f"Presence lookup failed: {str(e)}")
+        return None
+    return {counsellor_id: found.get(key, OFFLINE) for key, counsellor_id in keys.items()}
+
+
+def get_status(counsellor_id):
+    statuses = get_statuses([counsellor_id])
+    return statuses[counsellor_id] if statuses is not None else None
@@ -5,4 +5,5 @@ from . import consumers
 
 websocket_urlpatterns = [
         re_path(r'ws/counsellor/(?P<counsellor_id>\d+)/?$', consumers.CounsellorConsumer.as_asgi()),
+        re_path(r'ws/call/(?P<booking_id>\d+)/?$', consumers.CallRoomConsumer.as_asgi()),
 ]
@@ -0,0 +1,54 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from counsellorapp.models import CounsellorPayment
+from userdetails.models import UserProfile
+
+from .directory import CARD_FIELDS, invalidate_directory
+from .middleware import forget_user
+
+
+@receiver(pre_save, sender=UserProfile)
+def remember_profile_role(sender, instance, update_fields=None, **kwargs):
+    # The role as stored, so a profile demoted from counsellor still drops out
+    if instance._state.adding:
+        instance._stored_role = None
+    elif update_fields is not None and 'user_role' not in update_fields:
+        instance._stored_role = instance.user_role
+    else:
+        instance._stored_role = (
+            UserProfile.objects.filter(pk=instance.pk).values_list('user_role', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=UserProfile)
+def counsellor_profile_saved(sender, instance, update_fields=None, **kwargs):
+    stored_role = getattr(instance, '_stored_role', instance.user_role)
+    if 'counsellor' not in (stored_role, instance.user_role):
+        return
+    if (
+        stored_role == instance.user_role and
+        update_fields is not None and not CARD_FIELDS.intersection(update_fields)
+    ):
+        return
+    invalidate_directory()
+
+
+@receiver(post_delete, sender=UserProfile)
+def counsellor_profile_deleted(sender, instance, **kwargs):
+    invalidate_directory()
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def profile_identity_changed(sender, instance, update_fields=None, **kwargs):
+    # Other processes pick the change up when their cached entry times out
+    if update_fields is not None and not {'user_role', 'is_active'}.intersection(update_fields):
+        return
+    forget_user(instance.user_id)
+
+
+@receiver(post_save, sender=CounsellorPayment)
+@receiver(post_delete, sender=CounsellorPayment)
+def counsellor_payment_changed(sender, instance, **kwargs):
+    invalidate_directory()
@@ -89,4 +89,940 @@ class InitiateCallViewTest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn('error', response.json())
         self.assertEqual(response.json()['error'], 'Token generation failed: Invalid App ID')
-        mock_generate_token04.assert_called_once()
\ No newline at end of file
+        mock_generate_token04.assert_called_once()
+
+class CreateOrderViewTest(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+        from counsellorapp.models import CounsellorPayment
+        from userdetails.models import UserProfile
+
+        self.client = APIClient()
+        self.user = User.objects.create_user(phone_number='+919100000001', password='password123')
+        counsellor_user = User.objects.create_user(phone_number='+919100000002', password='password123')
+        self.counsellor = UserProfile.objects.create(user=counsellor_user, user_role='counsellor', name='Asha')
+        CounsellorPayment.objects.create(counsellor=self.counsellor, session_fee=250, session_duration=30)
+        admin_user = User.objects.create_user(phone_number='+919100000003', password='password123')
+        UserProfile.objects.create(user=admin_user, user_role='admin', is_approved=True, name='Admin')
+        self.client.force_authenticate(self.user)
+
+    def test_orders_go_through_shared_client(self):
+        from utils.fake_razorpay import FakeRazorpayServer
+        from utils.razorpay_client import build_razorpay_client, get_razorpay_client, set_razorpay_client
+
+        with FakeRazorpayServer() as server:
+            set_razorpay_client(build_razorpay_client(base_url=server.base_url))
+            try:
+                client = get_razorpay_client()
+                for _ in range(2):
+                    response = self.client.post(
+                        reverse('create_order'), {'counsellor_id': self.counsellor.user.id}, format='json'
+                    )
+                    self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+                self.assertIs(get_razorpay_client(), client)
+            finally:
+                set_razorpay_client(None)
+
+        self.assertEqual(len(server.orders), 2)
+        self.assertEqual(Booking.objects.filter(order_id__in=server.orders).count(), 2)
+        self.assertEqual(response.data['amount'], 25000)
+
+
+class VerifyPaymentViewTest(TestCase):
+    def setUp(self):
+        from userdetails.models import UserProfile
+
+        self.user = User.objects.create_user(phone_number='+919100000001', password='password123')
+        counsellor_user = User.objects.create_user(phone_number='+919100000002', password='password123')
+        counsellor = UserProfile.objects.create(user=counsellor_user, user_role='counsellor', name='Asha')
+        self.booking = Booking.objects.create(user=self.user, counsellor=counsellor, order_id='order_abc', amount=250)
+        self.url = reverse('verify-payment')
+
+    def post(self, signature):
+        return Client().post(self.url, {
+            'razorpay_payment_id': 'pay_xyz',
+            'razorpay_order_id': 'order_abc',
+            'razorpay_signature': signature,
+        })
+
+    @patch('dashboard.views.get_razorpay_client')
+    def test_valid_signature_credits_wallet_without_gateway_client(self, mock_get_client):
+        from utils.signatures import SignatureVerifier
+
+        signature = SignatureVerifier(settings.RAZORPAY_KEY_SECRET).sign('order_abc|pay_xyz')
+        response = self.post(signature)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'wallet_credited')
+        self.assertEqual(self.user.wallet.balance, 250)
+        mock_get_client.assert_not_called()
+
+    def test_invalid_signature_is_rejected(self):
+        response = self.post('0' * 64)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'pending')
+
+
+@patch('django.conf.settings.RAZORPAY_WEBHOOK_SECRET', 'whsec_test')
+class RazorpayWebhookTest(TestCase):
+    def setUp(self):
+        from userdetails.models import UserProfile
+
+        self.user = User.objects.create_user(phone_number='+919100000001', password='password123')
+        counsellor_user = User.objects.create_user(phone_number='+919100000002', password='password123')
+        counsellor = UserProfile.objects.create(user=counsellor_user, user_role='counsellor', name='Asha')
+        self.booking = Booking.objects.create(user=self.user, counsellor=counsellor, order_id='order_abc', amount=250)
+        self.url = reverse('payment-webhook')
+
+    def deliver(self, event_id, signature=None, amount=25000):
+        import json
+        from utils.signatures import SignatureVerifier
+
+        body = json.dumps({
+            'event': 'payment.captured',
+            'payload': {'payment': {'entity': {'id': 'pay_xyz', 'order_id': 'order_abc', 'amount': amount}}},
+        })
+        return Client().post(
+            self.url, body, content_type='application/json',
+            HTTP_X_RAZORPAY_SIGNATURE=signature or SignatureVerifier('whsec_test').sign(body),
+            HTTP_X_RAZORPAY_EVENT_ID=event_id,
+        )
+
+    def test_redelivered_events_credit_wallet_once(self):
+        from dashboard.models import PaymentWebhookEvent
+        from dashboard.payments import process_pending_webhook_events
+
+        self.assertEqual(self.deliver('evt_1').status_code, status.HTTP_200_OK)
+        self.assertEqual(self.deliver('evt_1').status_code, status.HTTP_200_OK)
+        self.assertEqual(self.deliver('evt_2').status_code, status.HTTP_200_OK)
+        self.assertEqual(PaymentWebhookEvent.objects.count(), 2)
+
+        self.assertEqual(process_pending_webhook_events(), 2)
+        self.assertFalse(PaymentWebhookEvent.objects.exclude(status='processed').exists())
+        self.assertEqual(self.user.wallet.balance, 250)
+        self.assertEqual(self.user.wallet.transactions.count(), 1)
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.razorpay_payment_id, 'pay_xyz')
+
+    def test_transient_failures_back_off(self):
+        from dashboard.models import PaymentWebhookEvent
+        from dashboard.payments import process_pending_webhook_events
+
+        self.deliver('evt_1')
+        with patch('dashboard.payments.credit_booking_payment', side_effect=ConnectionError('db gone')):
+            self.assertEqual(process_pending_webhook_events(), 1)
+            # Not due again until its backoff has passed
+            self.assertEqual(process_pending_webhook_events(), 0)
+        event = PaymentWebhookEvent.objects.get()
+        self.assertEqual((event.status, event.attempts), ('pending', 1))
+        self.assertGreater(event.next_attempt_at, event.processed_at)
+
+    def test_wrong_amount_is_not_credited(self):
+        from dashboard.models import PaymentWebhookEvent
+        from dashboard.payments import process_pending_webhook_events
+
+        self.deliver('evt_1', amount=100)
+        process_pending_webhook_events()
+        self.assertEqual(PaymentWebhookEvent.objects.get().status, 'failed')
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'pending')
+
+    def test_bad_signature_is_not_stored(self):
+        from dashboard.models import PaymentWebhookEvent
+
+        self.assertEqual(self.deliver('evt_1', signature='0' * 64).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(PaymentWebhookEvent.objects.exists())
+
+
+class EndCallViewTest(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+        from userdetails.models import UserProfile, Wallet
+
+        self.client = APIClient()
+        self.user = User.objects.create_user(phone_number='+919100000001', password='password123')
+        counsellor_user = User.objects.create_user(phone_number='+919100000002', password='password123')
+        counsellor = UserProfile.objects.create(user=counsellor_user, user_role='counsellor', name='Asha')
+        self.counsellor_user = counsellor_user
+        Wallet.objects.create(user=self.user, balance=300)
+        self.booking = Booking.objects.create(
+            user=self.user, counsellor=counsellor, order_id='order_abc', amount=250,
+            status='wallet_credited', session_duration=20
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_settles_booking_in_fixed_number_of_queries(self):
+        with self.assertNumQueries(13):
+            response = self.client.post(
+                reverse('end-call'), {'booking_id': self.booking.id, 'actual_duration': '12.5'}, format='json'
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['user_wallet_balance'], 50)
+        self.assertEqual(response.data['counsellor_wallet_balance'], 250)
+        self.assertEqual(response.data['extra_minutes_credited'], 7)
+        self.user.wallet.refresh_from_db()
+        self.assertEqual((self.user.wallet.balance, self.user.wallet.extra_minutes), (50, 7))
+        self.assertEqual(self.counsellor_user.wallet.balance, 250)
+        self.assertEqual(self.user.wallet.transactions.count(), 2)
+
+    def test_insufficient_balance_changes_nothing(self):
+        self.user.wallet.balance = 100
+        self.user.wallet.save()
+        response = self.client.post(
+            reverse('end-call'), {'booking_id': self.booking.id, 'actual_duration': '20'}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'wallet_credited')
+        self.user.wallet.refresh_from_db()
+        self.assertEqual(self.user.wallet.balance, 100)
+
+
+class WalletViewTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from rest_framework.test import APIClient
+        from userdetails.ledger import LedgerEntry, lock_wallets, post_entries
+        from userdetails.models import Wallet
+
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(phone_number='+919300000001')
+        Wallet.objects.create(user=self.user)
+        self.client.force_authenticate(self.user)
+
+        def deposit(amount):
+            wallet = lock_wallets([self.user.id])[self.user.id]
+            post_entries([LedgerEntry(wallet, 'DEPOSIT', amount, 'top up', balance_delta=amount)])
+        self.deposit = deposit
+
+    def test_pages_through_history_with_cursor(self):
+        for i in range(5):
+            self.deposit(10 + i)
+
+        first = self.client.get(reverse('wallet'), {'page_size': 3}).data
+        second = self.client.get(reverse('wallet'), {'page_size': 3, 'cursor': first['next_cursor']}).data
+
+        amounts = [t['amount'] for t in first['transactions'] + second['transactions']]
+        self.assertEqual(amounts, ['14.00', '13.00', '12.00', '11.00', '10.00'])
+        self.assertIsNone(second['next_cursor'])
+        self.assertEqual(first['wallet']['balance'], '60.00')
+
+    def test_first_page_is_cached_until_ledger_write(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.deposit(10)
+        self.client.get(reverse('wallet'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('wallet'))
+        self.assertEqual(response.data['wallet']['balance'], '10.00')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.deposit(5)
+        response = self.client.get(reverse('wallet'))
+        self.assertEqual(response.data['wallet']['balance'], '15.00')
+        self.assertEqual(len(response.data['transactions']), 2)
+
+    def test_balance_read_before_a_ledger_write_is_not_served_after_it(self):
+        from userdetails.wallet_cache import cache_wallet, get_cached_wallet
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.deposit(10)
+        # A reader misses and loads the balance, then a deposit commits
+        _, version = get_cached_wallet(self.user.id)
+        stale = self.client.get(reverse('wallet'), {'page_size': 5}).data
+        with self.captureOnCommitCallbacks(execute=True):
+            self.deposit(5)
+        # ...before the reader gets round to caching what it loaded
+        cache_wallet(self.user.id, stale, version)
+
+        response = self.client.get(reverse('wallet'))
+        self.assertEqual(response.data['wallet']['balance'], '15.00')
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('wallet'), {'cursor': 'nope'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CounsellorPresenceTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from rest_framework.test import APIClient
+        from userdetails.models import UserProfile
+
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(phone_number='+919400000001')
+        self.client.force_authenticate(self.user)
+        self.counsellors = [
+            UserProfile.objects.create(
+                user=User.objects.create_user(phone_number=f'+91940000001{i}'),
+                user_role='counsellor', name=f'Counsellor {i}', is_active=True
+            )
+            for i in range(3)
+        ]
+
+    def test_presence_states(self):
+        from asgiref.sync import async_to_sync
+        from . import presence
+
+        first, second, third = (c.id for c in self.counsellors)
+        async_to_sync(presence.amark_online)(first)
+        async_to_sync(presence.amark_online)(second)
+        presence.mark_busy(second)
+        presence.mark_busy(third)  # not connected, stays offline
+        async_to_sync(presence.aheartbeat)(second)
+
+        self.assertEqual(
+            presence.get_statuses([first, second, third]),
+            {first: presence.ONLINE, second: presence.BUSY, third: presence.OFFLINE}
+        )
+        async_to_sync(presence.amark_offline)(first)
+        self.assertEqual(presence.get_status(first), presence.OFFLINE)
+
+    def test_availability_and_list_read_presence(self):
+        from asgiref.sync import async_to_sync
+        from . import presence
+
+        online = self.counsellors[0].id
+        async_to_sync(presence.amark_online)(online)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('check-counsellor-availability', args=[online]))
+        self.assertEqual(response.data, {'available': True, 'status': 'online'})
+
+        response = self.client.get(reverse('check-counsellor-availability', args=[self.counsellors[1].id]))
+        self.assertEqual(response.data, {'available': False, 'status': 'offline'})
+
+        # 'counsellor-list' also names an adminapp route, so use the path
+        response = self.client.get('/api/dashboard/counsellors/', {'online': 'true'})
+        self.assertEqual([(c['id'], c['presence']) for c in response.data['results']], [(online, 'online')])
+
+
+class CounsellorDirectoryTest(TestCase):
+    url = '/api/dashboard/counsellors/'
+
+    def setUp(self):
+        from django.core.cache import cache
+        from counsellorapp.models import CounsellorPayment
+        from userdetails.models import UserProfile
+
+        cache.clear()
+        self.profiles = []
+        for i, (gender, experience, fee) in enumerate([('F', 2, 50), ('M', 8, 120), ('F', 12, 300)]):
+            profile = UserProfile.objects.create(
+                user=User.objects.create_user(phone_number=f'+91950000000{i}'),
+                user_role='counsellor', name=f'Counsellor {i}', gender=gender, experience=experience
+            )
+            CounsellorPayment.objects.create(counsellor=profile, session_fee=fee, session_duration=30)
+            self.profiles.append(profile)
+
+    def test_cards_are_built_once_and_filtered_in_memory(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, {'gender': 'F', 'fee_max': '100'})
+        self.assertEqual(response.json()['count'], 1)
+        card = response.json()['results'][0]
+        self.assertEqual(
+            (card['name'], card['session_fee'], card['session_duration'], card['presence']),
+            ('Counsellor 0', '50.00', 30, 'offline')
+        )
+
+        response = self.client.get(self.url, {'experience_min': 5, 'page_size': 1, 'page': 2})
+        self.assertEqual(response.json()['count'], 2)
+        self.assertEqual([c['name'] for c in response.json()['results']], ['Counsellor 2'])
+
+    def test_saves_invalidate_directory(self):
+        self.client.get(self.url)
+        payment = self.profiles[1].payment_settings
+        payment.session_fee = 80
+        with self.captureOnCommitCallbacks(execute=True):
+            payment.save()
+        response = self.client.get(self.url, {'fee_max': '100'})
+        self.assertEqual(response.json()['count'], 2)
+
+    def test_demoted_and_deleted_counsellors_drop_out(self):
+        from userdetails.models import UserProfile
+
+        self.client.get(self.url)
+        # A profile loaded before the demotion still has the counsellor role in memory
+        profile = UserProfile.objects.get(pk=self.profiles[0].pk)
+        profile.user_role = 'user'
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        self.assertEqual(self.client.get(self.url).json()['count'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profiles[1].delete()
+        self.assertEqual(self.client.get(self.url).json()['count'], 1)
+
+        # An FCM token refresh does not touch the cards
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.profiles[0].fcm_token = 'token'
+            self.profiles[0].save(update_fields=['fcm_token'])
+        self.assertEqual(callbacks, [])
+
+    def test_unchanged_page_returns_304(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profiles[0].name = 'Renamed'
+            self.profiles[0].save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_invalid_filter(self):
+        response = self.client.get(self.url, {'fee_min': 'cheap'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ZegoTokenServiceTest(TestCase):
+    def setUp(self):
+        from utils.zego_service import ZegoTokenService
+        self.service = ZegoTokenService(123456789, 'a' * 32, effective_time=3600, refresh_margin=300)
+
+    def test_reuses_tokens_until_refresh_margin(self):
+        first = self.service.get_token('7', 'booking_1')
+        self.assertIs(self.service.get_token('7', 'booking_1'), first)
+        self.assertIsNot(self.service.get_token('7', 'booking_1', privilege=(1, 0)), first)
+
+        with patch('utils.zego_service.time.time', return_value=first.expire_time - 299):
+            self.assertIsNot(self.service.get_token('7', 'booking_1'), first)
+
+    def test_refresh_mints_and_caches_a_new_token(self):
+        first = self.service.get_token('7', 'booking_1')
+        refreshed = self.service.get_token('7', 'booking_1', refresh=True)
+        self.assertNotEqual(refreshed.token, first.token)
+        self.assertIs(self.service.get_token('7', 'booking_1'), refreshed)
+
+    def test_batch_mints_each_participant(self):
+        user_token, counsellor_token = self.service.get_tokens([('7', 'booking_1'), ('9', 'booking_1')])
+        self.assertTrue(user_token.token.startswith('04'))
+        self.assertNotEqual(user_token.token, counsellor_token.token)
+
+    def test_generation_errors_are_raised_and_not_cached(self):
+        from utils.zego_service import ZegoTokenError
+        with self.assertRaises(ZegoTokenError):
+            self.service.get_token('', 'booking_1')
+        self.assertEqual(self.service._tokens, {})
+
+
+class PushNotificationQueueTest(TestCase):
+    def setUp(self):
+        from userdetails.models import UserProfile
+
+        self.profiles = [
+            UserProfile.objects.create(
+                user=User.objects.create_user(phone_number=f'+91960000000{i}'), fcm_token=token
+            )
+            for i, token in enumerate(['good-token', 'dead-token', 'flaky-token'])
+        ]
+
+    def test_batch_sends_retries_and_prunes_dead_tokens(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import PushNotification
+        from .notifications import FakeTransport, enqueue_push, process_pending_pushes
+
+        for profile in self.profiles:
+            enqueue_push(profile, {'type': 'call_notification', 'booking_id': 1})
+        transport = FakeTransport()
+
+        self.assertEqual(process_pending_pushes(transport=transport), 3)
+
+        statuses = dict(PushNotification.objects.values_list('token', 'status'))
+        self.assertEqual(statuses, {'good-token': 'sent', 'dead-token': 'failed', 'flaky-token': 'pending'})
+        self.profiles[1].refresh_from_db()
+        self.assertIsNone(self.profiles[1].fcm_token)
+        flaky = PushNotification.objects.get(token='flaky-token')
+        self.assertEqual(flaky.attempts, 1)
+        self.assertGreater(flaky.next_attempt_at, timezone.now())
+        # Not due yet
+        self.assertEqual(process_pending_pushes(transport=transport), 0)
+
+        PushNotification.objects.filter(pk=flaky.pk).update(
+            next_attempt_at=timezone.now(), expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        process_pending_pushes(transport=transport)
+        self.assertEqual(PushNotification.objects.get(pk=flaky.pk).status, 'expired')
+        self.assertEqual(len(transport.sent), 1)
+
+    def test_rows_are_claimed_before_sending(self):
+        from django.utils import timezone
+        from .models import PushNotification
+        from .notifications import FakeTransport, enqueue_push, process_pending_pushes
+
+        enqueue_push(self.profiles[0], {'type': 'call_notification'})
+
+        class ClaimCheckingTransport(FakeTransport):
+            def send(inner, notifications):
+                # Other workers see the row as not due while FCM is called
+                self.assertFalse(PushNotification.objects.filter(next_attempt_at__lte=timezone.now()).exists())
+                return super().send(notifications)
+
+        self.assertEqual(process_pending_pushes(transport=ClaimCheckingTransport()), 1)
+        self.assertEqual(PushNotification.objects.get().status, 'sent')
+
+    def test_profiles_without_token_are_skipped(self):
+        from .notifications import enqueue_push
+        self.profiles[0].fcm_token = None
+        self.assertIsNone(enqueue_push(self.profiles[0], {'type': 'call_notification'}))
+
+
+class CallEventBusTest(TestCase):
+    def setUp(self):
+        from userdetails.models import UserProfile
+
+        self.user = User.objects.create_user(phone_number='+919700000001')
+        self.counsellor = UserProfile.objects.create(
+            user=User.objects.create_user(phone_number='+919700000002'), user_role='counsellor', name='Asha'
+        )
+        self.booking = Booking.objects.create(
+            user=self.user, counsellor=self.counsellor, order_id='order_evt', amount=100, status='wallet_credited'
+        )
+
+    def test_events_are_sent_after_commit_to_booking_groups(self):
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+        from . import events
+
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(events.counsellor_group(self.counsellor.id), channel)
+
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            created = events.publish_booking_event(self.booking, 'call_ended', {'ended_by': 'user'})
+        self.assertEqual([event.group for event in created], [f'counsellor_{self.counsellor.id}'])
+        for callback in callbacks:
+            callback()
+        events.wait_for_pending()
+
+        message = async_to_sync(layer.receive)(channel)
+        self.assertEqual(message['event'], 'call_ended')
+        self.assertEqual(message['data'], {'ended_by': 'user'})
+        async_to_sync(layer.flush)()
+
+    def test_counsellor_socket_replays_and_acks(self):
+        import json
+        from unittest.mock import AsyncMock, patch
+        from asgiref.sync import async_to_sync
+        from asgiref.testing import ApplicationCommunicator
+        from rest_framework_simplejwt.tokens import AccessToken
+        from .consumers import CounsellorConsumer
+        from .events import publish_booking_event
+        from .middleware import TokenAuthMiddleware
+        from .models import CallEvent
+
+        publish_booking_event(self.booking, 'incoming_call', {'booking_id': self.booking.id})
+        token = AccessToken.for_user(self.counsellor.user)
+
+        async def connect_and_ack():
+            # channels.testing needs daphne, which this project does not install
+            communicator = ApplicationCommunicator(TokenAuthMiddleware(CounsellorConsumer.as_asgi()), {
+                'type': 'websocket',
+                'path': f'/ws/counsellor/{self.counsellor.id}/',
+                'query_string': f'token={token}'.encode(),
+                'headers': [],
+                'subprotocols': [],
+                'url_route': {'kwargs': {'counsellor_id': str(self.counsellor.id)}},
+            })
+
+            async def receive_json():
+                return json.loads((await communicator.receive_output(5))['text'])
+
+            await communicator.send_input({'type': 'websocket.connect'})
+            self.assertEqual((await communicator.receive_output(5))['type'], 'websocket.accept')
+            self.assertEqual((await receive_json())['type'], 'connection_established')
+            replayed = await receive_json()
+            await communicator.send_input({'type': 'websocket.receive', 'text': json.dumps(
+                {'type': 'ack', 'event_id': replayed['event_id']}
+            )})
+            await communicator.send_input({'type': 'websocket.receive', 'text': '{"type": "ping"}'})
+            self.assertEqual((await receive_json())['type'], 'pong')
+            await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await communicator.wait(5)
+            return replayed
+
+        # A presence store error on a client ping must not close the socket
+        with patch('dashboard.presence.aheartbeat', AsyncMock(side_effect=ConnectionError('cache down'))) as heartbeat:
+            replayed = async_to_sync(connect_and_ack)()
+        heartbeat.assert_awaited_once()
+        self.assertEqual(replayed['type'], 'incoming_call')
+        # Payload fields stay at the top level, as call_notification sends them
+        self.assertEqual(replayed['booking_id'], self.booking.id)
+        event = CallEvent.objects.get(id=replayed['event_id'])
+        self.assertIsNotNone(event.acked_at)
+
+
+class CallRoomConsumerTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from userdetails.models import UserProfile
+        from .middleware import clear_identities
+
+        cache.clear()
+        clear_identities()
+        self.user = User.objects.create_user(phone_number='+919800000001')
+        self.counsellor = UserProfile.objects.create(
+            user=User.objects.create_user(phone_number='+919800000002'), user_role='counsellor', name='Asha'
+        )
+        self.stranger = User.objects.create_user(phone_number='+919800000003')
+        self.booking = Booking.objects.create(
+            user=self.user, counsellor=self.counsellor, order_id='order_room', amount=100, status='wallet_credited'
+        )
+
+    def communicator(self, user):
+        from asgiref.testing import ApplicationCommunicator
+        from rest_framework_simplejwt.tokens import AccessToken
+        from .consumers import CallRoomConsumer
+        from .middleware import TokenAuthMiddleware
+
+        return ApplicationCommunicator(TokenAuthMiddleware(CallRoomConsumer.as_asgi()), {
+            'type': 'websocket',
+            'path': f'/ws/call/{self.booking.id}/',
+            'query_string': f'token={AccessToken.for_user(user)}'.encode(),
+            'headers': [],
+            'subprotocols': [],
+            'url_route': {'kwargs': {'booking_id': str(self.booking.id)}},
+        })
+
+    @staticmethod
+    async def receive_json(communicator):
+        import json
+        return json.loads((await communicator.receive_output(5))['text'])
+
+    def test_pushes_transitions_to_the_other_party(self):
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+        from . import events
+
+        async def scenario():
+            user_socket, counsellor_socket = self.communicator(self.user), self.communicator(self.counsellor.user)
+            await user_socket.send_input({'type': 'websocket.connect'})
+            await user_socket.receive_output(5)  # accept
+            state = await self.receive_json(user_socket)
+
+            await counsellor_socket.send_input({'type': 'websocket.connect'})
+            await counsellor_socket.receive_output(5)
+            counsellor_state = await self.receive_json(counsellor_socket)
+            joined = await self.receive_json(user_socket)
+
+            await get_channel_layer().group_send(
+                events.call_group(self.booking.id), events.transient_message('call_ended', {'ended_by': 'user'})
+            )
+            ended = await self.receive_json(user_socket)
+            await self.receive_json(counsellor_socket)
+
+            await counsellor_socket.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await counsellor_socket.wait(5)
+            left = await self.receive_json(user_socket)
+            await user_socket.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await user_socket.wait(5)
+            return state, counsellor_state, joined, ended, left
+
+        state, counsellor_state, joined, ended, left = async_to_sync(scenario)()
+        self.assertEqual(state['type'], 'state')
+        self.assertEqual(state['data']['participants'], ['user'])
+        self.assertEqual(state['data']['call_status'], 'NOT_CREATED')
+        self.assertEqual(counsellor_state['data']['participants'], ['user', 'counsellor'])
+        self.assertEqual(joined, {'type': 'joined', 'role': 'counsellor'})
+        self.assertEqual(ended, {'type': 'ended', 'data': {'ended_by': 'user'}})
+        self.assertEqual(left, {'type': 'left', 'role': 'counsellor'})
+
+    def test_user_alone_gets_timeout(self):
+        from asgiref.sync import async_to_sync
+
+        async def scenario():
+            socket = self.communicator(self.user)
+            await socket.send_input({'type': 'websocket.connect'})
+            await socket.receive_output(5)
+            await self.receive_json(socket)
+            timeout = await self.receive_json(socket)
+            await socket.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await socket.wait(5)
+            return timeout
+
+        with self.settings(CALL_RING_TIMEOUT=0.05):
+            self.assertEqual(async_to_sync(scenario)(), {'type': 'timeout', 'role': 'counsellor'})
+
+    def test_strangers_are_rejected(self):
+        from asgiref.sync import async_to_sync
+
+        async def scenario():
+            socket = self.communicator(self.stranger)
+            await socket.send_input({'type': 'websocket.connect'})
+            return await socket.receive_output(5)
+
+        self.assertEqual(async_to_sync(scenario)(), {'type': 'websocket.close', 'code': 4003})
+
+
+class TokenAuthMiddlewareTest(TestCase):
+    def setUp(self):
+        from rest_framework_simplejwt.tokens import AccessToken
+        from userdetails.models import UserProfile
+        from .middleware import clear_identities
+
+        clear_identities()
+        self.profile = UserProfile.objects.create(
+            user=User.objects.create_user(phone_number='+919900000001'), user_role='counsellor', name='Asha'
+        )
+        self.token = str(AccessToken.for_user(self.profile.user))
+
+    def authenticate(self, query_string, times=1):
+        from asgiref.sync import async_to_sync
+        from .middleware import TokenAuthMiddleware
+
+        scopes = []
+
+        async def inner(scope, receive, send):
+            scopes.append(scope)
+
+        async def handshakes():
+            import asyncio
+            middleware = TokenAuthMiddleware(inner)
+            await asyncio.gather(*[
+                middleware({'type': 'websocket', 'query_string': query_string}, None, None) for _ in range(times)
+            ])
+
+        async_to_sync(handshakes)()
+        return scopes
+
+    def test_identity_comes_from_one_query_and_is_reused(self):
+        from .middleware import Identity
+
+        with self.assertNumQueries(1):
+            scopes = self.authenticate(f'token={self.token}'.encode(), times=20)
+        self.assertEqual(
+            scopes[0]['identity'], Identity(self.profile.user_id, self.profile.id, 'counsellor', True)
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate(f'x=1&token={self.token}'.encode())[0]['identity'].profile_id, self.profile.id)
+
+    def test_profile_changes_drop_the_cached_identity(self):
+        self.authenticate(f'token={self.token}'.encode())
+        self.profile.is_active = False
+        self.profile.save(update_fields=['is_active'])
+        self.assertFalse(self.authenticate(f'token={self.token}'.encode())[0]['identity'].is_active)
+
+    def test_missing_and_invalid_tokens(self):
+        missing, = self.authenticate(b'')
+        invalid, = self.authenticate(b'token=not-a-jwt')
+        self.assertEqual((missing['identity'], missing['auth_error']), (None, 'missing'))
+        self.assertEqual((invalid['identity'], invalid['auth_error']), (None, 'invalid'))
+
+
+class StructuredLoggingTest(TestCase):
+    def test_queue_handler_writes_json_from_the_listener(self):
+        import io
+        import json
+        import logging
+        from utils.log import QueueLogHandler
+
+        stream = io.StringIO()
+        handler = QueueLogHandler(stream=stream)
+        record = logging.LogRecord('dashboard.views', logging.INFO, __file__, 1, 'Booking %s ended', (7,), None)
+        record.booking_id = 7
+        handler.handle(record)
+        handler.close()
+
+        entry = json.loads(stream.getvalue())
+        self.assertEqual(entry['message'], 'Booking 7 ended')
+        self.assertEqual((entry['level'], entry['logger'], entry['booking_id']), ('INFO', 'dashboard.views', 7))
+
+    def test_settings_logging_config_loads_and_writes(self):
+        import io
+        import json
+        import logging
+        import logging.config
+        from django.conf import settings
+
+        logging.config.dictConfig(settings.LOGGING)
+        handler = logging.getLogger('dashboard').handlers[0]
+        stream = io.StringIO()
+        handler.target.setStream(stream)
+        logging.getLogger('dashboard.views').warning('Booking %s ended', 7)
+        handler.close()
+
+        self.assertEqual(json.loads(stream.getvalue())['message'], 'Booking 7 ended')
+        logging.config.dictConfig(settings.LOGGING)
+
+    def test_sampling_uses_the_longest_prefix_and_keeps_warnings(self):
+        import logging
+        from utils.log import SamplingFilter
+
+        sampling = SamplingFilter({'dashboard': 1.0, 'dashboard.consumers': 0.0})
+
+        def record(name, level):
+            return logging.LogRecord(name, level, __file__, 1, 'msg', (), None)
+
+        self.assertFalse(sampling.filter(record('dashboard.consumers', logging.INFO)))
+        self.assertTrue(sampling.filter(record('dashboard.consumers', logging.WARNING)))
+        self.assertTrue(sampling.filter(record('dashboard.views', logging.INFO)))
+        self.assertTrue(sampling.filter(record('userdetails.views', logging.DEBUG)))
+
+
+class RequestMetricsTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from utils.metrics import registry
+
+        cache.clear()
+        registry.reset()
+        self.user = User.objects.create_user(phone_number='+919910000001')
+        self.client.force_login(self.user)
+
+    def test_routes_are_exported_with_query_counts(self):
+        from utils.metrics import external_call, registry
+
+        self.client.get('/api/dashboard/counsellors/')
+        with self.assertRaises(RuntimeError):
+            with external_call('fcm'):
+                raise RuntimeError('unavailable')
+
+        response = self.client.get('/metrics/')
+        body = response.content.decode()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('http_requests_total{route="counsellor-list",method="GET",status="200"} 1', body)
+        self.assertIn('external_call_errors_total{service="fcm",route="background"} 1', body)
+        self.assertGreater(registry.db_queries['counsellor-list'], 0)
+
+    def test_metrics_are_local_only(self):
+        response = self.client.get('/metrics/', REMOTE_ADDR='203.0.113.9')
+        self.assertEqual(response.status_code, 404)
+
+    def test_slow_requests_log_their_sql(self):
+        with self.settings(SLOW_REQUEST_MS=0.001), self.assertLogs('utils.metrics', 'WARNING') as logs:
+            self.client.get('/api/dashboard/counsellors/')
+        record = logs.records[0]
+        self.assertEqual(record.route, 'counsellor-list')
+        self.assertTrue(record.slowest_sql)
+
+
+class AsyncCallViewsTest(TestCase):
+    def setUp(self):
+        from rest_framework_simplejwt.tokens import AccessToken
+        from userdetails.models import UserProfile
+        from userdetails.tokens import tokens_for_user
+
+        self.user = User.objects.create_user(phone_number='+919920000001')
+        self.counsellor = UserProfile.objects.create(
+            user=User.objects.create_user(phone_number='+919920000002'), user_role='counsellor', name='Asha'
+        )
+        self.booking = Booking.objects.create(
+            user=self.user, counsellor=self.counsellor, order_id='order_async', amount=100, status='wallet_credited'
+        )
+        # One caller authenticates from identity claims, the other from the user row
+        self.user_headers = {'Authorization': f'Bearer {tokens_for_user(self.user).access_token}'}
+        self.counsellor_headers = {'Authorization': f'Bearer {AccessToken.for_user(self.counsellor.user)}'}
+
+    async def post(self, name, data, headers):
+        from django.test import AsyncClient
+        return await AsyncClient().post(reverse(name), data, content_type='application/json', headers=headers)
+
+    async def test_call_lifecycle(self):
+        from channels.layers import get_channel_layer
+        from . import events
+        from .models import CallEvent, CallRequest
+
+        layer = get_channel_layer()
+        channel = await layer.new_channel()
+        await layer.group_add(events.counsellor_group(self.counsellor.id), channel)
+
+        response = await self.post(
+            'initiate-call-notification-async', {'booking_id': self.booking.id}, self.user_headers
+        )
+        self.assertEqual(response.status_code, 200)
+        message = await layer.receive(channel)
+        self.assertEqual(message['event'], 'incoming_call')
+        self.assertTrue(await CallEvent.objects.filter(id=message['event_id']).aexists())
+
+        response = await self.post('call-status-async', {
+            'booking_id': self.booking.id, 'user_role': 'counsellor', 'action': 'joined'
+        }, self.counsellor_headers)
+        self.assertEqual(response.json()['call_status'], 'ACCEPTED')
+        self.assertEqual(response.json()['booking_status'], 'completed')
+
+        response = await self.post(
+            'end-call-session-async', {'booking_id': self.booking.id, 'ended_by': 'user'}, self.user_headers
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((await CallRequest.objects.aget(booking=self.booking)).status, 'ENDED')
+        await layer.flush()
+
+    async def test_requires_authentication_and_ownership(self):
+        response = await self.post('end-call-session-async', {'booking_id': self.booking.id}, {})
+        self.assertEqual(response.status_code, 401)
+        response = await self.post(
+            'initiate-call-notification-async', {'booking_id': self.booking.id}, self.counsellor_headers
+        )
+        self.assertEqual(response.status_code, 403)
+
+
+class ServiceRegistryTest(TestCase):
+    def test_services_are_built_once_on_first_use(self):
+        from utils.services import ServiceRegistry
+
+        registry = ServiceRegistry()
+        built = []
+        registry.register('client', lambda: built.append(object()) or built[-1])
+        registry.register('wrapper', lambda: ('wrapped', registry.get('client')))
+
+        self.assertFalse(registry.initialized('client'))
+        wrapper = registry.get('wrapper')
+        self.assertIs(wrapper[1], registry.get('client'))
+        self.assertEqual(len(built), 1)
+
+        registry.set('client', None)
+        self.assertIsNot(registry.get('client'), wrapper[1])
+        self.assertEqual(len(built), 2)
+
+
+class ClaimsPermissionChecksTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from userdetails.models import UserProfile
+
+        cache.clear()
+        self.user = User.objects.create_user(phone_number='+919930000001')
+        self.counsellor = UserProfile.objects.create(
+            user=User.objects.create_user(phone_number='+919930000002'), user_role='counsellor', name='Asha'
+        )
+        self.booking = Booking.objects.create(
+            user=self.user, counsellor=self.counsellor, order_id='order_claims', amount=100, status='wallet_credited'
+        )
+
+    def get_status(self, user, profile=None):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from userdetails.tokens import tokens_for_user
+
+        access = tokens_for_user(user, profile).access_token
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('call-status-check', args=[self.booking.id]), headers={'Authorization': f'Bearer {access}'}
+            )
+        # Role and identity come from the token, not from user or profile rows
+        self.assertFalse([q['sql'] for q in queries if q['sql'].split(' FROM ')[1].startswith('"userdetails_')])
+        return response.status_code
+
+    def test_booking_parties_are_checked_from_claims(self):
+        self.assertEqual(self.get_status(self.counsellor.user, self.counsellor), status.HTTP_200_OK)
+        self.assertEqual(self.get_status(self.user), status.HTTP_200_OK)
+        stranger = User.objects.create_user(phone_number='+919930000003')
+        self.assertEqual(self.get_status(stranger), status.HTTP_403_FORBIDDEN)
+
+
+class ExplainHotQueriesTest(TestCase):
+    def test_view_querysets_are_served_by_indexes(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        out = StringIO()
+        call_command('explain_hot_queries', stdout=out)
+        self.assertIn('[index] RecentActivityView completed', out.getvalue())
+        self.assertIn('[index] RecentActivityView new', out.getvalue())
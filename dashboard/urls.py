@@ -1,13 +1,14 @@
 # urls.py
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenRefreshView
-from . import views
+from . import async_views, views
 from .views import WalletExtraMinutesView
 
 urlpatterns = [
     path('counsellors/', views.CounsellorListView.as_view(), name='counsellor-list'),
     path('payment/create-order/', views.CreateOrderView.as_view(), name='create_order'),
     path('payment/verify-payment/', views.VerifyPaymentView.as_view(), name='verify-payment'),
+    path('payment/webhook/', views.RazorpayWebhookView.as_view(), name='payment-webhook'),
     path('call/initiate/', views.InitiateCallView.as_view(), name='initiate-call'),
     path('wallet/', views.WalletView.as_view(), name='wallet'),
     path('wallet/extra_minutes/', WalletExtraMinutesView.as_view(), name='wallet-extra-minutes'),
@@ -15,6 +16,7 @@ urlpatterns = [
     path('user-problems/', views.UserProblemView.as_view(), name='user-problem'),
     path('profile/', views.UserProfileEditView.as_view(), name='user-profile-edit'),
     path('counsellors/<int:user_id>/', views.CounsellorDetailView.as_view(), name='counsellor-detail'),
+    path('counsellors/<int:counsellor_id>/availability/', views.CheckCounsellorAvailabilityView.as_view(), name='check-counsellor-availability'),
     path('call/end/', views.EndCallView.as_view(), name='end-call'),
     path('generate-zego-token/', views.GenerateZegoTokenView.as_view(), name='generate-zego-token'),
     path('call-status/', views.CallStatusView.as_view(), name='call-status'),
@@ -27,4 +29,9 @@ urlpatterns = [
     path('update-fcm-token/', views.UpdateFCMTokenView.as_view(), name='update-fcm-token'),
     path('save-fcm-token/', views.SaveFcmTokenView.as_view(), name='save-fcm-token'),
     path('renew-token/', views.RenewTokenView.as_view(), name='renew-token'),
+    # Async versions of the call signalling endpoints
+    path('async/call/initiate/', async_views.AsyncInitiateCallView.as_view(), name='initiate-call-async'),
+    path('async/call-status/', async_views.AsyncCallStatusView.as_view(), name='call-status-async'),
+    path('async/initiate-call-notification/', async_views.AsyncInitiateCallNotificationView.as_view(), name='initiate-call-notification-async'),
+    path('async/end-call-session/', async_views.AsyncEndCallSessionView.as_view(), name='end-call-session-async'),
 ]
\ No newline at end of file
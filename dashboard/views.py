@@ -8,16 +8,22 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from django.conf import settings
-import firebase_admin
-from firebase_admin import credentials, auth, messaging
 import logging
 from django.views.decorators.csrf import csrf_exempt
-import razorpay
+from utils.razorpay_client import get_razorpay_client
+from utils.signatures import verify_payment_signature, verify_webhook_signature
 import datetime
 import hmac
 import hashlib
-from .models import Booking, CallRequest
-from userdetails.models import User, UserProfile, OTPAttempt, Wallet, WalletTransaction
+from .models import Booking, CallRequest, PaymentWebhookEvent
+from . import directory, events, presence
+from .notifications import enqueue_push
+from .payments import WEBHOOK_EVENTS, InvalidBookingState, credit_booking_payment, settle_booking
+from userdetails.ledger import InsufficientBalance
+from userdetails.models import User, UserProfile, Wallet, WalletTransaction
+from userdetails.wallet_cache import cache_wallet, get_cached_wallet
+from utils.pagination import CursorError, keyset_page, parse_page_size
+from utils.throttling import CallTokenThrottle, OrderThrottle
 from userdetails.serializers import UserProfileSerializer, UserSerializer
 import logging
 logger = logging.getLogger(__name__)
@@ -43,6 +49,7 @@ import base64
 import json
 import logging
 from datetime import timedelta
+from datetime import timezone as dt_timezone
 from django.conf import settings
 from django.utils import timezone
 from django.db import transaction
@@ -56,7 +63,7 @@ from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
 
 from .models import Booking, CallRequest
-from utils.zego_token import generate_token04, ERROR_CODE_SUCCESS
+from utils.zego_service import ZegoTokenError, get_token_service
 from .serializers import CallRequestSerializer
 
 logger = logging.getLogger(__name__)
@@ -66,13 +73,53 @@ class CounsellorListView(APIView):
     permission_classes = [AllowAny]
 
     def get(self, request):
-        logger.debug("CounsellorListView accessed")
-        counsellors = UserProfile.objects.filter(user_role='counsellor', is_active=True)
-        serializer = UserProfileSerializer(counsellors, many=True)
-        logger.debug(f"Returning {len(serializer.data)} counsellors")
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        """
+        List active counsellors as directory cards with their live presence
+        ('online', 'busy' or 'offline'). Cards come from the versioned
+        directory cache; filtering and paging happen in memory.
+
+        Query params:
+            fee_min, fee_max: Session fee range in INR
+            gender: M, F or O
+            experience_min: Minimum years of experience
+            online: 'true' to only list connected counsellors
+            page, page_size: 1-based page number and cards per page (default 20, max 100)
+
+        Sends a weak ETag; a matching If-None-Match gets 304 Not Modified.
+        """
+        params = request.query_params
+        try:
+            page = int(params.get('page') or 1)
+            if page < 1:
+                raise ValueError('page must be positive')
+            page_size = parse_page_size(params.get('page_size'), default=20, maximum=100)
+            version, cards = directory.get_directory()
+            statuses = None
+            if params.get('online') in ('1', 'true'):
+                statuses = presence.get_statuses([card['id'] for card in cards])
+            cards = directory.filter_cards(cards, params, statuses)
+        except (ValueError, CursorError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        page_cards = cards[(page - 1) * page_size:page * page_size]
+        if statuses is None:
+            statuses = presence.get_statuses([card['id'] for card in page_cards])
+        results = directory.render_page(page_cards, statuses)
+
+        etag = directory.page_etag(version, request.META.get('QUERY_STRING', ''), results)
+        if etag in request.headers.get('If-None-Match', ''):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        logger.debug("Returning %d of %d counsellors", len(results), len(cards))
+        return Response({
+            'count': len(cards),
+            'page': page,
+            'page_size': page_size,
+            'results': results
+        }, status=status.HTTP_200_OK, headers={'ETag': etag})
+
     def put(self, request, pk):
-        logger.debug(f"CounsellorListView PUT request for counsellor ID: {pk}")
+        logger.debug("CounsellorListView PUT request for counsellor ID: %s", pk)
         
         # Override permission for PUT to require authentication
         self.permission_classes = [IsAuthenticated]
@@ -92,7 +139,7 @@ class CounsellorListView(APIView):
         serializer = UserProfileSerializer(counsellor, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
-            logger.debug(f"Counsellor ID {pk} updated successfully")
+            logger.debug("Counsellor ID %s updated successfully", pk)
             return Response(serializer.data, status=status.HTTP_200_OK)
         else:
             logger.error(f"Validation errors for counsellor ID {pk}: {serializer.errors}")
@@ -102,6 +149,7 @@ class CounsellorListView(APIView):
 
 class CreateOrderView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_classes = [OrderThrottle]
 
     def post(self, request):
         try:
@@ -134,7 +182,7 @@ class CreateOrderView(APIView):
             except UserProfile.DoesNotExist:
                 return Response({'error': 'No active superuser available for payment'}, status=status.HTTP_404_NOT_FOUND)
             
-            client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
+            client = get_razorpay_client()
             order_data = {
                 'amount': int(session_fee * 100),  # Use counsellor's session_fee
                 'currency': 'INR',
@@ -185,18 +233,9 @@ class VerifyPaymentView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
-            params_dict = {
-                'razorpay_payment_id': razorpay_payment_id,
-                'razorpay_order_id': razorpay_order_id,
-            }
-            generated_signature = hmac.new(
-                key=settings.RAZORPAY_KEY_SECRET.encode('utf-8'),
-                msg=f"{razorpay_order_id}|{razorpay_payment_id}".encode('utf-8'),
-                digestmod=hashlib.sha256
-            ).hexdigest()
-
-            if generated_signature != razorpay_signature:
+            if not verify_payment_signature(
+                razorpay_order_id, razorpay_payment_id, razorpay_signature, settings.RAZORPAY_KEY_SECRET
+            ):
                 logger.error("Invalid Razorpay signature")
                 return Response(
                     {'error': 'Invalid payment signature'},
@@ -204,33 +243,15 @@ class VerifyPaymentView(APIView):
                 )
 
             try:
-                with transaction.atomic():
-                    booking = Booking.objects.get(order_id=razorpay_order_id)
-                    booking.razorpay_payment_id = razorpay_payment_id
-                    booking.status = 'wallet_credited'
-                    booking.save()
-
-                    wallet, created = Wallet.objects.get_or_create(user=booking.user)
-                    wallet.balance = Decimal(wallet.balance) + booking.amount
-                    wallet.save()
-
-                    WalletTransaction.objects.create(
-                        wallet=wallet,
-                        amount=booking.amount,
-                        transaction_type='DEPOSIT',
-                        description=f"Payment for booking {booking.id}",
-                        related_booking=booking
-                    )
-
-                    logger.info(f"Payment credited to wallet for booking {booking.id}, order_id: {razorpay_order_id}")
-                    return Response(
-                        {
-                            'booking_id': booking.id,
-                            'status': 'Payment Successful',
-                            'wallet_balance': wallet.balance
-                        },
-                        status=status.HTTP_200_OK
-                    )
+                booking, wallet, credited = credit_booking_payment(razorpay_order_id, razorpay_payment_id)
+                return Response(
+                    {
+                        'booking_id': booking.id,
+                        'status': 'Payment Successful',
+                        'wallet_balance': wallet.balance
+                    },
+                    status=status.HTTP_200_OK
+                )
             except Booking.DoesNotExist:
                 logger.error(f"Booking not found for order_id: {razorpay_order_id}")
                 return Response(
@@ -246,6 +267,45 @@ class VerifyPaymentView(APIView):
             )
 
 
+class RazorpayWebhookView(APIView):
+    """
+    Receive payment.captured / order.paid webhooks from Razorpay.
+
+    Only the signature is checked here; the raw event is stored in the
+    PaymentWebhookEvent inbox and credited to the wallet by the
+    process_payment_webhooks worker, so Razorpay gets its 200 immediately.
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def post(self, request):
+        secret = getattr(settings, 'RAZORPAY_WEBHOOK_SECRET', None)
+        if not secret:
+            logger.error("RAZORPAY_WEBHOOK_SECRET is not configured")
+            return Response({'error': 'Webhook not configured'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        body = request.body
+        if not verify_webhook_signature(body, request.headers.get('X-Razorpay-Signature'), secret):
+            logger.error("Invalid Razorpay webhook signature")
+            return Response({'error': 'Invalid signature'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            event = json.loads(body).get('event')
+        except (ValueError, AttributeError):
+            return Response({'error': 'Invalid payload'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if event in WEBHOOK_EVENTS:
+            PaymentWebhookEvent.objects.bulk_create([
+                PaymentWebhookEvent(
+                    event_id=request.headers.get('X-Razorpay-Event-Id') or None,
+                    event=event,
+                    body=body.decode('utf-8'),
+                )
+            ], ignore_conflicts=True)
+
+        return Response({'status': 'ok'}, status=status.HTTP_200_OK)
+
+
 
 
 
@@ -278,7 +338,7 @@ from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 from django.conf import settings
 from .models import Booking  # Adjust based on your app
-from utils.zego_token import generate_token04, ERROR_CODE_SUCCESS
+from utils.zego_service import ZegoTokenError, get_token_service
 # your_app/views.py
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -287,7 +347,10 @@ from django.conf import settings
 import json
 import time
 from .models import Booking
-from firebase_admin import messaging
+
+# An incoming-call push is useless once the caller has given up
+CALL_NOTIFICATION_TTL = 60  # seconds
+
 
 class InitiateCallView(APIView):
     def post(self, request):
@@ -305,69 +368,31 @@ class InitiateCallView(APIView):
 
         room_id = f"booking_{booking_id}"
         user_id = str(request.user.id)
-        app_id = getattr(settings, 'ZEGO_APP_ID', None)
-        server_secret = getattr(settings, 'ZEGO_SERVER_SECRET', None)
+        token_service = get_token_service()
 
-        if not app_id or not server_secret:
+        if token_service is None:
             return Response({'error': 'Video call service not configured'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        app_id = token_service.app_id
 
-        # Generate token for user
-        user_payload_data = {
-            'room_id': room_id,
-            'privilege': {'1': 1, '2': 1},  # 1: Login, 2: Publish
-            'stream_id_list': []
-        }
-        user_payload = json.dumps(user_payload_data)
-        user_token_info = generate_token04(
-            app_id=app_id,
-            user_id=user_id,
-            secret=server_secret,
-            effective_time_in_seconds=3600,
-            payload=user_payload
-        )
-
-        if user_token_info.error_code != ERROR_CODE_SUCCESS:
-            return Response({'error': f"User token generation failed: {user_token_info.error_message}"}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Generate token for counsellor
-        counsellor_payload_data = {
+        # Tokens for both participants (login + publish) in one batch
+        try:
+            user_token_info, counsellor_token_info = token_service.get_tokens([
+                (user_id, room_id), (counsellor_user_id, room_id)
+            ])
+        except ZegoTokenError as e:
+            return Response({'error': f"Token generation failed: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Queue the FCM notification; send_push_notifications delivers it
+        enqueue_push(counsellor, {
+            'type': 'call_notification',
             'room_id': room_id,
-            'privilege': {'1': 1, '2': 1},
-            'stream_id_list': []
-        }
-        counsellor_payload = json.dumps(counsellor_payload_data)
-        counsellor_token_info = generate_token04(
-            app_id=app_id,
-            user_id=counsellor_user_id,
-            secret=server_secret,
-            effective_time_in_seconds=3600,
-            payload=counsellor_payload
-        )
-
-        if counsellor_token_info.error_code != ERROR_CODE_SUCCESS:
-            return Response({'error': f"Counsellor token generation failed: {counsellor_token_info.error_message}"}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Send FCM notification to counsellor
-        if counsellor.fcm_token:
-            try:
-                message = messaging.Message(
-                    data={
-                        'type': 'call_notification',
-                        'room_id': room_id,
-                        'kitToken': counsellor_token_info.token,
-                        'user_id': counsellor_user_id,
-                        'streamId': f"stream_{counsellor_user_id}_{int(time.time())}",
-                        'booking_id': str(booking_id),
-                        'counsellor_id': str(counsellor_id),
-                        'clientUserId': user_id,
-                    },
-                    token=counsellor.fcm_token,
-                )
-                response = messaging.send(message)
-                print(f"[FCM] Notification sent to counsellor_{counsellor_user_id}: {response}")
-            except Exception as e:
-                print(f"[FCM] Failed to send notification: {str(e)}")
-                return Response({'error': f"Failed to send notification: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            'kitToken': counsellor_token_info.token,
+            'user_id': counsellor_user_id,
+            'streamId': f"stream_{counsellor_user_id}_{int(time.time())}",
+            'booking_id': str(booking_id),
+            'counsellor_id': str(counsellor_id),
+            'clientUserId': user_id,
+        }, ttl=CALL_NOTIFICATION_TTL)
 
         return Response({
             'room_id': room_id,
@@ -375,7 +400,7 @@ class InitiateCallView(APIView):
             'app_id': app_id,
             'user_id': user_id,
             'streamId': f"stream_{user_id}_{int(time.time())}",
-            'expires_in': 3600,
+            'expires_in': token_service.expires_in(user_token_info),
             'counsellor_id': counsellor_id
         }, status=status.HTTP_200_OK)
 
@@ -385,40 +410,23 @@ class SaveFcmTokenView(APIView):
         if not fcm_token:
             return Response({'error': 'fcm_token is required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            counsellor = UserProfile.objects.get(user=request.user)
-            counsellor.fcm_token = fcm_token
-            counsellor.save()
-            return Response({'message': 'FCM token saved'}, status=status.HTTP_200_OK)
-        except UserProfile.DoesNotExist:
+        if not UserProfile.objects.filter(id=request.user.profile_id).update(fcm_token=fcm_token):
             return Response({'error': 'Counsellor not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'message': 'FCM token saved'}, status=status.HTTP_200_OK)
 
 class RenewTokenView(APIView):
     def post(self, request):
         room_id = request.data.get('roomId')
         user_id = request.data.get('userId')
-        app_id = getattr(settings, 'ZEGO_APP_ID', None)
-        server_secret = getattr(settings, 'ZEGO_SERVER_SECRET', None)
+        token_service = get_token_service()
 
-        if not room_id or not user_id or not app_id or not server_secret:
+        if not room_id or not user_id or token_service is None:
             return Response({'error': 'Missing required parameters'}, status=status.HTTP_400_BAD_REQUEST)
 
-        payload_data = {
-            'room_id': room_id,
-            'privilege': {'1': 1, '2': 1},
-            'stream_id_list': []
-        }
-        payload = json.dumps(payload_data)
-        token_info = generate_token04(
-            app_id=app_id,
-            user_id=user_id,
-            secret=server_secret,
-            effective_time_in_seconds=3600,
-            payload=payload
-        )
-
-        if token_info.error_code != ERROR_CODE_SUCCESS:
-            return Response({'error': f"Token generation failed: {token_info.error_message}"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            token_info = token_service.get_token(user_id, room_id, refresh=True)
+        except ZegoTokenError as e:
+            return Response({'error': f"Token generation failed: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response({'kitToken': token_info.token}, status=status.HTTP_200_OK)
         
@@ -461,10 +469,17 @@ class CallStatusView(APIView):
 class CheckCounsellorAvailabilityView(APIView):
     permission_classes = [IsAuthenticated]
     def get(self, request, counsellor_id):
+        # Presence is only recorded for active counsellors, so a connected
+        # counsellor needs no database lookup at all.
+        state = presence.get_status(counsellor_id)
+        if state in (presence.ONLINE, presence.BUSY):
+            return Response({'available': state == presence.ONLINE, 'status': state}, status=status.HTTP_200_OK)
         try:
-            counsellor = UserProfile.objects.get(id=counsellor_id, user_role='counsellor', is_active=True)
-            # Add logic to check availability (e.g., online status)
-            return Response({'available': True}, status=status.HTTP_200_OK)
+            UserProfile.objects.get(id=counsellor_id, user_role='counsellor', is_active=True)
+            if state is None:
+                # Presence store unreachable: fall back to the profile flag alone
+                return Response({'available': True, 'status': None}, status=status.HTTP_200_OK)
+            return Response({'available': False, 'status': state}, status=status.HTTP_200_OK)
         except UserProfile.DoesNotExist:
             return Response({'error': 'Counsellor not found'}, status=status.HTTP_404_NOT_FOUND)   
         
@@ -474,7 +489,6 @@ class CheckCounsellorAvailabilityView(APIView):
 class EndCallView(APIView):
     permission_classes = [IsAuthenticated]
 
-    @transaction.atomic
     def post(self, request):
         booking_id = request.data.get('booking_id')
         actual_duration = request.data.get('actual_duration') # Duration in minutes
@@ -494,75 +508,16 @@ class EndCallView(APIView):
             return Response({'error': 'Invalid actual_duration format'}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            booking = Booking.objects.get(id=booking_id)
-            if booking.status != 'wallet_credited':
-                logger.error(f"Booking {booking_id} is not in wallet_credited state")
-                return Response({'error': 'Invalid booking state'}, status=status.HTTP_400_BAD_REQUEST)
-
-            user_wallet = Wallet.objects.get(user=booking.user)
-            counsellor_wallet, created = Wallet.objects.get_or_create(user=booking.counsellor.user)
-
-            # Calculate extra minutes for unused time
-            session_duration = Decimal(str(booking.session_duration)) # Ensure Decimal type
-            
-            time_remaining = max(Decimal('0.00'), session_duration - actual_duration)
-            extra_minutes_to_credit = int(time_remaining) # Convert to integer minutes
-
-            # Transfer full booking amount to counsellor (as per new requirement)
-            amount_to_transfer_to_counsellor = booking.amount
-
-            # Ensure user has enough balance for the full booking amount
-            # This check might be redundant if payment is already handled at booking creation
-            # but kept for safety.
-            if user_wallet.balance < amount_to_transfer_to_counsellor:
-                logger.error(f"Insufficient balance in user wallet for booking {booking.id} to cover full amount")
-                return Response({'error': 'Insufficient wallet balance to cover full session cost'}, status=status.HTTP_400_BAD_REQUEST)
-
-            # Transfer funds
-            user_wallet.balance -= amount_to_transfer_to_counsellor
-            counsellor_wallet.balance += amount_to_transfer_to_counsellor
-            user_wallet.save()
-            counsellor_wallet.save()
-
-            # Log transactions for fund transfer
-            WalletTransaction.objects.create(
-                wallet=user_wallet,
-                amount=amount_to_transfer_to_counsellor,
-                transaction_type='TRANSFER',
-                description=f"Transfer to counsellor for booking {booking.id} (full session cost)",
-                related_booking=booking
-            )
-            WalletTransaction.objects.create(
-                wallet=counsellor_wallet,
-                amount=amount_to_transfer_to_counsellor,
-                transaction_type='DEPOSIT',
-                description=f"Received from user for booking {booking.id} (full session cost)",
-                related_booking=booking
-            )
-
-            # Credit extra minutes if applicable
+            booking, user_wallet, counsellor_wallet, extra_minutes_to_credit = settle_booking(booking_id, actual_duration)
+            presence.mark_available(booking.counsellor_id)
+            events.publish_booking_event(booking, 'call_ended', {
+                'type': 'call_ended',
+                'booking_id': booking.id,
+                'ended_by': 'user' if request.user.id == booking.user_id else 'counsellor',
+                'timestamp': timezone.now().isoformat()
+            })
             if extra_minutes_to_credit > 0:
-                user_wallet.extra_minutes += extra_minutes_to_credit # Add extra minutes to user's wallet
-                user_wallet.save()
-                WalletTransaction.objects.create(
-                    wallet=user_wallet,
-                    amount=Decimal(str(extra_minutes_to_credit)), # Store minutes as amount for transaction log
-                    transaction_type='EXTRA_MINUTES_CREDIT',
-                    description=f"Credited {extra_minutes_to_credit} extra minutes for unused session time for booking {booking.id}",
-                    related_booking=booking
-                )
-                logger.info(f"Credited {extra_minutes_to_credit} extra minutes to user {booking.user.id} for booking {booking.id}")
-
-            # Update booking status
-            booking.status = 'completed'
-            booking.save()
-
-            # Update CallRequest status
-            call_request = CallRequest.objects.filter(booking=booking).first()
-            if call_request:
-                call_request.status = 'COMPLETED'
-                call_request.ended_at = timezone.now()
-                call_request.save()
+                logger.info(f"Credited {extra_minutes_to_credit} extra minutes to user {booking.user_id} for booking {booking.id}")
 
             logger.info(f"Call ended, funds transferred, and extra minutes processed for booking {booking_id}")
             return Response({
@@ -576,11 +531,17 @@ class EndCallView(APIView):
         except Booking.DoesNotExist:
             logger.error(f"Booking {booking_id} not found")
             return Response({'error': 'Booking not found'}, status=status.HTTP_404_NOT_FOUND)
+        except InvalidBookingState:
+            logger.error(f"Booking {booking_id} is not in wallet_credited state")
+            return Response({'error': 'Invalid booking state'}, status=status.HTTP_400_BAD_REQUEST)
         except Wallet.DoesNotExist:
-            logger.error(f"Wallet not found for booking {booking.id}")
+            logger.error(f"Wallet not found for booking {booking_id}")
             return Response({'error': 'Wallet not found'}, status=status.HTTP_400_BAD_REQUEST)
+        except InsufficientBalance:
+            logger.error(f"Insufficient balance in user wallet for booking {booking_id} to cover full amount")
+            return Response({'error': 'Insufficient wallet balance to cover full session cost'}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
-            logger.error(f"Error ending call for booking {booking.id}: {str(e)}")
+            logger.error(f"Error ending call for booking {booking_id}: {str(e)}")
             import traceback
             logger.error(f"Traceback: {traceback.format_exc()}")
             return Response({'error': 'Failed to end call and process extra minutes'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)  
@@ -594,26 +555,52 @@ class EndCallView(APIView):
         
         
 class WalletView(APIView):
+    """
+    Wallet balance and transaction history, newest first, paged with an opaque
+    cursor. The first page at the default size is what the app home screen
+    loads; it is cached per user and dropped whenever the ledger changes the
+    wallet.
+
+    Query params:
+        cursor: next_cursor from the previous page
+        page_size: Transactions per page (default 20, max 200)
+    """
     permission_classes = [IsAuthenticated]
+    PAGE_SIZE = 20
 
     def get(self, request):
         try:
+            cursor = request.query_params.get('cursor')
+            page_size = parse_page_size(request.query_params.get('page_size'), default=self.PAGE_SIZE)
+            cacheable = not cursor and page_size == self.PAGE_SIZE
+            if cacheable:
+                data, version = get_cached_wallet(request.user.id)
+                if data is not None:
+                    return Response(data, status=status.HTTP_200_OK)
+
             wallet = Wallet.objects.get(user=request.user)
-            transactions = WalletTransaction.objects.filter(wallet=wallet).order_by('-created_at')
-            
-            wallet_serializer = WalletSerializer(wallet)
-            transaction_serializer = WalletTransactionSerializer(transactions, many=True)
-            
-            logger.info(f"Wallet details fetched for user {request.user.id}")
-            return Response({
-                'wallet': wallet_serializer.data,
-                'transactions': transaction_serializer.data
-            }, status=status.HTTP_200_OK)
+            transactions, next_cursor = keyset_page(
+                WalletTransaction.objects.filter(wallet=wallet), 'created_at',
+                cursor=cursor, page_size=page_size
+            )
+            data = {
+                'wallet': WalletSerializer(wallet).data,
+                'transactions': WalletTransactionSerializer(transactions, many=True).data,
+                'next_cursor': next_cursor,
+            }
+            if cacheable:
+                cache_wallet(request.user.id, data, version)
+
+            logger.debug("Wallet details fetched for user %s", request.user.id)
+            return Response(data, status=status.HTTP_200_OK)
+        except CursorError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Wallet.DoesNotExist:
             logger.warning(f"No wallet found for user {request.user.id}")
             return Response({
                 'wallet': {'balance': 0.00},
-                'transactions': []
+                'transactions': [],
+                'next_cursor': None
             }, status=status.HTTP_200_OK)
         except Exception as e:
             logger.error(f"Error fetching wallet details for user {request.user.id}: {str(e)}")
@@ -650,14 +637,16 @@ class UserProblemView(APIView):
         try:
            
             problem = Problem.objects.get(pk=problem_id)
-            user_profile = UserProfile.objects.get(user=request.user)
+            profile_id = request.user.profile_id
+            if profile_id is None:
+                return Response({"error": "User profile not found"}, status=status.HTTP_404_NOT_FOUND)
 
-            if UserProblem.objects.filter(user_profile=user_profile, problem=problem).exists():
+            if UserProblem.objects.filter(user_profile_id=profile_id, problem=problem).exists():
                 return Response({"error": "Problem already selected"}, status=status.HTTP_400_BAD_REQUEST)
 
             data = {
                 'problem_id': problem.id,
-                'user_profile': user_profile.id
+                'user_profile': profile_id
             }
 
             serializer = UserProblemSerializer(data=data)
@@ -820,17 +809,8 @@ class CallStatusView(APIView):
                 'room_id': str(booking_id)
             }
 
-            # Send real-time notification via WebSocket
-            channel_layer = get_channel_layer()
-            if channel_layer:
-                group_name = f'call_{booking_id}'
-                async_to_sync(channel_layer.group_send)(
-                    group_name,
-                    {
-                        'type': 'call_notification',
-                        'message': notification_data
-                    }
-                )
+            # Delivered to the counsellor and the call room after commit
+            events.publish_booking_event(booking, 'call_status', notification_data)
 
             # Update call request and booking status based on action
             if action == 'joined':
@@ -842,6 +822,7 @@ class CallStatusView(APIView):
                     call_request.status = 'ACCEPTED'
                     call_request.accepted_at = timezone.now()
                     call_request.save()
+                    presence.mark_busy(booking.counsellor_id)
                 
                 # Update booking status to completed when call starts
                 if booking.status == 'wallet_credited':
@@ -852,6 +833,7 @@ class CallStatusView(APIView):
                 call_request.status = 'ENDED'
                 call_request.ended_at = timezone.now()
                 call_request.save()
+                presence.mark_available(booking.counsellor_id)
 
             return Response({
                 'status': 'success',
@@ -874,12 +856,11 @@ class CallStatusCheckView(APIView):
     
     def get(self, request, booking_id):
         try:
-            booking = Booking.objects.get(id=booking_id)
+            booking = Booking.objects.select_related('counsellor').get(id=booking_id)
             
             # Check if user has permission to view this booking
-            user_profile = getattr(request.user, 'profile', None)
-            if (request.user != booking.user and 
-                user_profile != booking.counsellor):
+            if (request.user.id != booking.user_id and
+                request.user.profile_id != booking.counsellor_id):
                 return Response(
                     {'error': 'Permission denied'}, 
                     status=status.HTTP_403_FORBIDDEN
@@ -963,27 +944,18 @@ class InitiateCallNotificationView(APIView):
                 }
             )
 
-            # Send real-time notification via WebSocket
-            channel_layer = get_channel_layer()
-            if channel_layer:
-                group_name = f'call_{booking_id}'
-                notification_data = {
-                    'type': 'incoming_call',
-                    'booking_id': booking_id,
-                    'call_request_id': call_request.id,
-                    'user_name': request.user.get_full_name() or request.user.username,
-                    'user_phone': getattr(request.user, 'phone_number', ''),
-                    'room_id': str(booking_id),
-                    'timestamp': timezone.now().isoformat()
-                }
-                
-                async_to_sync(channel_layer.group_send)(
-                    group_name,
-                    {
-                        'type': 'call_notification',
-                        'message': notification_data
-                    }
-                )
+            # Delivered to the counsellor and the call room after commit;
+            # replayed to the counsellor on reconnect until acknowledged
+            notification_data = {
+                'type': 'incoming_call',
+                'booking_id': booking_id,
+                'call_request_id': call_request.id,
+                'user_name': request.user.get_full_name() or request.user.username,
+                'user_phone': getattr(request.user, 'phone_number', ''),
+                'room_id': str(booking_id),
+                'timestamp': timezone.now().isoformat()
+            }
+            events.publish_booking_event(booking, 'incoming_call', notification_data)
 
             return Response({
                 'status': 'success',
@@ -1034,26 +1006,17 @@ class EndCallSessionView(APIView):
             call_request.status = 'ENDED'
             call_request.ended_at = timezone.now()
             call_request.save()
+            presence.mark_available(booking.counsellor_id)
 
-            # Send notifications via WebSocket
-            channel_layer = get_channel_layer()
-            if channel_layer:
-                group_name = f'call_{booking_id}'
-                end_notification = {
-                    'type': 'call_ended',
-                    'booking_id': booking_id,
-                    'call_request_id': call_request.id,
-                    'ended_by': ended_by,
-                    'timestamp': timezone.now().isoformat()
-                }
-
-                async_to_sync(channel_layer.group_send)(
-                    group_name,
-                    {
-                        'type': 'call_notification',
-                        'message': end_notification
-                    }
-                )
+            # Delivered to the counsellor and the call room after commit
+            end_notification = {
+                'type': 'call_ended',
+                'booking_id': booking_id,
+                'call_request_id': call_request.id,
+                'ended_by': ended_by,
+                'timestamp': timezone.now().isoformat()
+            }
+            events.publish_booking_event(booking, 'call_ended', end_notification)
 
             return Response({
                 'status': 'success',
@@ -1076,8 +1039,7 @@ class ActiveBookingView(APIView):
     def get(self, request):
         try:
             # Get counsellor profile
-            user_profile = getattr(request.user, 'profile', None)
-            if not user_profile or user_profile.user_role != 'counsellor':
+            if request.user.user_role != 'counsellor':
                 return Response(
                     {'error': 'User is not a counsellor'}, 
                     status=status.HTTP_403_FORBIDDEN
@@ -1085,7 +1047,7 @@ class ActiveBookingView(APIView):
 
             # Get active call request
             active_call = CallRequest.objects.filter(
-                counsellor=user_profile,
+                counsellor_id=request.user.profile_id,
                 status__in=['PENDING', 'ACCEPTED']
             ).select_related('booking', 'user').first()
 
@@ -1116,12 +1078,13 @@ class ActiveBookingView(APIView):
 class GenerateZegoTokenView(APIView):
     """Generate Zego token for audio call with enhanced validation and error handling"""
     permission_classes = [IsAuthenticated]
+    throttle_classes = [CallTokenThrottle]
     
     def post(self, request):
         try:
             user_id = request.data.get('userID')
             room_id = request.data.get('roomID')
-            logger.debug(f"Token request payload: {request.data}")
+            logger.debug("Token request with fields %s", sorted(request.data))
 
             if not user_id or not room_id:
                 logger.error("Missing userID or roomID")
@@ -1134,16 +1097,15 @@ class GenerateZegoTokenView(APIView):
                 logger.error("Empty userID or roomID after stripping")
                 return Response({'error': 'userID and roomID cannot be empty'}, status=status.HTTP_400_BAD_REQUEST)
 
-            logger.info(f"Token request from user {request.user.id} for userID={user_id}, roomID={room_id}")
+            logger.info("Token request from user %s for userID=%s, roomID=%s", request.user.id, user_id, room_id)
 
             try:
                 booking_id = int(room_id)
                 booking = Booking.objects.get(id=booking_id)
-                logger.debug(f"Booking found: {booking.id}, status: {booking.status}")
+                logger.debug("Booking found: %s, status: %s", booking.id, booking.status)
                 
-                user_profile = getattr(request.user, 'profile', None)
-                is_user = request.user == booking.user
-                is_counsellor = user_profile and user_profile == booking.counsellor
+                is_user = request.user.id == booking.user_id
+                is_counsellor = request.user.profile_id is not None and request.user.profile_id == booking.counsellor_id
                 
                 if not (is_user or is_counsellor):
                     logger.error(f"Permission denied: user {request.user.id} not authorized for booking {booking_id}")
@@ -1161,48 +1123,24 @@ class GenerateZegoTokenView(APIView):
                 return Response({'error': 'Invalid booking or booking not found'}, status=status.HTTP_404_NOT_FOUND)
 
             # If all checks pass, generate the token
-            app_id = getattr(settings, 'ZEGO_APP_ID', None)
-            server_secret = getattr(settings, 'ZEGO_SERVER_SECRET', None)
+            token_service = get_token_service()
 
-            if not app_id or not server_secret:
+            if token_service is None:
                 logger.error("Zego App ID or Server Secret not configured")
                 return Response({'error': 'Zego service is not configured'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
             try:
-                payload = {
-                    "room_id": room_id,
-                    "privilege": {
-                        "1": 1,  # Login privilege
-                        "2": 1   # Publish privilege
-                    },
-                    "stream_id_list": []
-                }
-                payload_dict = {
-                    "room_id": room_id,
-                    "privilege": {
-                        "1": 1,  # Login privilege
-                        "2": 1   # Publish privilege
-                    },
-                    "stream_id_list": []
-                }
-                payload = json.dumps(payload_dict)
-                token_info = generate_token04(
-                    app_id=int(app_id),
-                    user_id=str(user_id),
-                    secret=server_secret,
-                    effective_time_in_seconds=3600,
-                    payload=payload
-                )
-
-                if token_info.error_code != ERROR_CODE_SUCCESS:
-                    logger.error(f"Token generation failed: {token_info.error_message}")
+                try:
+                    token_info = token_service.get_token(user_id, room_id)
+                except ZegoTokenError as e:
+                    logger.error(f"Token generation failed: {str(e)}")
                     return Response(
-                        {"error": f"Token generation failed: {token_info.error_message}"},
+                        {"error": f"Token generation failed: {str(e)}"},
                         status=status.HTTP_400_BAD_REQUEST
                     )
 
-                expires_at = timezone.now() + timedelta(hours=1)
-                logger.info(f"Zego token generated for user {user_id} in room {room_id}")
+                expires_at = datetime.fromtimestamp(token_info.expire_time, tz=dt_timezone.utc)
+                logger.info("Zego token generated for user %s in room %s", user_id, room_id)
                 return Response({
                     'kitToken': token_info.token,
                     'roomID': room_id,
@@ -1243,9 +1181,8 @@ class RefreshZegoTokenView(APIView):
                 
                 booking = Booking.objects.get(id=booking_id)
                 
-                user_profile = getattr(request.user, 'profile', None)
-                if not (request.user == booking.user or 
-                       (user_profile and user_profile == booking.counsellor)):
+                if not (request.user.id == booking.user_id or
+                       (request.user.profile_id is not None and request.user.profile_id == booking.counsellor_id)):
                     return Response(
                         {'error': 'Permission denied'}, 
                         status=status.HTTP_403_FORBIDDEN
@@ -1258,43 +1195,27 @@ class RefreshZegoTokenView(APIView):
                 )
 
             # Get Zego configuration
-            app_id = getattr(settings, 'ZEGO_APP_ID', None)
-            server_secret = getattr(settings, 'ZEGO_SERVER_SECRET', None)
+            token_service = get_token_service()
 
-            if not app_id or not server_secret:
+            if token_service is None:
                 return Response(
                     {'error': 'Zego service unavailable'}, 
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR
                 )
 
-            # Generate fresh token with 1 hour validity
-            payload_dict = {
-                "room_id": room_id,
-                "privilege": {
-                    "1": 1,  # Login privilege
-                    "2": 1   # Publish privilege
-                },
-                "stream_id_list": []
-            }
-            payload = json.dumps(payload_dict)
-            token_info = generate_token04(
-                app_id=int(app_id),
-                user_id=str(user_id),
-                secret=server_secret,
-                effective_time_in_seconds=3600,
-                payload=payload
-            )
-
-            if token_info.error_code != ERROR_CODE_SUCCESS:
-                logger.error(f"Token refresh failed: {token_info.error_message}")
+            # Always a new token: clients also refresh after Zego rejects the current one
+            try:
+                token_info = token_service.get_token(user_id, room_id, refresh=True)
+            except ZegoTokenError as e:
+                logger.error(f"Token refresh failed: {str(e)}")
                 return Response(
-                    {"error": f"Token refresh failed: {token_info.error_message}"},
+                    {"error": f"Token refresh failed: {str(e)}"},
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            expires_at = timezone.now() + timedelta(hours=1)
+            expires_at = datetime.fromtimestamp(token_info.expire_time, tz=dt_timezone.utc)
 
-            logger.info(f"Token refreshed for user {user_id} in room {room_id}")
+            logger.info("Token refreshed for user %s in room %s", user_id, room_id)
 
             return Response({
                 'kitToken': token_info.token,
@@ -1352,10 +1273,6 @@ class UpdateFCMTokenView(APIView):
         if not fcm_token:
             return Response({'error': 'fcm_token is required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            profile = UserProfile.objects.get(user=request.user)
-            profile.fcm_token = fcm_token
-            profile.save(update_fields=['fcm_token'])
-            return Response({'status': 'FCM token updated successfully'}, status=status.HTTP_200_OK)
-        except UserProfile.DoesNotExist:
-            return Response({'error': 'UserProfile not found'}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+        if not UserProfile.objects.filter(id=request.user.profile_id).update(fcm_token=fcm_token):
+            return Response({'error': 'UserProfile not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'status': 'FCM token updated successfully'}, status=status.HTTP_200_OK)
\ No newline at end of file
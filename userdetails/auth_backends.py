@@ -1,12 +1,18 @@
 
 
 
-from firebase_admin import auth
 from django.contrib.auth import get_user_model
 from rest_framework import authentication
 from rest_framework import exceptions
 import logging
 from django.contrib.auth.backends import ModelBackend
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from .firebase_tokens import verify_firebase_token
+from .identity import current_claims, get_firebase_identity, record_claims
+from .models import LazyUser
+from .tokens import IS_ADMIN_CLAIM, PROFILE_ID_CLAIM, USER_ROLE_CLAIM
 
 logger = logging.getLogger(__name__)
 
@@ -19,7 +25,7 @@ class FirebaseAuthentication(authentication.BaseAuthentication):
 
         try:
             id_token = auth_header.split(' ').pop()
-            decoded_token = auth.verify_id_token(id_token)
+            decoded_token = verify_firebase_token(id_token)
         except Exception as e:
             logging.error(f"Failed to decode Firebase ID token: {e}")
             raise exceptions.AuthenticationFailed('Invalid Firebase ID token')
@@ -28,17 +34,57 @@ class FirebaseAuthentication(authentication.BaseAuthentication):
             return None
 
         try:
-            uid = decoded_token.get('uid')
-            User = get_user_model()
-            user, created = User.objects.get_or_create(firebase_uid=uid)
-            if created:
-                # You might want to populate the user model with more data from the decoded_token
-                # For example: user.email = decoded_token.get('email')
-                user.save()
-            return (user, None)
+            # Cached per uid; the user row is only read if the view needs its fields
+            identity = get_firebase_identity(decoded_token.get('uid'))
         except Exception as e:
             logging.error(f"Failed to get or create user from Firebase UID: {e}")
             raise exceptions.AuthenticationFailed('User authentication failed')
+        if not identity['is_active']:
+            raise exceptions.AuthenticationFailed('User is inactive')
+        return (LazyUser.from_identity(identity['user_id'], identity['role'], identity['profile_id']), None)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    '''
+    JWTAuthentication that trusts the identity claims added by
+    userdetails.tokens.tokens_for_user instead of loading the user row, as
+    long as they match the claims recorded in the cache. Without a recorded
+    entry, whether evicted, never written or unreadable, the user is loaded
+    from the database as for tokens issued without claims.
+    '''
+
+    def get_user(self, validated_token):
+        user = self.user_from_claims(validated_token)
+        if user is None:
+            user = super().get_user(validated_token)
+            if USER_ROLE_CLAIM in validated_token:
+                # Tokens carrying claims can skip the database again from the next request
+                record_claims([user.id])
+        return user
+
+    def user_from_claims(self, validated_token):
+        '''
+        The LazyUser the claims describe, or None if the user has to be loaded
+        from the database.
+        '''
+        if USER_ROLE_CLAIM not in validated_token or api_settings.USER_ID_CLAIM not in validated_token:
+            return None
+        user = LazyUser.from_identity(
+            validated_token[api_settings.USER_ID_CLAIM],
+            role=validated_token[USER_ROLE_CLAIM],
+            profile_id=validated_token.get(PROFILE_ID_CLAIM),
+            is_admin=validated_token.get(IS_ADMIN_CLAIM),
+        )
+        current = current_claims(user.id)
+        if current is None:
+            return None
+        if not current['is_active']:
+            raise exceptions.AuthenticationFailed('User is inactive', code='user_inactive')
+        if (current['role'], current['profile_id'], current['is_admin']) != (
+            user.user_role, user.profile_id, user.is_admin
+        ):
+            raise InvalidToken('Token identity is out of date, refresh it')
+        return user
 
 logger = logging.getLogger(__name__)
 
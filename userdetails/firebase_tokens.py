@@ -0,0 +1,293 @@
+'''
+Local verification of Firebase ID tokens.
+
+firebase_admin.auth.verify_id_token keeps Google's signing certificates per
+process, so every new worker pays a certificate download on its first login.
+This verifier keeps the certificates in the default cache (Redis), shared by
+all workers and expiring with the Cache-Control max-age Google sends, and
+checks the RS256 signature and claims locally. Parsed public keys are also
+kept in process. prewarm_signing_keys() loads them at worker boot (see
+counsellor_backend.asgi and wsgi) when FIREBASE_PROJECT_ID is set.
+
+FakeKeyServer stands in for Google's certificate endpoint in tests and
+benchmarks and can mint tokens signed with its key.
+'''
+import logging
+import re
+import threading
+import time
+import uuid
+
+import jwt
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from utils.metrics import external_call
+from utils.services import services
+
+logger = logging.getLogger(__name__)
+
+CERTS_URL = 'https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com'
+ISSUER_PREFIX = 'https://securetoken.google.com/'
+KEYS_CACHE_KEY = 'firebase:signing-keys'
+DEFAULT_MAX_AGE = 3600  # seconds, when the response has no usable Cache-Control
+MIN_REFRESH_INTERVAL = 60  # seconds between refetches forced by an unknown key id
+CLOCK_SKEW = 10  # seconds of leeway on exp / iat / auth_time
+FETCH_TIMEOUT = (3.05, 5)
+
+_verifier = None
+_lock = threading.Lock()
+
+
+class InvalidFirebaseToken(Exception):
+    pass
+
+
+class ExpiredFirebaseToken(InvalidFirebaseToken):
+    pass
+
+
+class SigningKeysUnavailable(Exception):
+    pass
+
+
+def max_age(cache_control):
+    match = re.search(r'max-age=(\d+)', cache_control or '')
+    return int(match.group(1)) if match else DEFAULT_MAX_AGE
+
+
+class GoogleKeySource:
+    """Fetches the x509 certificates Firebase signs ID tokens with."""
+
+    def __init__(self, url=CERTS_URL, timeout=FETCH_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def fetch(self):
+        '''
+        Returns:
+            tuple: ({key id: PEM certificate}, seconds the set may be cached)
+        '''
+        try:
+            with external_call('firebase'):
+                response = self.session.get(self.url, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json(), max_age(response.headers.get('Cache-Control'))
+        except (requests.RequestException, ValueError) as e:
+            raise SigningKeysUnavailable(f"Could not fetch Firebase signing keys: {str(e)}")
+
+
+class FakeKeyServer:
+    """
+    Offline stand-in for Google's certificate endpoint, for tests and
+    benchmarks. Signs tokens with its own RSA key; rotate() switches to a new
+    key while still publishing the old one.
+    """
+
+    def __init__(self, max_age=DEFAULT_MAX_AGE):
+        self.max_age = max_age
+        self.fetches = 0
+        self.certificates = {}
+        self.rotate()
+
+    def rotate(self):
+        from datetime import datetime, timedelta, timezone
+        from cryptography import x509
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        from cryptography.x509.oid import NameOID
+
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.kid = uuid.uuid4().hex
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'fake-securetoken')])
+        now = datetime.now(timezone.utc)
+        certificate = (
+            x509.CertificateBuilder()
+            .subject_name(name).issuer_name(name)
+            .public_key(self.private_key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - timedelta(days=1)).not_valid_after(now + timedelta(days=30))
+            .sign(self.private_key, hashes.SHA256())
+        )
+        self.certificates[self.kid] = certificate.public_bytes(serialization.Encoding.PEM).decode()
+
+    def fetch(self):
+        self.fetches += 1
+        return dict(self.certificates), self.max_age
+
+    def mint(self, uid, project_id, expires_in=3600, **claims):
+        now = int(time.time())
+        payload = {
+            'iss': ISSUER_PREFIX + project_id,
+            'aud': project_id,
+            'sub': uid,
+            'user_id': uid,
+            'auth_time': now,
+            'iat': now,
+            'exp': now + expires_in,
+            **claims,
+        }
+        return jwt.encode(payload, self.private_key, algorithm='RS256', headers={'kid': self.kid})
+
+
+class SigningKeyStore:
+    '''
+    Public keys by key id: parsed keys in process, certificates in the shared
+    cache, and the key source when both are missing or stale.
+    '''
+
+    def __init__(self, source, shared_cache=cache):
+        self.source = source
+        self.cache = shared_cache
+        self._keys = {}
+        self._expires_at = 0
+        self._last_fetch = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _parse(certificates):
+        from cryptography import x509
+        return {
+            kid: x509.load_pem_x509_certificate(pem.encode()).public_key()
+            for kid, pem in certificates.items()
+        }
+
+    def _load_shared(self):
+        try:
+            entry = self.cache.get(KEYS_CACHE_KEY)
+        except Exception as e:
+            logger.warning(f"Firebase key cache read failed: {str(e)}")
+            return False
+        if not entry or entry['expires_at'] <= time.time():
+            return False
+        self._keys, self._expires_at = self._parse(entry['certificates']), entry['expires_at']
+        return True
+
+    def _fetch(self):
+        certificates, seconds = self.source.fetch()
+        self._last_fetch = time.time()
+        expires_at = self._last_fetch + seconds
+        self._keys, self._expires_at = self._parse(certificates), expires_at
+        try:
+            self.cache.set(
+                KEYS_CACHE_KEY, {'certificates': certificates, 'expires_at': expires_at}, timeout=seconds
+            )
+        except Exception as e:
+            logger.warning(f"Firebase key cache write failed: {str(e)}")
+
+    def refresh(self, force=False):
+        with self._lock:
+            if force:
+                if time.time() - self._last_fetch >= MIN_REFRESH_INTERVAL:
+                    self._fetch()
+                return
+            if self._expires_at > time.time():
+                return
+            if not self._load_shared():
+                self._fetch()
+
+    def get(self, kid):
+        if self._expires_at <= time.time():
+            self.refresh()
+        key = self._keys.get(kid)
+        if key is None:
+            # Google may have rotated keys before our copy expired
+            self.refresh(force=True)
+            key = self._keys.get(kid)
+        return key
+
+
+class FirebaseTokenVerifier:
+    def __init__(self, project_id, key_store):
+        self.project_id = project_id
+        self.issuer = ISSUER_PREFIX + project_id
+        self.key_store = key_store
+
+    def verify(self, id_token):
+        '''
+        Verify an ID token the way firebase_admin.auth.verify_id_token does
+        (without the revocation check, which that also skips by default).
+
+        Returns:
+            dict: The token claims, with 'uid' set to the subject
+
+        Raises:
+            ExpiredFirebaseToken, InvalidFirebaseToken, SigningKeysUnavailable
+        '''
+        try:
+            header = jwt.get_unverified_header(id_token)
+        except jwt.InvalidTokenError as e:
+            raise InvalidFirebaseToken(str(e))
+        if header.get('alg') != 'RS256' or not header.get('kid'):
+            raise InvalidFirebaseToken('ID token must be RS256 signed and name its key')
+        key = self.key_store.get(header['kid'])
+        if key is None:
+            raise InvalidFirebaseToken('ID token was signed with an unknown key')
+
+        try:
+            claims = jwt.decode(
+                id_token, key, algorithms=['RS256'], audience=self.project_id, issuer=self.issuer,
+                leeway=CLOCK_SKEW, options={'require': ['exp', 'iat', 'aud', 'iss', 'sub']},
+            )
+        except jwt.ExpiredSignatureError as e:
+            raise ExpiredFirebaseToken(str(e))
+        except jwt.InvalidTokenError as e:
+            raise InvalidFirebaseToken(str(e))
+
+        subject = claims['sub']
+        if not isinstance(subject, str) or not subject or len(subject) > 128:
+            raise InvalidFirebaseToken('ID token has an invalid subject')
+        if claims.get('auth_time', 0) > time.time() + CLOCK_SKEW:
+            raise InvalidFirebaseToken('ID token auth_time is in the future')
+        claims['uid'] = subject
+        return claims
+
+
+def firebase_project_id():
+    project_id = getattr(settings, 'FIREBASE_PROJECT_ID', None)
+    if not project_id:
+        try:
+            project_id = services.get('firebase').project_id
+        except Exception as e:
+            logger.warning(f"Could not read the Firebase project id from the app credentials: {str(e)}")
+            project_id = None
+    if not project_id:
+        raise ImproperlyConfigured('Set FIREBASE_PROJECT_ID or initialise firebase_admin with a project')
+    return project_id
+
+
+def get_verifier():
+    global _verifier
+    if _verifier is None:
+        with _lock:
+            if _verifier is None:
+                source = import_string(
+                    getattr(settings, 'FIREBASE_KEY_SOURCE', 'userdetails.firebase_tokens.GoogleKeySource')
+                )()
+                _verifier = FirebaseTokenVerifier(firebase_project_id(), SigningKeyStore(source))
+    return _verifier
+
+
+def verify_firebase_token(id_token):
+    return get_verifier().verify(id_token)
+
+
+def prewarm_signing_keys():
+    '''
+    Load the signing keys into this process, from the shared cache if another
+    worker already fetched them. Without FIREBASE_PROJECT_ID the verifier
+    would initialise firebase_admin to read the project id, which
+    utils.services keeps off worker boot, so the keys then wait for the
+    first login.
+    '''
+    if not getattr(settings, 'FIREBASE_PROJECT_ID', None):
+        logger.info("FIREBASE_PROJECT_ID is not set; Firebase signing keys load on first use")
+        return
+    try:
+        get_verifier().key_store.refresh()
+    except Exception as e:
+        logger.warning(f"Could not prewarm Firebase signing keys: {str(e)}")
@@ -0,0 +1,151 @@
+'''
+Identity caches for authentication.
+
+The Firebase uid -> identity cache serves FirebaseAuthentication. An identity is {'user_id', 'is_active', 'role', 'profile_id'}: what
+authentication needs to hand views a LazyUser without touching the users
+table. Entries expire after FIREBASE_IDENTITY_CACHE_TIMEOUT and are dropped
+when the user's uid or active flag, or their profile's role, changes (see
+userdetails.signals). A cache outage is logged and treated as a miss.
+
+The claims cache holds each user's current JWT identity claims for
+ClaimsJWTAuthentication (see userdetails.tokens). remember_claims() records
+them when a token is issued and record_claims() whenever the account or
+profile changes. An entry is what lets a token skip the users table: a miss
+or a cache error sends authentication back to the database.
+'''
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_IDENTITY_CACHE_TIMEOUT = 300  # seconds
+
+
+def identity_key(firebase_uid):
+    return f"firebase-identity:{firebase_uid}"
+
+
+def load_identity(firebase_uid):
+    '''Fetch the identity for ``firebase_uid`` in one query, or None if no user has it.'''
+    row = (
+        User.objects.filter(firebase_uid=firebase_uid)
+        .values_list('id', 'is_active', 'profile__user_role', 'profile__id')
+        .first()
+    )
+    if row is None:
+        return None
+    user_id, is_active, role, profile_id = row
+    return {'user_id': user_id, 'is_active': is_active, 'role': role, 'profile_id': profile_id}
+
+
+def get_firebase_identity(firebase_uid):
+    '''
+    Return the identity for ``firebase_uid``, creating a user for a uid seen
+    for the first time.
+    '''
+    key = identity_key(firebase_uid)
+    try:
+        identity = cache.get(key)
+    except Exception as e:
+        logger.warning(f"Identity cache read failed for uid {firebase_uid}: {str(e)}")
+        identity = None
+    if identity is not None:
+        return identity
+
+    identity = load_identity(firebase_uid)
+    if identity is None:
+        user, created = User.objects.get_or_create(firebase_uid=firebase_uid)
+        identity = {'user_id': user.id, 'is_active': user.is_active, 'role': None, 'profile_id': None}
+    try:
+        cache.set(
+            key, identity,
+            timeout=getattr(settings, 'FIREBASE_IDENTITY_CACHE_TIMEOUT', DEFAULT_IDENTITY_CACHE_TIMEOUT)
+        )
+    except Exception as e:
+        logger.warning(f"Identity cache write failed for uid {firebase_uid}: {str(e)}")
+    return identity
+
+
+def invalidate_identities(firebase_uids):
+    '''Drop cached identities once the current transaction commits.'''
+    keys = [identity_key(uid) for uid in firebase_uids if uid]
+    if not keys:
+        return
+
+    def delete():
+        try:
+            cache.delete_many(keys)
+        except Exception as e:
+            logger.warning(f"Identity cache invalidation failed: {str(e)}")
+
+    transaction.on_commit(delete)
+
+
+def claims_key(user_id):
+    return f"user-claims:{user_id}"
+
+
+def claims_timeout():
+    # An entry trusts tokens for at most as long as one access token lives
+    return int(settings.SIMPLE_JWT['ACCESS_TOKEN_LIFETIME'].total_seconds())
+
+
+def claims_of(user, profile=None):
+    return {
+        'is_active': user.is_active,
+        'is_admin': user.is_admin,
+        'role': profile.user_role if profile else None,
+        'profile_id': profile.id if profile else None,
+    }
+
+
+def remember_claims(user, profile=None):
+    '''Record the claims a token is being issued with, read from ``user`` and ``profile``.'''
+    try:
+        cache.set(claims_key(user.id), claims_of(user, profile), timeout=claims_timeout())
+    except Exception as e:
+        logger.warning(f"Recording identity claims failed for user {user.id}: {str(e)}")
+
+
+def record_claims(user_ids):
+    '''
+    Once the current transaction commits, cache the identity claims each user
+    now has, so ClaimsJWTAuthentication refuses tokens that disagree with
+    them. A deleted user is recorded as inactive.
+    '''
+    user_ids = [user_id for user_id in user_ids if user_id is not None]
+    if not user_ids:
+        return
+
+    def record():
+        rows = {
+            user_id: {'is_active': is_active, 'is_admin': is_admin, 'role': role, 'profile_id': profile_id}
+            for user_id, is_active, is_admin, role, profile_id in User.objects.filter(id__in=user_ids)
+            .values_list('id', 'is_active', 'is_admin', 'profile__user_role', 'profile__id')
+        }
+        deleted = {'is_active': False, 'is_admin': False, 'role': None, 'profile_id': None}
+        try:
+            cache.set_many(
+                {claims_key(user_id): rows.get(user_id, deleted) for user_id in user_ids}, timeout=claims_timeout()
+            )
+        except Exception as e:
+            logger.warning(f"Recording identity claims failed: {str(e)}")
+
+    transaction.on_commit(record)
+
+
+def current_claims(user_id):
+    '''
+    The claims recorded for ``user_id``, or None if there are none or the
+    cache could not be read. Callers must then check the database.
+    '''
+    try:
+        return cache.get(claims_key(user_id))
+    except Exception as e:
+        logger.warning(f"Identity claims read failed for user {user_id}: {str(e)}")
+        return None
@@ -0,0 +1,108 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Wallet, WalletTransaction
+from .wallet_cache import invalidate_wallets
+
+
+class InsufficientBalance(Exception):
+    pass
+
+
+class LedgerEntry:
+    """
+    One wallet movement: a balance and/or extra-minutes change on a wallet and
+    the WalletTransaction row that records it.
+    """
+
+    def __init__(self, wallet, transaction_type, amount, description,
+                 balance_delta=Decimal('0.00'), minutes_delta=0, related_booking=None):
+        self.wallet = wallet
+        self.transaction_type = transaction_type
+        self.amount = amount
+        self.description = description
+        self.balance_delta = balance_delta
+        self.minutes_delta = minutes_delta
+        self.related_booking = related_booking
+
+
+def lock_wallets(user_ids, create_for=()):
+    """
+    Lock the wallets of ``user_ids`` for the rest of the current transaction.
+
+    Wallets are always locked in primary key order, so two settlements touching
+    the same pair of wallets can never deadlock. Wallets for users in
+    ``create_for`` are created first if missing; all others must exist.
+
+    Returns:
+        dict: user_id -> locked Wallet
+
+    Raises:
+        Wallet.DoesNotExist: if a wallet outside ``create_for`` is missing
+    """
+    if create_for:
+        Wallet.objects.bulk_create([Wallet(user_id=user_id) for user_id in create_for], ignore_conflicts=True)
+    wallets = {
+        wallet.user_id: wallet
+        for wallet in Wallet.objects.select_for_update().filter(user_id__in=user_ids).order_by('id')
+    }
+    missing = set(user_ids) - set(wallets)
+    if missing:
+        raise Wallet.DoesNotExist(f"No wallet for user(s) {sorted(missing)}")
+    return wallets
+
+
+def post_entries(entries):
+    """
+    Apply ledger entries to wallets already locked with lock_wallets().
+
+    Each wallet is changed with a single UPDATE using F() expressions and all
+    transaction rows are written with one bulk_create, so the number of
+    queries depends on the number of wallets, not on the number of entries.
+    The in-memory wallet objects are updated to the new values and the cached
+    wallet payloads of their owners are dropped on commit.
+
+    Raises:
+        InsufficientBalance: if an entry would take a wallet below zero
+    """
+    balance_deltas = defaultdict(Decimal)
+    minute_deltas = defaultdict(int)
+    wallets = {}
+    for entry in entries:
+        wallets[entry.wallet.pk] = entry.wallet
+        balance_deltas[entry.wallet.pk] += Decimal(entry.balance_delta)
+        minute_deltas[entry.wallet.pk] += entry.minutes_delta
+
+    for pk, wallet in wallets.items():
+        if wallet.balance + balance_deltas[pk] < 0:
+            raise InsufficientBalance(f"Wallet {pk} balance {wallet.balance} is too low")
+
+    now = timezone.now()
+    with transaction.atomic():
+        for pk, wallet in wallets.items():
+            if not balance_deltas[pk] and not minute_deltas[pk]:
+                continue
+            Wallet.objects.filter(pk=pk).update(
+                balance=F('balance') + balance_deltas[pk],
+                extra_minutes=F('extra_minutes') + minute_deltas[pk],
+                updated_at=now,
+            )
+            wallet.balance += balance_deltas[pk]
+            wallet.extra_minutes += minute_deltas[pk]
+            wallet.updated_at = now
+
+        WalletTransaction.objects.bulk_create([
+            WalletTransaction(
+                wallet=entry.wallet,
+                amount=entry.amount,
+                transaction_type=entry.transaction_type,
+                description=entry.description,
+                related_booking=entry.related_booking,
+            )
+            for entry in entries
+        ])
+        invalidate_wallets([wallet.user_id for wallet in wallets.values()])
@@ -0,0 +1,54 @@
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from userdetails.firebase_tokens import KEYS_CACHE_KEY, FakeKeyServer, FirebaseTokenVerifier, SigningKeyStore
+
+PROJECT_ID = 'bench-project'
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure local Firebase ID token verification against FakeKeyServer: the first "
+        "verification in a cold worker, in a worker that finds the keys in the shared cache, "
+        "and steady-state verifications per second."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tokens', type=int, default=2000)
+        parser.add_argument('--rounds', type=int, default=5, help='Passes over the token set')
+        parser.add_argument('--fetch-latency', type=float, default=0.15,
+                            help='Simulated round trip to the certificate endpoint, seconds')
+
+    def handle(self, *args, **options):
+        server = FakeKeyServer()
+        fetch = server.fetch
+
+        def slow_fetch():
+            time.sleep(options['fetch_latency'])
+            return fetch()
+
+        server.fetch = slow_fetch
+        tokens = [server.mint(f"bench-uid-{i}", PROJECT_ID) for i in range(options['tokens'])]
+        cache.delete(KEYS_CACHE_KEY)
+
+        try:
+            for label in ('cold worker (fetches keys)', 'new worker (shared cache)'):
+                verifier = FirebaseTokenVerifier(PROJECT_ID, SigningKeyStore(server))
+                start = time.perf_counter()
+                verifier.verify(tokens[0])
+                self.stdout.write(f"First verification, {label}: {(time.perf_counter() - start) * 1000:.1f}ms")
+
+            count = len(tokens) * options['rounds']
+            start = time.perf_counter()
+            for _ in range(options['rounds']):
+                for token in tokens:
+                    verifier.verify(token)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"Verified {count} tokens in {elapsed:.2f}s ({count / elapsed:,.0f}/s, "
+                f"{elapsed / count * 1e6:.0f}us each); key fetches: {server.fetches}"
+            )
+        finally:
+            cache.delete(KEYS_CACHE_KEY)
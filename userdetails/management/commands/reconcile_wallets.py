@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from userdetails.reconciliation import reconcile_wallets
+
+
+class Command(BaseCommand):
+    help = (
+        "Check every wallet's balance and extra minutes against its transaction ledger. "
+        "Only transactions newer than each wallet's last snapshot are read."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without advancing the snapshots')
+        parser.add_argument('--wallet', type=int, action='append', dest='wallets', help='Only check this wallet id')
+        parser.add_argument('--fail-on-drift', action='store_true', help='Exit with an error if any wallet drifted')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        result = reconcile_wallets(
+            batch_size=options['batch_size'], save=not options['dry_run'], wallet_ids=options['wallets']
+        )
+        elapsed = time.perf_counter() - start
+
+        for drift in result.drifts:
+            self.stdout.write(self.style.WARNING(
+                f"Wallet {drift.wallet_id} (user {drift.user_id}): balance {drift.balance}, "
+                f"ledger {drift.expected_balance}; extra minutes {drift.extra_minutes}, "
+                f"ledger {drift.expected_minutes}"
+            ))
+        self.stdout.write(
+            f"Checked {result.wallets} wallet(s), read {result.transactions} transaction(s) "
+            f"in {elapsed:.2f}s; {len(result.drifts)} drifted"
+        )
+        if result.drifts and options['fail_on_drift']:
+            raise CommandError(f"{len(result.drifts)} wallet(s) do not match their ledger")
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0007_paymentwebhookevent'),
+        ('userdetails', '0023_userprofile_fcm_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('extra_minutes', models.IntegerField(default=0)),
+                ('last_transaction_id', models.BigIntegerField(default=0)),
+                ('taken_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='wallettransaction',
+            index=models.Index(fields=['wallet', 'id'], name='wallettxn_wallet_id'),
+        ),
+        migrations.AddField(
+            model_name='walletsnapshot',
+            name='wallet',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='snapshot', to='userdetails.wallet'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0007_paymentwebhookevent'),
+        ('userdetails', '0024_walletsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='wallettransaction',
+            index=models.Index(fields=['wallet', 'created_at', 'id'], name='wallettxn_wallet_created'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:15
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('userdetails', '0025_wallettransaction_wallet_created'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LazyUser',
+            fields=[
+            ],
+            options={
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('userdetails.user',),
+        ),
+    ]
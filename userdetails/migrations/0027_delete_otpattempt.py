@@ -0,0 +1,16 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:22
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('userdetails', '0026_lazyuser'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='OTPAttempt',
+        ),
+    ]
@@ -5,8 +5,9 @@ from django.core.validators import RegexValidator
 # Custom User Manager
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.core.validators import RegexValidator
-from django.db import models
+from django.db import models, router
 from django.core.exceptions import ValidationError
+from django.utils.functional import cached_property
 
 class CustomUserManager(BaseUserManager):
     def normalize_phone_number(self, phone_number):
@@ -63,6 +64,69 @@ class User(AbstractUser):
     def __str__(self):
         return self.phone_number
 
+    @cached_property
+    def user_role(self):
+        '''Role of this user's profile, or None. LazyUser sets it from token claims.'''
+        return self._profile_identity()[1]
+
+    @cached_property
+    def profile_id(self):
+        '''Id of this user's profile, or None. LazyUser sets it from token claims.'''
+        return self._profile_identity()[0]
+
+    def _profile_identity(self):
+        row = UserProfile.objects.filter(user_id=self.pk).values_list('id', 'user_role').first() or (None, None)
+        self.__dict__['profile_id'], self.__dict__['user_role'] = row
+        return row
+
+
+class LazyUser(User):
+    '''
+    A User built from cached identity data or token claims instead of a row.
+    The id, role and profile id (and the admin flag, when given) are available
+    without a query; reading any other field loads all of them together, once.
+    Field values taken from the identity are re-read before they could be
+    saved, so a stale claim is never written back.
+    '''
+
+    # Field values copied from the identity, by name, until re-read
+    _identity_fields = {}
+
+    class Meta:
+        proxy = True
+
+    @classmethod
+    def from_identity(cls, user_id, role=None, profile_id=None, is_admin=None):
+        identity_fields = {} if is_admin is None else {'is_admin': is_admin}
+        user = cls.from_db(
+            router.db_for_read(cls), ['id', *identity_fields],
+            [cls._meta.pk.to_python(user_id), *identity_fields.values()]  # JWT claims carry the id as a string
+        )
+        user._identity_fields = identity_fields
+        user.user_role = role
+        user.profile_id = profile_id
+        return user
+
+    def _unchanged_identity_fields(self):
+        return {name for name, value in self._identity_fields.items() if getattr(self, name) == value}
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        # Django loads one deferred field per access, and leaves deferred fields
+        # alone on a full refresh; load them all the first time either happens
+        deferred = self.get_deferred_fields()
+        if deferred and (fields is None or deferred.issuperset(fields)):
+            fields = deferred | self._unchanged_identity_fields()
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        for name in (fields if fields is not None else list(self._identity_fields)):
+            self._identity_fields.pop(name, None)
+
+    def save(self, *args, **kwargs):
+        unchanged = self._unchanged_identity_fields()
+        if unchanged:
+            self.refresh_from_db(fields=unchanged)
+        super().save(*args, **kwargs)
+
+
 class UserProfile(models.Model):
     USER_TYPE_CHOICES = [
         ('normal', 'Normal User'),
@@ -131,20 +195,6 @@ class UserProfile(models.Model):
 
        
 
-# OTP Model for tracking OTP attempts
-class OTPAttempt(models.Model):
-    phone_number = models.CharField(max_length=17)
-    otp_sent_at = models.DateTimeField(auto_now_add=True)
-    attempts = models.PositiveIntegerField(default=0)
-    is_verified = models.BooleanField(default=False)
-    
-    class Meta:
-        verbose_name = "OTP Attempt"
-        verbose_name_plural = "OTP Attempts"
-
-    def __str__(self):
-        return f"OTP for {self.phone_number}"
-    
 
 
 
@@ -174,6 +224,14 @@ class WalletTransaction(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     related_booking = models.ForeignKey('dashboard.Booking', on_delete=models.SET_NULL, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Incremental reconciliation reads "transactions of these wallets after id N"
+            models.Index(fields=['wallet', 'id'], name='wallettxn_wallet_id'),
+            # Wallet history is paged newest first on (created_at, id)
+            models.Index(fields=['wallet', 'created_at', 'id'], name='wallettxn_wallet_created'),
+        ]
+
     def __str__(self):
         return f"{self.transaction_type} of {self.amount} for {self.wallet.user.username}"    
 
@@ -182,4 +240,20 @@ class WalletTransaction(models.Model):
     
     
     
-    
\ No newline at end of file
+    
+
+class WalletSnapshot(models.Model):
+    """
+    Reconciliation checkpoint for a wallet: the balance and extra minutes the
+    ledger adds up to, counting every WalletTransaction up to and including
+    ``last_transaction_id``. The next reconciliation only has to sum the
+    transactions written after it.
+    """
+    wallet = models.OneToOneField(Wallet, on_delete=models.CASCADE, related_name='snapshot')
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    extra_minutes = models.IntegerField(default=0)
+    last_transaction_id = models.BigIntegerField(default=0)
+    taken_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Snapshot of wallet {self.wallet_id} at transaction {self.last_transaction_id}: {self.balance}"
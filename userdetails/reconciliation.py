@@ -0,0 +1,163 @@
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Wallet, WalletSnapshot, WalletTransaction
+
+# How each transaction type moves the wallet. EXTRA_MINUTES_CREDIT rows store
+# the credited minutes in ``amount`` and never touch the balance.
+BALANCE_SIGNS = {
+    'DEPOSIT': 1,
+    'TRANSFER': -1,
+    'WITHDRAWAL': -1,
+}
+MINUTES_SIGNS = {
+    'EXTRA_MINUTES_CREDIT': 1,
+}
+
+WalletDrift = namedtuple(
+    'WalletDrift', ['wallet_id', 'user_id', 'balance', 'expected_balance', 'extra_minutes', 'expected_minutes']
+)
+ReconciliationResult = namedtuple('ReconciliationResult', ['wallets', 'transactions', 'drifts'])
+
+
+def _ledger_totals(wallet_ids, incremental=True):
+    """
+    Sum the ledger of ``wallet_ids`` in one grouped query.
+
+    With ``incremental`` only transactions after each wallet's snapshot are
+    read, which on the (wallet, id) index is a short range scan per wallet.
+
+    Returns:
+        dict: wallet_id -> [balance_delta, minutes_delta, transaction_count, last_transaction_id]
+    """
+    transactions = WalletTransaction.objects.filter(wallet_id__in=wallet_ids)
+    if incremental:
+        checkpoint = WalletSnapshot.objects.filter(wallet_id=OuterRef('wallet_id')).values('last_transaction_id')
+        transactions = transactions.filter(id__gt=Coalesce(Subquery(checkpoint), Value(0)))
+
+    totals = {}
+    rows = (
+        transactions.order_by()
+        .values('wallet_id', 'transaction_type')
+        .annotate(total=Sum('amount'), rows=Count('id'), last_id=Max('id'))
+    )
+    for row in rows:
+        entry = totals.setdefault(row['wallet_id'], [Decimal('0.00'), 0, 0, 0])
+        entry[0] += BALANCE_SIGNS.get(row['transaction_type'], 0) * row['total']
+        entry[1] += MINUTES_SIGNS.get(row['transaction_type'], 0) * int(row['total'])
+        entry[2] += row['rows']
+        entry[3] = max(entry[3], row['last_id'])
+    return totals
+
+
+def reconcile_batch(wallets, save=True):
+    """
+    Reconcile one batch of wallets (dicts with id, user_id, balance and
+    extra_minutes) against their snapshot plus newer transactions.
+
+    Wallets that look out of balance are re-summed over their full ledger
+    before being reported, so a stale or skipped checkpoint can never show up
+    as drift; their snapshot is rebuilt from that full sum.
+
+    Returns:
+        tuple: (list of WalletDrift, number of transactions read)
+    """
+    wallet_ids = [wallet['id'] for wallet in wallets]
+    snapshots = {
+        snapshot.wallet_id: snapshot
+        for snapshot in WalletSnapshot.objects.filter(wallet_id__in=wallet_ids)
+    }
+    totals = _ledger_totals(wallet_ids)
+    read = sum(entry[2] for entry in totals.values())
+
+    expected = {}
+    for wallet in wallets:
+        snapshot = snapshots.get(wallet['id'])
+        balance_delta, minutes_delta, _, last_id = totals.get(wallet['id'], (Decimal('0.00'), 0, 0, 0))
+        expected[wallet['id']] = [
+            (snapshot.balance if snapshot else Decimal('0.00')) + balance_delta,
+            (snapshot.extra_minutes if snapshot else 0) + minutes_delta,
+            max(last_id, snapshot.last_transaction_id if snapshot else 0),
+        ]
+
+    suspects = [
+        wallet['id'] for wallet in wallets
+        if (wallet['balance'], wallet['extra_minutes']) != tuple(expected[wallet['id']][:2])
+    ]
+    if suspects:
+        full = _ledger_totals(suspects, incremental=False)
+        read += sum(entry[2] for entry in full.values())
+        for wallet_id in suspects:
+            balance, minutes, _, last_id = full.get(wallet_id, (Decimal('0.00'), 0, 0, 0))
+            expected[wallet_id] = [balance, minutes, last_id]
+
+    drifts = [
+        WalletDrift(
+            wallet['id'], wallet['user_id'], wallet['balance'], expected[wallet['id']][0],
+            wallet['extra_minutes'], expected[wallet['id']][1],
+        )
+        for wallet in wallets
+        if (wallet['balance'], wallet['extra_minutes']) != tuple(expected[wallet['id']][:2])
+    ]
+
+    if save:
+        # Snapshots always hold what the ledger says, never the wallet's own
+        # (possibly drifted) balance, so drift keeps being reported until fixed.
+        WalletSnapshot.objects.bulk_create(
+            [
+                WalletSnapshot(wallet_id=wallet_id, balance=balance, extra_minutes=minutes, last_transaction_id=last_id)
+                for wallet_id, (balance, minutes, last_id) in expected.items()
+                if wallet_id not in snapshots or last_id != snapshots[wallet_id].last_transaction_id
+                or wallet_id in suspects
+            ],
+            update_conflicts=True,
+            unique_fields=['wallet'],
+            update_fields=['balance', 'extra_minutes', 'last_transaction_id', 'taken_at'],
+        )
+    return drifts, read
+
+
+def reconcile_wallets(batch_size=5000, save=True, wallet_ids=None):
+    """
+    Compare every wallet's stored balance and extra minutes with its ledger.
+
+    Wallets are walked in id order in batches; each batch costs a constant
+    number of queries and runs in its own transaction. On PostgreSQL the
+    batch uses REPEATABLE READ, so a settlement committing mid-batch is seen
+    either completely (wallet UPDATE and ledger rows) or not at all.
+
+    Args:
+        batch_size: Wallets per batch
+        save: Advance the snapshots; False gives a read-only audit
+        wallet_ids: Restrict the run to these wallets
+
+    Returns:
+        ReconciliationResult: (wallets checked, transactions read, list of WalletDrift)
+    """
+    checked, read, drifts = 0, 0, []
+    last_id = 0
+    # SET TRANSACTION is only allowed as the first statement of a transaction
+    isolate = connection.vendor == 'postgresql' and not connection.in_atomic_block
+    while True:
+        with transaction.atomic():
+            if isolate:
+                with connection.cursor() as cursor:
+                    cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+            queryset = Wallet.objects.filter(id__gt=last_id)
+            if wallet_ids is not None:
+                queryset = queryset.filter(id__in=wallet_ids)
+            wallets = list(
+                queryset.order_by('id').values('id', 'user_id', 'balance', 'extra_minutes')[:batch_size]
+            )
+            if not wallets:
+                break
+            batch_drifts, batch_read = reconcile_batch(wallets, save=save)
+        checked += len(wallets)
+        read += batch_read
+        drifts.extend(batch_drifts)
+        last_id = wallets[-1]['id']
+    return ReconciliationResult(checked, read, drifts)
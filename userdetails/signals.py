@@ -0,0 +1,32 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .identity import invalidate_identities, record_claims
+from .models import User, UserProfile
+
+# Fields cached in a Firebase identity (see userdetails.identity)
+USER_IDENTITY_FIELDS = frozenset(['firebase_uid', 'is_active'])
+PROFILE_IDENTITY_FIELDS = frozenset(['user_role'])
+# Fields carried in JWT identity claims (see userdetails.tokens)
+USER_CLAIM_FIELDS = frozenset(['is_active', 'is_admin'])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_identity_changed(sender, instance, update_fields=None, **kwargs):
+    # Saves such as the last_login update on every login leave identities alone
+    if update_fields is None or USER_CLAIM_FIELDS.intersection(update_fields):
+        record_claims([instance.id])
+    if update_fields is not None and not USER_IDENTITY_FIELDS.intersection(update_fields):
+        return
+    # Keyed by uid, so this also covers a uid moving to this user from another
+    invalidate_identities([instance.firebase_uid])
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def profile_identity_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not PROFILE_IDENTITY_FIELDS.intersection(update_fields):
+        return
+    record_claims([instance.user_id])
+    invalidate_identities(User.objects.filter(id=instance.user_id).values_list('firebase_uid', flat=True))
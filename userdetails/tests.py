@@ -1,3 +1,370 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import CommandError, call_command
 from django.test import TestCase
 
-# Create your tests here.
+from .ledger import LedgerEntry, lock_wallets, post_entries
+from .models import User, Wallet, WalletSnapshot, WalletTransaction
+from .reconciliation import reconcile_wallets
+
+
+class WalletReconciliationTest(TestCase):
+    def setUp(self):
+        self.wallets = [
+            Wallet.objects.create(user=User.objects.create_user(phone_number=f'+91920000000{i}'))
+            for i in range(3)
+        ]
+
+    def post(self, wallet, transaction_type, amount, balance_delta=0, minutes_delta=0):
+        wallet = lock_wallets([wallet.user_id])[wallet.user_id]
+        post_entries([LedgerEntry(
+            wallet, transaction_type, Decimal(amount), 'test',
+            balance_delta=Decimal(balance_delta), minutes_delta=minutes_delta
+        )])
+
+    def test_consistent_wallets_have_no_drift(self):
+        self.post(self.wallets[0], 'DEPOSIT', '100', balance_delta='100')
+        self.post(self.wallets[0], 'TRANSFER', '40', balance_delta='-40')
+        self.post(self.wallets[0], 'EXTRA_MINUTES_CREDIT', '5', minutes_delta=5)
+
+        result = reconcile_wallets()
+
+        self.assertEqual((result.wallets, result.transactions, result.drifts), (3, 3, []))
+        snapshot = WalletSnapshot.objects.get(wallet=self.wallets[0])
+        self.assertEqual((snapshot.balance, snapshot.extra_minutes), (Decimal('60.00'), 5))
+        self.assertEqual(snapshot.last_transaction_id, WalletTransaction.objects.latest('id').id)
+
+    def test_second_run_only_reads_new_transactions(self):
+        self.post(self.wallets[0], 'DEPOSIT', '100', balance_delta='100')
+        self.post(self.wallets[1], 'DEPOSIT', '50', balance_delta='50')
+        reconcile_wallets()
+
+        self.post(self.wallets[1], 'WITHDRAWAL', '20', balance_delta='-20')
+        result = reconcile_wallets()
+
+        self.assertEqual((result.transactions, result.drifts), (1, []))
+        self.assertEqual(WalletSnapshot.objects.get(wallet=self.wallets[1]).balance, Decimal('30.00'))
+
+    def test_direct_balance_change_is_reported_until_fixed(self):
+        self.post(self.wallets[2], 'DEPOSIT', '100', balance_delta='100')
+        reconcile_wallets()
+        Wallet.objects.filter(pk=self.wallets[2].pk).update(balance=Decimal('150.00'))
+
+        drifts = reconcile_wallets().drifts
+        self.assertEqual(len(drifts), 1)
+        self.assertEqual((drifts[0].balance, drifts[0].expected_balance), (Decimal('150.00'), Decimal('100.00')))
+        self.assertEqual(len(reconcile_wallets().drifts), 1)
+
+        Wallet.objects.filter(pk=self.wallets[2].pk).update(balance=Decimal('100.00'))
+        self.assertEqual(reconcile_wallets().drifts, [])
+
+    def test_dry_run_does_not_write_snapshots(self):
+        self.post(self.wallets[0], 'DEPOSIT', '10', balance_delta='10')
+        reconcile_wallets(save=False)
+        self.assertFalse(WalletSnapshot.objects.exists())
+
+    def test_command_fails_on_drift(self):
+        Wallet.objects.filter(pk=self.wallets[0].pk).update(balance=Decimal('1.00'))
+        with self.assertRaises(CommandError):
+            call_command('reconcile_wallets', '--fail-on-drift', stdout=StringIO())
+
+
+class FirebaseTokenVerifierTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from .firebase_tokens import FakeKeyServer
+        cls.server = FakeKeyServer(max_age=600)
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.server.fetches = 0
+
+    def verifier(self):
+        from .firebase_tokens import FirebaseTokenVerifier, SigningKeyStore
+        return FirebaseTokenVerifier('demo-project', SigningKeyStore(self.server))
+
+    def test_keys_are_fetched_once_and_shared(self):
+        token = self.server.mint('uid-1', 'demo-project', phone_number='+919930000001')
+        self.assertEqual(self.verifier().verify(token)['uid'], 'uid-1')
+        # A second worker finds the keys in the shared cache
+        self.assertEqual(self.verifier().verify(token)['phone_number'], '+919930000001')
+        self.assertEqual(self.server.fetches, 1)
+
+    def test_rejects_expired_and_foreign_tokens(self):
+        from .firebase_tokens import ExpiredFirebaseToken, InvalidFirebaseToken
+
+        verifier = self.verifier()
+        with self.assertRaises(ExpiredFirebaseToken):
+            verifier.verify(self.server.mint('uid-1', 'demo-project', expires_in=-60))
+        with self.assertRaises(InvalidFirebaseToken):
+            verifier.verify(self.server.mint('uid-1', 'other-project'))
+        with self.assertRaises(InvalidFirebaseToken):
+            verifier.verify('not-a-token')
+
+    def test_unknown_key_id_refetches(self):
+        self.verifier().verify(self.server.mint('uid-1', 'demo-project'))
+        self.server.rotate()
+        self.assertEqual(self.verifier().verify(self.server.mint('uid-2', 'demo-project'))['uid'], 'uid-2')
+        self.assertEqual(self.server.fetches, 2)
+
+    def test_firebase_login_uses_the_local_verifier(self):
+        from unittest.mock import patch
+        from django.urls import reverse
+
+        token = self.server.mint('uid-3', 'demo-project', phone_number='+919930000003')
+        with patch('userdetails.firebase_tokens._verifier', self.verifier()):
+            response = self.client.post(reverse('firebase-auth'), {'id_token': token}, content_type='application/json')
+            expired = self.client.post(reverse('firebase-auth'), {
+                'id_token': self.server.mint('uid-3', 'demo-project', expires_in=-60)
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(User.objects.get(phone_number='+919930000003').firebase_uid, 'uid-3')
+        self.assertEqual(expired.json(), {'error': 'Firebase ID token has expired'})
+
+    def test_prewarm_needs_the_project_id_setting(self):
+        from unittest.mock import patch
+        from .firebase_tokens import prewarm_signing_keys
+
+        with patch('userdetails.firebase_tokens._verifier', None), patch('utils.services.services.get') as get:
+            with self.settings(FIREBASE_PROJECT_ID=''):
+                prewarm_signing_keys()
+            # Boot must not initialise firebase_admin to find the project id
+            get.assert_not_called()
+            with self.settings(FIREBASE_PROJECT_ID='demo-project', FIREBASE_KEY_SOURCE='userdetails.firebase_tokens.FakeKeyServer'):
+                prewarm_signing_keys()
+            get.assert_not_called()
+
+
+class FirebaseIdentityCacheTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from .models import UserProfile
+
+        cache.clear()
+        self.user = User.objects.create_user(phone_number='+919940000001', firebase_uid='uid-cached')
+        self.profile = UserProfile.objects.create(user=self.user, phone_number='+919940000001', name='Ravi')
+
+    def authenticate(self, uid):
+        from unittest.mock import patch
+        from rest_framework.test import APIRequestFactory
+        from .auth_backends import FirebaseAuthentication
+
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION='Bearer token')
+        with patch('userdetails.auth_backends.verify_firebase_token', return_value={'uid': uid}):
+            return FirebaseAuthentication().authenticate(request)[0]
+
+    def test_cached_identity_needs_no_queries(self):
+        with self.assertNumQueries(1):
+            self.authenticate('uid-cached')
+        with self.assertNumQueries(0):
+            user = self.authenticate('uid-cached')
+            self.assertEqual((user.id, user.user_role, user.profile_id), (self.user.id, 'normal', self.profile.id))
+            self.assertEqual(user, self.user)
+        # Touching a model field loads the row once
+        with self.assertNumQueries(1):
+            self.assertEqual((user.phone_number, user.is_admin), ('+919940000001', False))
+
+    def test_role_changes_drop_the_identity(self):
+        self.authenticate('uid-cached')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.user_role = 'counsellor'
+            self.profile.save(update_fields=['user_role'])
+        self.assertEqual(self.authenticate('uid-cached').user_role, 'counsellor')
+
+    def test_new_uid_creates_a_user(self):
+        user = self.authenticate('uid-new')
+        self.assertTrue(User.objects.filter(id=user.id, firebase_uid='uid-new').exists())
+        self.assertIsNone(user.profile_id)
+
+
+class ClaimsJWTAuthenticationTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from .models import UserProfile
+
+        cache.clear()
+        self.user = User.objects.create_user(phone_number='+919950000001', password='secret')
+        self.profile = UserProfile.objects.create(
+            user=self.user, phone_number='+919950000001', name='Meera', user_role='counsellor'
+        )
+
+    def authenticate(self, access):
+        from rest_framework.test import APIRequestFactory
+        from .auth_backends import ClaimsJWTAuthentication
+
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {access}')
+        return ClaimsJWTAuthentication().authenticate(request)[0]
+
+    def test_login_issues_identity_claims(self):
+        from django.urls import reverse
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        response = self.client.post(
+            reverse('counsellor-login'), {'phone_number': '+919950000001', 'password': 'secret'},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        access = AccessToken(response.json()['access'])
+        self.assertEqual(
+            (access['profile_id'], access['user_role'], access['is_admin']), (self.profile.id, 'counsellor', False)
+        )
+
+        with self.assertNumQueries(0):
+            user = self.authenticate(response.json()['access'])
+            self.assertEqual(
+                (user.id, user.profile_id, user.user_role, user.is_admin), (self.user.id, self.profile.id, 'counsellor', False)
+            )
+            self.assertTrue(user.is_authenticated)
+
+    def test_tokens_without_claims_load_the_user(self):
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        with self.assertNumQueries(1):
+            user = self.authenticate(AccessToken.for_user(self.user))
+        with self.assertNumQueries(1):
+            self.assertEqual((user.user_role, user.profile_id), ('counsellor', self.profile.id))
+
+    def test_deactivated_and_deleted_users_are_refused(self):
+        from django.urls import reverse
+        from rest_framework.exceptions import AuthenticationFailed
+        from .tokens import tokens_for_user
+
+        refresh = tokens_for_user(self.user, self.profile)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save(update_fields=['is_active'])
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(refresh.access_token)
+        response = self.client.post(reverse('token-refresh'), {'refresh': str(refresh)}, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(refresh.access_token)
+
+    def test_outdated_claims_are_refused_until_refreshed(self):
+        from django.urls import reverse
+        from rest_framework_simplejwt.exceptions import InvalidToken
+        from .tokens import tokens_for_user
+
+        refresh = tokens_for_user(self.user, self.profile)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.user_role = 'normal'
+            self.profile.save(update_fields=['user_role'])
+        with self.assertRaises(InvalidToken):
+            self.authenticate(refresh.access_token)
+
+        response = self.client.post(reverse('token-refresh'), {'refresh': str(refresh)}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.authenticate(response.json()['access']).user_role, 'normal')
+
+    def test_missing_claims_entry_falls_back_to_the_database(self):
+        from django.core.cache import cache
+        from rest_framework.exceptions import AuthenticationFailed
+        from .tokens import tokens_for_user
+
+        access = tokens_for_user(self.user, self.profile).access_token
+        # Evicted or flushed, and the deactivation skipped the signals
+        cache.clear()
+        User.objects.filter(id=self.user.id).update(is_active=False)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(access)
+
+        User.objects.filter(id=self.user.id).update(is_active=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            user = self.authenticate(access)
+        self.assertEqual(user.user_role, 'counsellor')
+        # The entry is recorded again, so the next request skips the database
+        with self.assertNumQueries(0):
+            self.authenticate(access)
+
+    def test_cache_errors_fall_back_to_the_database(self):
+        from unittest.mock import patch
+        from rest_framework.exceptions import AuthenticationFailed
+        from .tokens import tokens_for_user
+
+        access = tokens_for_user(self.user, self.profile).access_token
+        User.objects.filter(id=self.user.id).update(is_active=False)
+        with patch('userdetails.identity.cache.get', side_effect=ConnectionError('cache down')):
+            with self.assertRaises(AuthenticationFailed):
+                self.authenticate(access)
+
+    def test_stale_claims_are_not_saved(self):
+        from .tokens import tokens_for_user
+
+        access = tokens_for_user(self.user, self.profile).access_token
+        User.objects.filter(id=self.user.id).update(is_admin=True)
+        user = self.authenticate(access)
+        self.assertFalse(user.is_admin)
+        user.first_name = 'Meera'
+        user.save()
+        self.assertEqual(
+            User.objects.filter(id=self.user.id).values_list('first_name', 'is_admin').get(), ('Meera', True)
+        )
+
+
+class LoginThrottleTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+
+    def test_repeated_logins_for_a_number_are_throttled(self):
+        from django.urls import reverse
+
+        def login(phone_number):
+            return self.client.post(
+                reverse('counsellor-login'), {'phone_number': phone_number, 'password': 'wrong'},
+                content_type='application/json'
+            )
+
+        for _ in range(5):
+            self.assertEqual(login('+919960000001').status_code, 401)
+        with self.assertNumQueries(0):
+            response = login('+919960000001')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(login('+919960000002').status_code, 401)
+
+    def test_previous_window_is_weighted_by_overlap(self):
+        from unittest.mock import patch
+        from rest_framework.test import APIRequestFactory
+        from rest_framework.request import Request
+        from utils.throttling import LoginIPThrottle
+
+        request = Request(APIRequestFactory().post('/'))
+        clock = [600.0]
+
+        def allowed():
+            with patch.object(LoginIPThrottle, 'timer', lambda self: clock[0]):
+                throttle = LoginIPThrottle()
+                return throttle.allow_request(request, None), throttle
+
+        self.assertEqual(sum(allowed()[0] for _ in range(40)), 30)
+        # Half way through the next minute, half of the previous 30 still count
+        clock[0] = 690.0
+        self.assertEqual(sum(allowed()[0] for _ in range(40)), 15)
+        result, throttle = allowed()
+        self.assertFalse(result)
+        # Two seconds on, 14 of the previous 30 still count: 14 + 15 + 1 fits
+        self.assertAlmostEqual(throttle.wait(), 2)
+
+    def test_forged_forwarded_for_does_not_reset_ip_limit(self):
+        from django.conf import settings
+        from rest_framework.test import APIRequestFactory
+        from rest_framework.request import Request
+        from utils.throttling import LoginIPThrottle
+
+        def allowed(forged):
+            # The proxy appends the address it saw to whatever the client sent
+            request = Request(APIRequestFactory().post(
+                '/', HTTP_X_FORWARDED_FOR=f'10.0.0.{forged}, 198.51.100.7', REMOTE_ADDR='10.1.1.1'
+            ))
+            return LoginIPThrottle().allow_request(request, None)
+
+        with self.settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}):
+            self.assertEqual(sum(allowed(n) for n in range(40)), 30)
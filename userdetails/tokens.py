@@ -0,0 +1,85 @@
+'''
+JWTs that carry the caller's identity.
+
+tokens_for_user() adds the profile id, role and admin flag to the usual
+simplejwt pair so ClaimsJWTAuthentication (userdetails.auth_backends) can
+authenticate without reading the users table. IdentityTokenRefreshSerializer
+re-reads them from the database whenever an access token is refreshed, and
+refuses inactive or deleted users.
+
+Issuing a token records its claims in the cache, and so does every change to
+the user or profile (see userdetails.identity). ClaimsJWTAuthentication only
+trusts a token whose claims match the recorded ones. A deactivated user is
+refused, a token with an outdated role or admin flag gets a 401 so the client
+refreshes it, and without a recorded entry the user is loaded from the
+database.
+'''
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .identity import remember_claims
+
+PROFILE_ID_CLAIM = 'profile_id'
+USER_ROLE_CLAIM = 'user_role'
+IS_ADMIN_CLAIM = 'is_admin'
+
+
+def set_identity_claims(token, user, profile=None):
+    token[PROFILE_ID_CLAIM] = profile.id if profile else None
+    token[USER_ROLE_CLAIM] = profile.user_role if profile else None
+    token[IS_ADMIN_CLAIM] = user.is_admin
+
+
+def tokens_for_user(user, profile=None):
+    '''
+    Args:
+        user: The authenticated User
+        profile: Their UserProfile, if they have one
+
+    Returns:
+        RefreshToken: Its access_token carries the same claims
+    '''
+    refresh = RefreshToken.for_user(user)
+    set_identity_claims(refresh, user, profile)
+    remember_claims(user, profile)
+    return refresh
+
+
+class IdentityTokenRefreshSerializer(TokenRefreshSerializer):
+    '''TokenRefreshSerializer that issues access tokens with identity claims read afresh.'''
+
+    def validate(self, attrs):
+        from .models import User, UserProfile
+
+        refresh = self.token_class(attrs['refresh'])
+        user = (
+            User.objects.filter(**{api_settings.USER_ID_FIELD: refresh.get(api_settings.USER_ID_CLAIM)})
+            .select_related('profile')
+            .first()
+        )
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(_('No active account found for the given token.'), 'no_active_account')
+        try:
+            profile = user.profile
+        except UserProfile.DoesNotExist:
+            profile = None
+        set_identity_claims(refresh, user, profile)
+        remember_claims(user, profile)
+
+        data = {'access': str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                try:
+                    refresh.blacklist()
+                except AttributeError:
+                    # The token_blacklist app is not installed
+                    pass
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            refresh.outstand()
+            data['refresh'] = str(refresh)
+        return data
@@ -3,40 +3,30 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import get_user_model, authenticate
 from django.utils import timezone
 from django.conf import settings
-import firebase_admin
-from firebase_admin import credentials, auth
 import logging
 from django.views.decorators.csrf import csrf_exempt
-import razorpay
 
 
-from .models import User, UserProfile, OTPAttempt
+from .firebase_tokens import ExpiredFirebaseToken, InvalidFirebaseToken, verify_firebase_token
+from .tokens import tokens_for_user
+from utils.throttling import LoginIPThrottle, LoginPhoneThrottle
+from .models import User, UserProfile
 from .serializers import (
     UserSerializer, UserProfileSerializer, FirebaseAuthSerializer,
     PhoneNumberSerializer, OTPVerificationSerializer,UserProfileUpdateSerializer 
 )
 
 
-if not firebase_admin._apps:
-    if hasattr(settings, 'FIREBASE_SERVICE_ACCOUNT_KEY') and settings.FIREBASE_SERVICE_ACCOUNT_KEY:
-        if isinstance(settings.FIREBASE_SERVICE_ACCOUNT_KEY, str):
-            cred = credentials.Certificate(settings.FIREBASE_SERVICE_ACCOUNT_KEY)
-        else:
-            cred = credentials.Certificate(settings.FIREBASE_SERVICE_ACCOUNT_KEY)
-    else:
-        cred = credentials.ApplicationDefault()
-    firebase_admin.initialize_app(cred)
-
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
 
 class FirebaseAuthView(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [LoginIPThrottle]
 
     def post(self, request):
         serializer = FirebaseAuthSerializer(data=request.data)
@@ -46,7 +36,7 @@ class FirebaseAuthView(APIView):
         id_token = serializer.validated_data['id_token']
         
         try:
-            decoded_token = auth.verify_id_token(id_token)
+            decoded_token = verify_firebase_token(id_token)
             firebase_uid = decoded_token['uid']
             phone_number = decoded_token.get('phone_number')
             
@@ -84,7 +74,7 @@ class FirebaseAuthView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            refresh = RefreshToken.for_user(user)
+            refresh = tokens_for_user(user, profile)
             
             return Response({
                 'refresh': str(refresh),
@@ -94,19 +84,14 @@ class FirebaseAuthView(APIView):
                 'is_new_user': created and profile_created
             }, status=status.HTTP_200_OK)
             
-        except auth.InvalidIdTokenError:
-            return Response(
-                {'error': 'Invalid Firebase ID token'},
-                status=status.HTTP_401_UNAUTHORIZED
-            )
-        except auth.ExpiredIdTokenError:
+        except ExpiredFirebaseToken:
             return Response(
                 {'error': 'Firebase ID token has expired'},
                 status=status.HTTP_401_UNAUTHORIZED
             )
-        except auth.RevokedIdTokenError:
+        except InvalidFirebaseToken:
             return Response(
-                {'error': 'Firebase ID token has been revoked'},
+                {'error': 'Invalid Firebase ID token'},
                 status=status.HTTP_401_UNAUTHORIZED
             )
         except Exception as e:
@@ -174,7 +159,7 @@ class UserProfileRegisterView(APIView):
     def post(self, request):
         
         
-        logger.debug(f"Request data: {request.data}")
+        logger.debug("Counsellor registration with fields %s", sorted(request.data))
         phone_number = request.data.get('phone_number')
         password = request.data.get('password')
         required_fields = [
@@ -222,7 +207,7 @@ class UserProfileRegisterView(APIView):
                 is_approved=False,
                 is_active=request.data.get('is_active', True)
             )
-            refresh = RefreshToken.for_user(user)
+            refresh = tokens_for_user(user, profile)
             logger.info(f"Counsellor profile created for {phone_number}")
             return Response({
                 'message': 'Counsellor registered successfully. Awaiting approval.',
@@ -240,6 +225,7 @@ class UserProfileRegisterView(APIView):
 
 class UserLoginView(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [LoginPhoneThrottle, LoginIPThrottle]
 
     def post(self, request):
 
@@ -247,9 +233,6 @@ class UserLoginView(APIView):
         phone_number = request.data.get('phone_number', '').strip()
         password = request.data.get('password', '').strip()
         
-        print(f"Request phone number: {repr(phone_number)}")
-        
-        
         if not phone_number:
             return Response({'error': 'Phone number is required'}, status=status.HTTP_400_BAD_REQUEST)
         if not password:
@@ -262,7 +245,7 @@ class UserLoginView(APIView):
         user = authenticate(request, username=phone_number, password=password)
         
         if user is None:
-            print(f"Authentication failed for phone number: {repr(phone_number)}")
+            logger.info("Counsellor login failed for %s", phone_number)
             return Response({'error': 'Invalid phone number or password'}, status=status.HTTP_401_UNAUTHORIZED)
         
         try:
@@ -273,7 +256,7 @@ class UserLoginView(APIView):
         except UserProfile.DoesNotExist:
             return Response({'error': 'User profile not found'}, status=status.HTTP_404_NOT_FOUND)
         
-        refresh = RefreshToken.for_user(user)
+        refresh = tokens_for_user(user, profile)
         return Response({
             'refresh': str(refresh),
             'access': str(refresh.access_token),
@@ -0,0 +1,87 @@
+'''
+Cache of the wallet home payload (balance and first history page).
+
+Each wallet has a version token in the cache, and every cached payload records
+the version that was current before its rows were read. A ledger write gives
+the wallet a new token once it commits. A reader that loaded the old balance
+just before the commit may still cache it afterwards, but under the old
+version, so get_cached_wallet() refuses it and the next request reads the
+database again.
+'''
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WALLET_CACHE_TIMEOUT = 60  # seconds
+# Outlives any payload; if it is evicted the next reader starts a new token
+VERSION_TIMEOUT = 24 * 60 * 60
+
+
+def wallet_cache_key(user_id):
+    return f"wallet:home:{user_id}"
+
+
+def wallet_version_key(user_id):
+    return f"wallet:version:{user_id}"
+
+
+def get_cached_wallet(user_id):
+    '''
+    Returns:
+        tuple: (payload, version). payload is None on a miss; pass version to
+        cache_wallet() with the payload built from the database. Both are
+        None if the cache is unreachable, which is logged.
+    '''
+    key, version_key = wallet_cache_key(user_id), wallet_version_key(user_id)
+    try:
+        cached = cache.get_many([key, version_key])
+        version = cached.get(version_key)
+        if version is None:
+            version = uuid.uuid4().hex
+            if not cache.add(version_key, version, timeout=VERSION_TIMEOUT):
+                version = cache.get(version_key)
+    except Exception as e:
+        logger.warning(f"Wallet cache read failed for user {user_id}: {str(e)}")
+        return None, None
+    entry = cached.get(key)
+    if entry is not None and version is not None and entry['version'] == version:
+        return entry['data'], version
+    return None, version
+
+
+def cache_wallet(user_id, data, version):
+    '''Cache ``data``, read after get_cached_wallet() returned ``version``.'''
+    if version is None:
+        return
+    try:
+        cache.set(
+            wallet_cache_key(user_id), {'version': version, 'data': data},
+            timeout=getattr(settings, 'WALLET_CACHE_TIMEOUT', DEFAULT_WALLET_CACHE_TIMEOUT)
+        )
+    except Exception as e:
+        logger.warning(f"Wallet cache write failed for user {user_id}: {str(e)}")
+
+
+def invalidate_wallets(user_ids):
+    '''
+    Give ``user_ids`` new versions and drop their payloads once the current
+    transaction commits. Doing it earlier would let a concurrent reader cache
+    the pre-commit balance under the new version.
+    '''
+    user_ids = list(user_ids)
+
+    def bump():
+        try:
+            cache.set_many(
+                {wallet_version_key(user_id): uuid.uuid4().hex for user_id in user_ids}, timeout=VERSION_TIMEOUT
+            )
+            cache.delete_many([wallet_cache_key(user_id) for user_id in user_ids])
+        except Exception as e:
+            logger.warning(f"Wallet cache invalidation failed for users {user_ids}: {str(e)}")
+
+    transaction.on_commit(bump)
@@ -0,0 +1,117 @@
+'''
+Non-blocking JSON logging.
+
+QueueLogHandler only puts records on an in-memory queue; a QueueListener
+thread formats them with JsonFormatter and writes them out, so a slow stream
+never holds up a request or the event loop. Records are formatted on the
+listener thread, which is what makes %-style logger calls
+(``logger.info("Booking %s ended", booking_id)``) cheap on the caller's side.
+When the queue is full, records are dropped and counted rather than waited on.
+
+SamplingFilter keeps a fraction of sub-WARNING records per logger prefix for
+chatty modules such as the WebSocket consumers.
+'''
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueListener
+
+DEFAULT_QUEUE_SIZE = 10000
+
+# LogRecord attributes that are not user-supplied ``extra`` fields
+_RECORD_FIELDS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    '''One JSON object per line: time, level, logger, message, any ``extra`` fields and the traceback.'''
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS and key not in entry:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack_info'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    '''
+    Pass WARNING and above always, and lower levels at the rate configured
+    for the longest matching logger prefix, e.g. {'dashboard.consumers': 0.1}.
+    Loggers without a configured prefix are not sampled.
+    '''
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = dict(rates or {})
+        self._resolved = {}
+
+    def rate_for(self, name):
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate = 1.0
+            prefixes = [p for p in self.rates if name == p or name.startswith(p + '.')]
+            if prefixes:
+                rate = self.rates[max(prefixes, key=len)]
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate_for(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class QueueLogHandler(logging.Handler):
+    '''
+    Hands records to a background listener that writes them to ``stream``
+    (stderr by default). The formatter configured on this handler is used by
+    the listener's stream handler.
+
+    A plain Handler rather than a logging.handlers.QueueHandler: from Python
+    3.12 dictConfig gives QueueHandler subclasses its own queue and listener,
+    which this handler does not take.
+    '''
+
+    def __init__(self, stream=None, queue_size=DEFAULT_QUEUE_SIZE):
+        super().__init__()
+        self.queue = queue.Queue(queue_size)
+        self.dropped = 0
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.target.setFormatter(JsonFormatter())
+        self.listener = QueueListener(self.queue, self.target, respect_handler_level=False)
+        self.listener.start()
+        atexit.register(self.close)
+
+    def setFormatter(self, fmt):
+        super().setFormatter(fmt)
+        self.target.setFormatter(fmt)
+
+    def emit(self, record):
+        # The queue never leaves the process, so the record travels as is
+        # and is formatted by the listener instead of the caller.
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        if self.listener is not None:
+            # Stops after writing out whatever is still queued
+            self.listener.stop()
+            self.listener = None
+            self.target.close()
+        super().close()
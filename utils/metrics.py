@@ -0,0 +1,293 @@
+'''
+Request-level performance metrics exported in the Prometheus text format.
+
+RequestMetricsMiddleware records, per named URL route, the wall time, the
+number of SQL queries and the time spent in them, and the time spent in
+external services wrapped with ``external_call`` (Razorpay, Firebase, FCM).
+``metrics_view`` serves the totals to scrapers on the allowed addresses.
+
+Metrics are kept per process; scrape each worker or sum them in Prometheus.
+
+Setting SLOW_REQUEST_MS turns on the slow-request log: requests slower than
+that are logged at WARNING with their slowest SQL statements.
+'''
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_LOG_STATEMENTS = 20  # slowest statements included in a slow-request entry
+BACKGROUND_ROUTE = 'background'  # label for external calls made outside a request, e.g. by workers
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestStats:
+    __slots__ = ('route', 'queries', 'db_time', 'external', 'statements')
+
+    def __init__(self, capture_sql=False):
+        self.route = None  # set once the URL resolves, to label external calls
+        self.queries = 0
+        self.db_time = 0.0
+        self.external = {}  # service -> seconds
+        self.statements = [] if capture_sql else None
+
+
+class Histogram:
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * len(DURATION_BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels.items()) + '}'
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = {}          # (route, method, status) -> count
+        self.durations = {}         # route -> Histogram
+        self.db_queries = {}        # route -> count
+        self.db_seconds = {}        # route -> seconds
+        self.external_calls = {}    # (service, route) -> count
+        self.external_errors = {}   # (service, route) -> count
+        self.external_seconds = {}  # (service, route) -> Histogram
+
+    def observe_request(self, route, method, status, duration, stats):
+        with self._lock:
+            key = (route, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.durations.setdefault(route, Histogram()).observe(duration)
+            self.db_queries[route] = self.db_queries.get(route, 0) + stats.queries
+            self.db_seconds[route] = self.db_seconds.get(route, 0.0) + stats.db_time
+
+    def observe_external(self, service, route, duration, failed):
+        with self._lock:
+            key = (service, route)
+            self.external_calls[key] = self.external_calls.get(key, 0) + 1
+            if failed:
+                self.external_errors[key] = self.external_errors.get(key, 0) + 1
+            self.external_seconds.setdefault(key, Histogram()).observe(duration)
+
+    def _histogram_lines(self, name, labels, histogram):
+        lines = []
+        for bound, count in zip(DURATION_BUCKETS, histogram.counts):
+            lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {count}")
+        lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {histogram.count}")
+        lines.append(f"{name}_sum{_labels(**labels)} {histogram.total}")
+        lines.append(f"{name}_count{_labels(**labels)} {histogram.count}")
+        return lines
+
+    def render(self):
+        with self._lock:
+            lines = [
+                '# HELP http_requests_total Requests handled, by route, method and status.',
+                '# TYPE http_requests_total counter',
+            ]
+            for (route, method, status), count in sorted(self.requests.items()):
+                lines.append(f"http_requests_total{_labels(route=route, method=method, status=status)} {count}")
+
+            lines += [
+                '# HELP http_request_duration_seconds Wall time of requests, by route.',
+                '# TYPE http_request_duration_seconds histogram',
+            ]
+            for route, histogram in sorted(self.durations.items()):
+                lines += self._histogram_lines('http_request_duration_seconds', {'route': route}, histogram)
+
+            lines += [
+                '# HELP http_request_db_queries_total SQL queries run by requests, by route.',
+                '# TYPE http_request_db_queries_total counter',
+            ]
+            for route, count in sorted(self.db_queries.items()):
+                lines.append(f"http_request_db_queries_total{_labels(route=route)} {count}")
+
+            lines += [
+                '# HELP http_request_db_seconds_total Time requests spent in SQL, by route.',
+                '# TYPE http_request_db_seconds_total counter',
+            ]
+            for route, seconds in sorted(self.db_seconds.items()):
+                lines.append(f"http_request_db_seconds_total{_labels(route=route)} {seconds}")
+
+            lines += [
+                '# HELP external_calls_total Calls to external services, by service and route.',
+                '# TYPE external_calls_total counter',
+            ]
+            for (service, route), count in sorted(self.external_calls.items()):
+                lines.append(f"external_calls_total{_labels(service=service, route=route)} {count}")
+
+            lines += [
+                '# HELP external_call_errors_total External calls that raised, by service and route.',
+                '# TYPE external_call_errors_total counter',
+            ]
+            for (service, route), count in sorted(self.external_errors.items()):
+                lines.append(f"external_call_errors_total{_labels(service=service, route=route)} {count}")
+
+            lines += [
+                '# HELP external_call_duration_seconds Time spent in external services, by service and route.',
+                '# TYPE external_call_duration_seconds histogram',
+            ]
+            for (service, route), histogram in sorted(self.external_seconds.items()):
+                lines += self._histogram_lines(
+                    'external_call_duration_seconds', {'service': service, 'route': route}, histogram
+                )
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+@contextmanager
+def external_call(service):
+    '''
+    Time a call to an external service and charge it to the current request:
+
+        with external_call('razorpay'):
+            client.order.create(...)
+    '''
+    stats = _current.get()
+    route = (stats.route if stats is not None else None) or BACKGROUND_ROUTE
+    failed = False
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        if stats is not None:
+            stats.external[service] = stats.external.get(service, 0.0) + duration
+        registry.observe_external(service, route, duration, failed)
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        stats.queries += 1
+        stats.db_time += duration
+        if stats.statements is not None:
+            stats.statements.append((duration, sql))
+
+
+def _instrument_connection(connection, **kwargs):
+    if _db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_wrapper)
+
+
+def install_db_instrumentation():
+    '''Count queries on every database connection, including ones already open in this thread.'''
+    connection_created.connect(_instrument_connection, dispatch_uid='utils.metrics')
+    for connection in connections.all(initialized_only=True):
+        _instrument_connection(connection)
+
+
+def slow_request_threshold():
+    threshold = getattr(settings, 'SLOW_REQUEST_MS', None)
+    return threshold / 1000 if threshold else None
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match and match.view_name else 'unmatched'
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        install_db_instrumentation()
+
+    def _start(self):
+        threshold = slow_request_threshold()
+        stats = RequestStats(capture_sql=threshold is not None)
+        return stats, threshold, _current.set(stats), time.perf_counter()
+
+    def _finish(self, request, response, stats, threshold, start):
+        duration = time.perf_counter() - start
+        route = route_name(request)
+        registry.observe_request(route, request.method, response.status_code, duration, stats)
+        if threshold is not None and duration >= threshold:
+            slowest = sorted(stats.statements, key=lambda item: item[0], reverse=True)[:SLOW_LOG_STATEMENTS]
+            logger.warning(
+                "Slow request %s %s (%s) took %.0fms: %d queries in %.0fms",
+                request.method, request.path, route, duration * 1000, stats.queries, stats.db_time * 1000,
+                extra={
+                    'route': route,
+                    'duration_ms': round(duration * 1000, 1),
+                    'db_queries': stats.queries,
+                    'db_ms': round(stats.db_time * 1000, 1),
+                    'external_ms': {service: round(s * 1000, 1) for service, s in stats.external.items()},
+                    'slowest_sql': [{'ms': round(d * 1000, 2), 'sql': sql} for d, sql in slowest],
+                },
+            )
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = _current.get()
+        if stats is not None:
+            stats.route = route_name(request)
+        return None
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats, threshold, token, start = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, stats, threshold, start)
+        return response
+
+    async def __acall__(self, request):
+        stats, threshold, token, start = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, stats, threshold, start)
+        return response
+
+
+def metrics_view(request):
+    '''Prometheus scrape endpoint, only answered for METRICS_ALLOWED_IPS.'''
+    if request.META.get('REMOTE_ADDR') not in getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1')):
+        raise Http404
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
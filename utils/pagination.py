@@ -0,0 +1,89 @@
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class CursorError(ValueError):
+    pass
+
+
+def encode_cursor(timestamp, pk):
+    '''
+    Encode the (timestamp, id) keyset position of the last row of a page
+    into an opaque, URL-safe cursor string.
+    '''
+    raw = json.dumps([timestamp.isoformat(), pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    '''
+    Decode a cursor produced by encode_cursor back into (timestamp, id).
+
+    Raises:
+        CursorError: if the cursor is malformed
+    '''
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii'))
+        timestamp, pk = json.loads(raw)
+        timestamp = parse_datetime(timestamp)
+        pk = int(pk)
+    except (ValueError, TypeError, UnicodeError):
+        raise CursorError('Invalid cursor')
+    if timestamp is None:
+        raise CursorError('Invalid cursor')
+    return timestamp, pk
+
+
+def parse_page_size(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    if value in (None, ''):
+        return default
+    try:
+        page_size = int(value)
+    except (TypeError, ValueError):
+        raise CursorError('page_size must be an integer')
+    if page_size <= 0:
+        raise CursorError('page_size must be positive')
+    return min(page_size, maximum)
+
+
+def keyset_page(queryset, time_field, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    '''
+    Return one page of ``queryset`` ordered newest first on (time_field, id).
+
+    Instead of OFFSET, the page starts strictly after the row the cursor points
+    at, so every page costs the same single index range scan no matter how
+    deep the client has paged.
+
+    Args:
+        queryset: Unordered (or arbitrarily ordered) queryset to page through
+        time_field: Name of the timestamp column used as the primary sort key
+        cursor: Cursor string returned as next_cursor by the previous page
+        page_size: Number of rows to return
+
+    Returns:
+        tuple: (list of rows, next_cursor or None when this is the last page)
+    '''
+    queryset = queryset.order_by(f'-{time_field}', '-id')
+    if cursor:
+        timestamp, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(**{f'{time_field}__lt': timestamp}) |
+            Q(**{time_field: timestamp, 'id__lt': pk})
+        )
+
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        if isinstance(last, dict):
+            next_cursor = encode_cursor(last[time_field], last['id'])
+        else:
+            next_cursor = encode_cursor(getattr(last, time_field), last.id)
+    return rows, next_cursor
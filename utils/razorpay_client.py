@@ -0,0 +1,99 @@
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils.metrics import external_call
+from utils.services import services
+
+DEFAULT_TIMEOUT = (3.05, 10)  # (connect, read) seconds
+DEFAULT_MAX_RETRIES = 2
+DEFAULT_POOL_SIZE = 10
+
+
+class TimeoutSession(requests.Session):
+    '''
+    requests.Session that applies a default timeout to every request. The
+    Razorpay SDK never passes one, so without this a hung gateway connection
+    would hold a worker thread indefinitely.
+    '''
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        with external_call('razorpay'):
+            return super().request(method, url, **kwargs)
+
+
+def build_session(timeout=DEFAULT_TIMEOUT, max_retries=DEFAULT_MAX_RETRIES, pool_size=DEFAULT_POOL_SIZE):
+    '''
+    Build a keep-alive session with a bounded connection pool and retries.
+
+    Connection failures are retried for every method because the request never
+    reached the gateway. Read timeouts and 5xx responses are only retried for
+    idempotent methods, so an order is never created twice.
+    '''
+    retry = Retry(
+        total=max_retries,
+        connect=max_retries,
+        read=max_retries,
+        status=max_retries,
+        backoff_factor=0.2,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = TimeoutSession(timeout=timeout)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def build_razorpay_client(session=None, base_url=None):
+    '''
+    Create a Razorpay client from settings.
+
+    Optional settings:
+        RAZORPAY_BASE_URL: Gateway API base URL (point it at a local fake server in tests)
+        RAZORPAY_TIMEOUT: (connect, read) timeout in seconds
+        RAZORPAY_MAX_RETRIES: Retry budget per request
+        RAZORPAY_POOL_SIZE: Keep-alive connections kept per worker
+    '''
+    import razorpay
+
+    if session is None:
+        session = build_session(
+            timeout=getattr(settings, 'RAZORPAY_TIMEOUT', DEFAULT_TIMEOUT),
+            max_retries=getattr(settings, 'RAZORPAY_MAX_RETRIES', DEFAULT_MAX_RETRIES),
+            pool_size=getattr(settings, 'RAZORPAY_POOL_SIZE', DEFAULT_POOL_SIZE),
+        )
+    options = {}
+    base_url = base_url or getattr(settings, 'RAZORPAY_BASE_URL', None)
+    if base_url:
+        options['base_url'] = base_url
+    return razorpay.Client(
+        session=session,
+        auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET),
+        **options
+    )
+
+
+def get_razorpay_client():
+    '''
+    Return the Razorpay client shared by every payment code path in this
+    worker process. It is created on first use, so forked workers each build
+    their own session instead of sharing sockets with the parent.
+    '''
+    return services.get('razorpay')
+
+
+def set_razorpay_client(client):
+    '''
+    Replace the shared client, e.g. with one pointed at a fake gateway.
+    Passing None makes the next get_razorpay_client() call rebuild it from settings.
+    '''
+    services.set('razorpay', client)
@@ -0,0 +1,92 @@
+'''
+Process-wide SDK clients, created on first use.
+
+Importing firebase_admin and razorpay and loading the Firebase service account
+costs several hundred milliseconds. Done at import time, every manage.py
+command, test run and worker paid it, whether or not it went on to send a
+push or take a payment. Each service here is built by its factory the first
+time get() asks for it, once per process, so forked workers also build their
+own rather than inherit the parent's connections.
+'''
+import logging
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceRegistry:
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        # Re-entrant: a factory may get() the services it depends on
+        self._lock = threading.RLock()
+
+    def register(self, name, factory):
+        self._factories[name] = factory
+
+    def names(self):
+        return list(self._factories)
+
+    def get(self, name):
+        try:
+            return self._instances[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name not in self._instances:
+                self._instances[name] = self._factories[name]()
+            return self._instances[name]
+
+    def set(self, name, instance):
+        '''
+        Replace a service, e.g. with one pointed at a fake server. Passing None
+        makes the next get() build it again from its factory.
+        '''
+        with self._lock:
+            if instance is None:
+                self._instances.pop(name, None)
+            else:
+                self._instances[name] = instance
+
+    def initialized(self, name):
+        return name in self._instances
+
+
+def init_firebase_app():
+    '''
+    Initialise the default firebase_admin app from FIREBASE_SERVICE_ACCOUNT_KEY,
+    falling back to application default credentials.
+    '''
+    import firebase_admin
+    from firebase_admin import credentials
+
+    try:
+        return firebase_admin.get_app()
+    except ValueError:
+        pass
+    key = getattr(settings, 'FIREBASE_SERVICE_ACCOUNT_KEY', None)
+    try:
+        cred = credentials.Certificate(key) if key else credentials.ApplicationDefault()
+    except FileNotFoundError:
+        logger.warning(f"Firebase credentials file not found at {key}, using application default credentials")
+        cred = credentials.ApplicationDefault()
+    return firebase_admin.initialize_app(cred)
+
+
+def init_firebase_messaging():
+    services.get('firebase')
+    from firebase_admin import messaging
+    return messaging
+
+
+def init_razorpay_client():
+    from utils.razorpay_client import build_razorpay_client
+    return build_razorpay_client()
+
+
+services = ServiceRegistry()
+services.register('firebase', init_firebase_app)
+services.register('firebase_messaging', init_firebase_messaging)
+services.register('razorpay', init_razorpay_client)
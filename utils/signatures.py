@@ -0,0 +1,59 @@
+'''
+Razorpay HMAC-SHA256 signature verification.
+
+Pure standard library on purpose: verifying a payment or webhook signature is
+a local computation and must not need the Razorpay SDK, Django or a network
+round trip. Comparisons use hmac.compare_digest so they run in constant time.
+'''
+import hashlib
+import hmac
+
+
+def _to_bytes(value):
+    return value if isinstance(value, bytes) else str(value).encode('utf-8')
+
+
+class SignatureVerifier:
+    '''
+    Verifier bound to one secret. The keyed HMAC state is built once in
+    __init__ and copied per message instead of re-deriving the key pads on
+    every call, which matters when verifying webhook bursts in a batch.
+    '''
+
+    def __init__(self, secret):
+        self._keyed = hmac.new(_to_bytes(secret), digestmod=hashlib.sha256)
+
+    def sign(self, message):
+        mac = self._keyed.copy()
+        mac.update(_to_bytes(message))
+        return mac.hexdigest()
+
+    def verify(self, message, signature):
+        if not signature:
+            return False
+        return hmac.compare_digest(self.sign(message).encode('ascii'), _to_bytes(signature))
+
+    def verify_payment(self, order_id, payment_id, signature):
+        '''Checkout signature: HMAC of "<order_id>|<payment_id>" with the key secret.'''
+        return self.verify(f"{order_id}|{payment_id}", signature)
+
+    def verify_webhook(self, body, signature):
+        '''Webhook signature: HMAC of the raw request body with the webhook secret.'''
+        return self.verify(body, signature)
+
+    def verify_webhook_batch(self, payloads):
+        '''
+        Verify many (body, signature) pairs with the same secret.
+
+        Returns:
+            list: One bool per payload, in input order
+        '''
+        return [self.verify(body, signature) for body, signature in payloads]
+
+
+def verify_payment_signature(order_id, payment_id, signature, secret):
+    return SignatureVerifier(secret).verify_payment(order_id, payment_id, signature)
+
+
+def verify_webhook_signature(body, signature, secret):
+    return SignatureVerifier(secret).verify_webhook(body, signature)
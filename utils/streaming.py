@@ -0,0 +1,43 @@
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+
+class _EchoBuffer:
+    '''File-like object whose write() hands the line back instead of storing it.'''
+
+    def write(self, value):
+        return value
+
+
+def ndjson_response(rows, filename):
+    '''
+    Stream an iterable of dicts as newline-delimited JSON. Rows are encoded
+    one at a time, so memory use does not grow with the number of rows.
+    '''
+    encoder = DjangoJSONEncoder()
+
+    def generate():
+        for row in rows:
+            yield encoder.encode(row) + '\n'
+
+    response = StreamingHttpResponse(generate(), content_type='application/x-ndjson')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.ndjson"'
+    return response
+
+
+def csv_response(rows, fieldnames, filename):
+    '''
+    Stream an iterable of flat dicts as CSV with a header row.
+    '''
+    writer = csv.DictWriter(_EchoBuffer(), fieldnames=fieldnames, extrasaction='ignore')
+
+    def generate():
+        yield writer.writerow(dict(zip(fieldnames, fieldnames)))
+        for row in rows:
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(generate(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
@@ -0,0 +1,129 @@
+'''
+Sliding-window rate limits for DRF views.
+
+DRF's SimpleRateThrottle keeps a list of request timestamps per client in the
+cache and rewrites it on every request. These throttles keep two counters per
+client instead, one for the current fixed window and one for the previous
+window. The previous count is weighted by how much of it still overlaps the
+sliding window. Counters live in the default cache (Redis, on the channel
+layer host), so all workers share the limits. Each request is counted with an
+atomic INCR before it is checked, so concurrent requests cannot all slip in
+under the limit; a rejected request is taken off the count again. If the
+cache is unreachable the request is let through and a warning is logged.
+
+Client IPs come from DRF's get_ident(), so REST_FRAMEWORK['NUM_PROXIES'] must
+match the deploy or X-Forwarded-For can be rotated to dodge per-IP limits.
+
+Rates come from REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] by scope, in DRF's
+'<count>/<period>' format.
+'''
+import logging
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+logger = logging.getLogger(__name__)
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+    cache_format = 'throttle:%(scope)s:%(ident)s'
+
+    def get_rate(self):
+        # Read at request time rather than import time, so settings overrides apply
+        if not getattr(self, 'scope', None):
+            raise ImproperlyConfigured(f"Set .scope or .rate on the {self.__class__.__name__} throttle")
+        try:
+            return api_settings.DEFAULT_THROTTLE_RATES[self.scope]
+        except KeyError:
+            raise ImproperlyConfigured(f"No throttle rate set for the '{self.scope}' scope")
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window = int(self.now // self.duration)
+        current_key, previous_key = f"{self.key}:{window}", f"{self.key}:{window - 1}"
+        try:
+            # Count this request first and decide on the value INCR returns, so
+            # concurrent requests each see the others. Each window's counter
+            # outlives the next window, where it is the previous count.
+            self.cache.add(current_key, 0, timeout=self.duration * 2)
+            count = self.cache.incr(current_key)
+            self.previous = self.cache.get(previous_key, 0)
+        except Exception as e:
+            logger.warning(f"Throttle cache update failed for {self.scope}: {str(e)}")
+            return True
+        self.current = count - 1
+        self.elapsed = self.now - window * self.duration
+
+        overlap = 1 - self.elapsed / self.duration
+        if self.previous * overlap + count > self.num_requests:
+            try:
+                # Rejected requests do not use up the allowance
+                self.cache.decr(current_key)
+            except Exception as e:
+                logger.warning(f"Throttle cache update failed for {self.scope}: {str(e)}")
+            return self.throttle_failure()
+        return True
+
+    def wait(self):
+        '''Seconds until the weighted count drops enough to admit one more request.'''
+        allowance = self.num_requests - 1
+        if self.current <= allowance:
+            # The previous window's share has to shrink
+            return max(self.duration * (1 - (allowance - self.current) / self.previous) - self.elapsed, 0)
+        # This window is full on its own: wait for it to become the previous one and shrink
+        return self.duration - self.elapsed + self.duration * (1 - allowance / self.current)
+
+
+class IPThrottle(SlidingWindowThrottle):
+    '''Limits requests per client IP address.'''
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class UserThrottle(SlidingWindowThrottle):
+    '''Limits requests per authenticated user, or per IP for anonymous ones.'''
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = f"user:{request.user.pk}"
+        else:
+            ident = f"ip:{self.get_ident(request)}"
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class PhoneNumberThrottle(SlidingWindowThrottle):
+    '''
+    Limits requests per phone number in the request body, whichever IP they
+    come from. Requests without one are left to the other throttles.
+    '''
+
+    def get_cache_key(self, request, view):
+        data = request.data if hasattr(request.data, 'get') else {}
+        phone_number = str(data.get('phone_number') or '').replace(' ', '').replace('-', '')
+        if not phone_number:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': phone_number}
+
+
+class LoginPhoneThrottle(PhoneNumberThrottle):
+    scope = 'login'
+
+
+class LoginIPThrottle(IPThrottle):
+    scope = 'login_ip'
+
+
+class OrderThrottle(UserThrottle):
+    scope = 'orders'
+
+
+class CallTokenThrottle(UserThrottle):
+    scope = 'call_tokens'
@@ -0,0 +1,148 @@
+import json
+import threading
+import time
+
+from django.conf import settings
+
+from utils import zego_token
+
+DEFAULT_EFFECTIVE_TIME = 3600  # seconds
+DEFAULT_REFRESH_MARGIN = 300  # seconds; cached tokens closer than this to expiry are re-minted
+DEFAULT_MAX_ENTRIES = 10000
+
+# Login and publish, what every call participant gets today
+FULL_PRIVILEGE = (1, 1)
+
+_service = None
+_lock = threading.Lock()
+
+
+class ZegoTokenError(Exception):
+    def __init__(self, token_info):
+        super().__init__(token_info.error_message)
+        self.token_info = token_info
+
+
+class ZegoTokenService:
+    '''
+    Mints Zego token04 kit tokens and reuses still-valid ones.
+
+    Tokens are cached in process per (user_id, room_id, privilege) and handed
+    out again until ``refresh_margin`` seconds before they expire, so the
+    initiate and generate endpoints do not mint a new token for a participant
+    who already holds a good one. The refresh endpoints pass refresh=True to
+    always get a new token, e.g. after Zego rejected the current one.
+    '''
+
+    def __init__(self, app_id, secret, effective_time=DEFAULT_EFFECTIVE_TIME,
+                 refresh_margin=DEFAULT_REFRESH_MARGIN, max_entries=DEFAULT_MAX_ENTRIES):
+        self.app_id = int(app_id)
+        self.secret = secret
+        self.effective_time = effective_time
+        self.refresh_margin = refresh_margin
+        self.max_entries = max_entries
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def payload(room_id, privilege=FULL_PRIVILEGE):
+        login, publish = privilege
+        return json.dumps({
+            'room_id': room_id,
+            'privilege': {'1': login, '2': publish},
+            'stream_id_list': []
+        })
+
+    def _mint(self, user_id, payload):
+        token_info = zego_token.generate_token04(
+            app_id=self.app_id,
+            user_id=user_id,
+            secret=self.secret,
+            effective_time_in_seconds=self.effective_time,
+            payload=payload
+        )
+        if token_info.error_code != zego_token.ERROR_CODE_SUCCESS:
+            raise ZegoTokenError(token_info)
+        return token_info
+
+    def _cached(self, key, now):
+        token_info = self._tokens.get(key)
+        if token_info is not None and token_info.expire_time - now > self.refresh_margin:
+            return token_info
+        return None
+
+    def _store(self, key, token_info, now):
+        with self._lock:
+            if len(self._tokens) >= self.max_entries:
+                for stale in [k for k, t in self._tokens.items() if t.expire_time - now <= self.refresh_margin]:
+                    del self._tokens[stale]
+                while len(self._tokens) >= self.max_entries:
+                    # dicts keep insertion order: drop the oldest token
+                    del self._tokens[next(iter(self._tokens))]
+            self._tokens[key] = token_info
+
+    def get_token(self, user_id, room_id, privilege=FULL_PRIVILEGE, refresh=False):
+        '''
+        Returns:
+            TokenInfo: a token valid for at least ``refresh_margin`` more seconds,
+            newly minted and cached in place of the current one if ``refresh``
+
+        Raises:
+            ZegoTokenError: if the token cannot be generated
+        '''
+        return self.get_tokens([(user_id, room_id, privilege)], refresh=refresh)[0]
+
+    def get_tokens(self, requests, refresh=False):
+        '''
+        Batch form of get_token for e.g. both participants of a call.
+
+        Args:
+            requests: iterable of (user_id, room_id) or (user_id, room_id, privilege)
+            refresh: mint new tokens even where a cached one is still valid
+
+        Returns:
+            list: TokenInfo per request, in input order
+        '''
+        now = int(time.time())
+        payloads = {}
+        results = []
+        for request in requests:
+            user_id, room_id = str(request[0]), str(request[1])
+            privilege = tuple(request[2]) if len(request) > 2 else FULL_PRIVILEGE
+            key = (user_id, room_id, privilege)
+            token_info = None if refresh else self._cached(key, now)
+            if token_info is None:
+                if (room_id, privilege) not in payloads:
+                    payloads[(room_id, privilege)] = self.payload(room_id, privilege)
+                token_info = self._mint(user_id, payloads[(room_id, privilege)])
+                self._store(key, token_info, now)
+            results.append(token_info)
+        return results
+
+    def expires_in(self, token_info):
+        return max(0, token_info.expire_time - int(time.time()))
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+
+
+def get_token_service():
+    '''
+    Return the process-wide token service built from ZEGO_APP_ID and
+    ZEGO_SERVER_SECRET, or None if Zego is not configured.
+    '''
+    global _service
+    app_id = getattr(settings, 'ZEGO_APP_ID', None)
+    secret = getattr(settings, 'ZEGO_SERVER_SECRET', None)
+    if not app_id or not secret:
+        return None
+    if _service is None or _service.app_id != int(app_id) or _service.secret != secret:
+        with _lock:
+            if _service is None or _service.app_id != int(app_id) or _service.secret != secret:
+                _service = ZegoTokenService(
+                    app_id, secret,
+                    effective_time=getattr(settings, 'ZEGO_TOKEN_EFFECTIVE_TIME', DEFAULT_EFFECTIVE_TIME),
+                    refresh_margin=getattr(settings, 'ZEGO_TOKEN_REFRESH_MARGIN', DEFAULT_REFRESH_MARGIN),
+                )
+    return _service
@@ -1,5 +1,5 @@
 import json
-import random
+import secrets
 import time
 import struct
 import binascii
@@ -12,35 +12,27 @@ ERROR_CODE_SECRET_INVALID = 5
 ERROR_CODE_EFFECTIVE_TIME_IN_SECONDS_INVALID = 6
 
 class TokenInfo:
-    def __init__(self, token, error_code, error_message):
+    def __init__(self, token, error_code, error_message, expire_time=0):
         self.token = token
         self.error_code = error_code
         self.error_message = error_message
+        self.expire_time = expire_time  # Unix time the token stops working
 
 def __make_nonce():
-    return random.getrandbits(31)
+    return secrets.randbits(31)
 
 def __make_random_iv():
-    str = '0123456789abcdefghijklmnopqrstuvwxyz'
-    iv = ""
-    for i in range(16):
-        index = int(random.random() * 16)
-        iv += str[index]
-    return iv
-
-def __aes_pkcs5_padding(cipher_text, block_size):
-    padding_size = len(cipher_text) if (len(cipher_text) == len(cipher_text.encode('utf-8'))) else len(cipher_text.encode('utf-8'))
-    padding = block_size - padding_size % block_size
-    if padding < 0:
-        return None
-    padding_text = chr(padding) * padding
-    return cipher_text + padding_text
+    # 16 ASCII characters from a CSPRNG; the IV travels inside the token
+    return secrets.token_hex(8)
+
+def __aes_pkcs5_padding(plain_bytes, block_size):
+    padding = block_size - len(plain_bytes) % block_size
+    return plain_bytes + bytes([padding]) * padding
 
 def __aes_encrypt(plain_text, key, iv):
+    # CBC state depends on the IV, so each token needs its own cipher object
     cipher = AES.new(key.encode('utf-8'), AES.MODE_CBC, iv.encode('utf-8'))
-    content_padding = __aes_pkcs5_padding(plain_text, 16)
-    encrypt_bytes = cipher.encrypt(content_padding.encode('utf-8'))
-    return encrypt_bytes
+    return cipher.encrypt(__aes_pkcs5_padding(plain_text.encode('utf-8'), 16))
 
 def generate_token04(app_id, user_id, secret, effective_time_in_seconds, payload):
     '''
@@ -99,4 +91,4 @@ def generate_token04(app_id, user_id, secret, effective_time_in_seconds, payload
     result[28:] = encrypt_buf[:]
 
     token = "04" + binascii.b2a_base64(result, newline=False).decode()
-    return TokenInfo(token, ERROR_CODE_SUCCESS, "success")
\ No newline at end of file
+    return TokenInfo(token, ERROR_CODE_SUCCESS, "success", expire_time)